@@ -6,6 +6,7 @@ import json
 from acme.helper import generate_random_string, validate_email, date_to_datestr, load_config
 from acme.db_handler import DBstore
 from acme.message import Message
+from acme.signature import JWK_CACHE
 
 class Account(object):
     """ ACME server class """
@@ -130,6 +131,7 @@ class Account(object):
             result = None
 
         if result:
+            JWK_CACHE.invalidate(aname)
             code = 200
             message = None
             detail = None
@@ -251,6 +253,7 @@ class Account(object):
                             self.logger.critical('acme2certifier database error in Account._key_change(): {0}'.format(err_))
                             result = None
                         if result:
+                            JWK_CACHE.invalidate(aname)
                             code = 200
                             message = None
                             detail = None
@@ -4,7 +4,7 @@
 from __future__ import print_function
 import json
 import importlib
-from acme.helper import b64_url_recode, generate_random_string, ca_handler_get, cert_san_get, cert_extensions_get, uts_now, uts_to_date_utc, date_to_uts_utc, load_config, csr_san_get, csr_extensions_get, cert_dates_get
+from acme.helper import b64_url_recode, generate_random_string, ca_handler_get, cert_san_get, cert_extensions_get, uts_now, uts_to_date_utc, date_to_uts_utc, load_config, csr_san_get, csr_extensions_get, csr_fingerprint_get, cert_info_get
 from acme.db_handler import DBstore
 from acme.message import Message
 
@@ -255,16 +255,10 @@ class Certificate(object):
                     to_be_cleared = True
 
             elif 'expire_uts' in cert:
-                # in case cert_expiry in table is 0 try to get it from cert
                 if cert['expire_uts'] == 0:
                     if 'cert_raw' in cert and cert['cert_raw']:
-                        # get expiration from certificate
-                        (issue_uts, expire_uts) = cert_dates_get(self.logger, cert['cert_raw'])
-                        if 0 < expire_uts < timestamp:
-                            # returned date is other than 0 and lower than given timestamp
-                            cert['issue_uts'] = issue_uts
-                            cert['expire_uts'] = expire_uts
-                            to_be_cleared = True
+                        # dates get extracted when storing the certificate, 0 means it could not be parsed
+                        to_be_cleared = False
                     else:
                         if 'csr' in cert and cert['csr']:
                             # cover cases for enrollments in flight
@@ -355,10 +349,12 @@ class Certificate(object):
         self.logger.debug('Certificate._revocation_request_validate() ended with: {0}, {1}'.format(code, error))
         return (code, error)
 
-    def _store_cert(self, certificate_name, certificate, raw, issue_uts=0, expire_uts=0):
-        """ get key for a specific account id """
+    def _store_cert(self, certificate_name, certificate, raw):
+        """ store certificate together with the details reports and cleanup need """
         self.logger.debug('Certificate._store_cert({0})'.format(certificate_name))
-        data_dic = {'cert' : certificate, 'name': certificate_name, 'cert_raw' : raw, 'issue_uts': issue_uts, 'expire_uts': expire_uts}
+        data_dic = {'cert' : certificate, 'name': certificate_name, 'cert_raw' : raw}
+        # serial, sans, issuer, validity and key fingerprint
+        data_dic.update(cert_info_get(self.logger, raw))
         try:
             cert_id = self.dbstore.certificate_add(data_dic)
         except BaseException as err_:
@@ -424,25 +420,17 @@ class Certificate(object):
 
         if not purge:
             # we are just modifiying data
-            for cert in report_list:
-                data_dic = {
-                    'name': cert['name'],
-                    'expire_uts': cert['expire_uts'],
-                    'issue_uts': cert['issue_uts'],
-                    'cert': 'removed by certificates.cleanup() on {0} '.format(uts_to_date_utc(timestamp)),
-                    'cert_raw': cert['cert_raw']
-                }
-                try:
-                    self.dbstore.certificate_add(data_dic)
-                except BaseException as err_:
-                    self.logger.critical('acme2certifier database error in Certificate.cleanup() add: {0}'.format(err_))
+            message = 'removed by certificates.cleanup() on {0} '.format(uts_to_date_utc(timestamp))
+            try:
+                self.dbstore.certificates_update([cert['id'] for cert in report_list], {'cert': message})
+            except BaseException as err_:
+                self.logger.critical('acme2certifier database error in Certificate.cleanup() add: {0}'.format(err_))
         else:
             # delete entries from certificates table
-            for cert in report_list:
-                try:
-                    self.dbstore.certificate_delete('id', cert['id'])
-                except BaseException as err_:
-                    self.logger.critical('acme2certifier database error in Certificate.cleanup() delete: {0}'.format(err_))
+            try:
+                self.dbstore.certificates_delete([cert['id'] for cert in report_list])
+            except BaseException as err_:
+                self.logger.critical('acme2certifier database error in Certificate.cleanup() delete: {0}'.format(err_))
         self.logger.debug('Certificate.cleanup() ended with: {0} certs'.format(len(report_list)))
         return (field_list, report_list)
 
@@ -456,9 +444,7 @@ class Certificate(object):
             for cert in cert_list:
                 if cert['issue_uts'] == 0 and cert['expire_uts'] == 0:
                     if cert['cert_raw']:
-                        (issue_uts, expire_uts) = cert_dates_get(self.logger, cert['cert_raw'])
-                        if issue_uts or expire_uts:
-                            self._store_cert(cert['name'], cert['cert'], cert['cert_raw'], issue_uts, expire_uts)
+                        self._store_cert(cert['name'], cert['cert'], cert['cert_raw'])
         # return None
 
     def enroll_and_store(self, certificate_name, csr):
@@ -475,9 +461,8 @@ class Certificate(object):
             with self.cahandler(self.debug, self.logger) as ca_handler:
                 (error, certificate, certificate_raw, poll_identifier) = ca_handler.enroll(csr)
                 if certificate:
-                    (issue_uts, expire_uts) = cert_dates_get(self.logger, certificate_raw)
                     try:
-                        result = self._store_cert(certificate_name, certificate, certificate_raw, issue_uts, expire_uts)
+                        result = self._store_cert(certificate_name, certificate, certificate_raw)
                     except BaseException as err_:
                         result = None
                         self.logger.critical('acme2certifier database error in Certificate.enroll_and_store(): {0}'.format(err_))
@@ -618,10 +603,8 @@ class Certificate(object):
         with self.cahandler(self.debug, self.logger) as ca_handler:
             (error, certificate, certificate_raw, poll_identifier, rejected) = ca_handler.poll(certificate_name, poll_identifier, csr)
             if certificate:
-                # get issuing and expiration date
-                (issue_uts, expire_uts) = cert_dates_get(self.logger, certificate_raw)
                 # update certificate record in database
-                _result = self._store_cert(certificate_name, certificate, certificate_raw, issue_uts, expire_uts)
+                _result = self._store_cert(certificate_name, certificate, certificate_raw)
                 # update order status to 5 (valid)
                 try:
                     self.dbstore.order_update({'name': order_name, 'status': 'valid'})
@@ -644,6 +627,11 @@ class Certificate(object):
         self.logger.debug('Certificate.store_csr({0})'.format(order_name))
         certificate_name = generate_random_string(self.logger, 12)
         data_dic = {'order' : order_name, 'csr' : csr, 'name': certificate_name}
+        try:
+            # lets Trigger find the certificate by public key
+            data_dic['key_fingerprint'] = csr_fingerprint_get(self.logger, csr)
+        except BaseException as err_:
+            self.logger.error('Certificate.store_csr(): error while loading csr: {0}'.format(err_))
         try:
             self.dbstore.certificate_add(data_dic)
         except BaseException as err_:
@@ -6,12 +6,14 @@ import json
 from acme.helper import generate_random_string, parse_url, load_config, jwk_thumbprint_get, url_get, sha256_hash, b64_url_encode, txt_get, fqdn_resolve, uts_now, uts_to_date_utc
 from acme.db_handler import DBstore
 from acme.message import Message
+from acme.validation import validation_pool_get
+from dnsclient.resolver import get_resolver_stats
 
 class Challenge(object):
     """ Challenge handler """
 
     def __init__(self, debug=None, srv_name=None, logger=None, expiry=3600):
-        # self.debug = debug
+        self.debug = debug
         self.server_name = srv_name
         self.logger = logger
         self.dbstore = DBstore(debug, self.logger)
@@ -21,6 +23,10 @@ class Challenge(object):
         self.challenge_validation_disable = False
         self.tnauthlist_support = False
         self.dns_server_list = None
+        # background validation (disabled if validation_workers is 0)
+        self.validation_workers = 0
+        self.validation_queue_size = 100
+        self.validation_timeout = 10
 
     def __enter__(self):
         """ Makes ACMEHandler a Context Manager """
@@ -99,7 +105,11 @@ class Challenge(object):
         """ validate an existing challenge set """
         self.logger.debug('Challenge._existing_challenge_validate()')
         for challenge in challenge_list:
-            _challenge_check = self._validate(challenge, {})
+            if self.validation_workers:
+                # the client did not respond to these challenges, they stay pending (RFC8555 7.1.6)
+                self._validate_async(challenge, {}, processing=False)
+            else:
+                _challenge_check = self._validate(challenge, {})
 
     def _info(self, challenge_name):
         """ get challenge details """
@@ -135,6 +145,12 @@ class Challenge(object):
                     self.dns_server_list = json.loads(config_dic['Challenge']['dns_server_list'])
                 except BaseException as err_:
                     self.logger.warning('Challenge._config_load() failed with error: {0}'.format(err_))
+            try:
+                self.validation_workers = config_dic.getint('Challenge', 'validation_workers', fallback=0)
+                self.validation_queue_size = config_dic.getint('Challenge', 'validation_queue_size', fallback=100)
+                self.validation_timeout = config_dic.getint('Challenge', 'validation_timeout', fallback=10)
+            except ValueError as err_:
+                self.logger.warning('Challenge._config_load() validation options failed with error: {0}'.format(err_))
 
         if 'Order' in config_dic:
             self.tnauthlist_support = config_dic.getboolean('Order', 'tnauthlist_support', fallback=False)
@@ -179,6 +195,17 @@ class Challenge(object):
                 challenge_dic['tkauth-type'] = 'atc'
         return challenge_dic
 
+    def _status_change(self, challenge_name, old_status, new_status):
+        """ change challenge status if it is still in old_status """
+        self.logger.debug('Challenge._status_change({0}: {1} -> {2})'.format(challenge_name, old_status, new_status))
+        try:
+            result = self.dbstore.challenge_status_change(challenge_name, old_status, new_status)
+        except BaseException as err_:
+            self.logger.critical('acme2certifier database error in Challenge._status_change(): {0}'.format(err_))
+            result = 0
+        self.logger.debug('Challenge._status_change() ended with: {0}'.format(result))
+        return result
+
     def _update(self, data_dic):
         """ update challenge """
         self.logger.debug('Challenge._update({0})'.format(data_dic))
@@ -236,6 +263,44 @@ class Challenge(object):
         self.logger.debug('Challenge._validate() ended with:{0}'.format(challenge_check))
         return challenge_check
 
+    def _validate_async(self, challenge_name, payload, processing=True):
+        """ queue challenge validation and set challenge to processing if a new job got queued """
+        self.logger.debug('Challenge._validate_async({0}: {1})'.format(challenge_name, payload))
+        if self.challenge_validation_disable:
+            # nothing to wait for
+            return self._validate(challenge_name, payload)
+
+        if payload and 'keyAuthorization' in payload:
+            self._update({'name' : challenge_name, 'keyauthorization' : payload['keyAuthorization']})
+
+        pool = validation_pool_get(self.validation_workers, self.validation_queue_size, self.logger)
+        # a job which is already queued (or just finishing) owns the status, never overwrite it
+        queued = (lambda: self._status_change(challenge_name, 'pending', 'processing')) if processing else None
+        if pool.submit(challenge_name, lambda: self._validation_job(challenge_name, payload), queued):
+            result = True
+        else:
+            # queue is full - validate in the request thread
+            self.logger.warning('Challenge._validate_async(): validation queue full, validating inline')
+            result = self._validation_job(challenge_name, payload, close_connection=False)
+
+        self.logger.debug('Challenge._validate_async() ended with:{0} pool: {1}'.format(result, pool.stats()))
+        return result
+
+    def _validation_job(self, challenge_name, payload, close_connection=True):
+        """ validate challenge in a worker and reset it to pending if the check was inconclusive """
+        self.logger.debug('Challenge._validation_job({0})'.format(challenge_name))
+        try:
+            challenge_check = self._validate(challenge_name, payload)
+            if not challenge_check:
+                # neither valid nor invalid - allow the client to retry
+                self._status_change(challenge_name, 'processing', 'pending')
+        finally:
+            if close_connection:
+                # worker threads must not keep database connections open
+                self.dbstore.connection_close()
+        self.logger.debug('Challenge._validation_job() ended with:{0}'.format(challenge_check))
+        return challenge_check
+
     def _validate_dns_challenge(self, challenge_name, fqdn, token, jwk_thumbprint):
         """ validate dns challenge """
         self.logger.debug('Challenge._validate_dns_challenge({0}:{1}:{2})'.format(challenge_name, fqdn, token))
@@ -245,27 +310,23 @@ class Challenge(object):
 
         # rewrite fqdn
         fqdn = '_acme-challenge.{0}'.format(fqdn)
+        invalid = False
 
-        # resolve name
-        (_response, invalid) = fqdn_resolve(fqdn)
+        # compute sha256 hash
+        _hash = b64_url_encode(self.logger, sha256_hash(self.logger, '{0}.{1}'.format(token, jwk_thumbprint)))
+        # query dns (answers are cached only for a few seconds for _acme-challenge names)
+        txt = txt_get(self.logger, fqdn, self.dns_server_list, self.validation_timeout)
 
-        if not invalid:
-            # compute sha256 hash
-            _hash = b64_url_encode(self.logger, sha256_hash(self.logger, '{0}.{1}'.format(token, jwk_thumbprint)))
-            # query dns
-            txt = txt_get(self.logger, fqdn, self.dns_server_list)
-
-            # compare computed hash with result from DNS query
-            self.logger.debug('response_got: {0} response_expected: {1}'.format(txt, _hash))
-            if _hash == txt:
-                self.logger.debug('validation successful')
-                result = True
-            else:
-                self.logger.debug('validation not successful')
-                result = False
+        # compare computed hash with result from DNS query
+        self.logger.debug('response_got: {0} response_expected: {1}'.format(txt, _hash))
+        if _hash == txt:
+            self.logger.debug('validation successful')
+            result = True
         else:
+            self.logger.debug('validation not successful')
             result = False
 
+        self.logger.debug('dns cache: {0}'.format(get_resolver_stats()))
         self.logger.debug('Challenge._validate_dns_challenge() ended with: {0}/{1}'.format(result, invalid))
         return (result, invalid)
 
@@ -273,10 +334,10 @@ class Challenge(object):
         """ validate http challenge """
         self.logger.debug('Challenge._validate_http_challenge({0}:{1}:{2})'.format(challenge_name, fqdn, token))
         # resolve name
-        (response, invalid) = fqdn_resolve(fqdn, self.dns_server_list)
+        (response, invalid) = fqdn_resolve(fqdn, self.dns_server_list, self.validation_timeout)
         self.logger.debug('fqdn_resolve() ended with: {0}/{1}'.format(response, invalid))
         if not invalid:
-            req = url_get(self.logger, 'http://{0}/.well-known/acme-challenge/{1}'.format(fqdn, token), self.dns_server_list)
+            req = url_get(self.logger, 'http://{0}/.well-known/acme-challenge/{1}'.format(fqdn, token), self.dns_server_list, self.validation_timeout)
             # make challenge validation unsuccessful
             # req = url_get(self.logger, 'http://{0}/.well-known/acme-challenge/{1}'.format('test.test', 'foo.bar.some.not.existing.ressource'))
             if req:
@@ -412,7 +473,11 @@ class Challenge(object):
 
                         if code == 200:
                             # start validation
-                            if 'status' in challenge_dic:
+                            if self.validation_workers and challenge_dic.get('status') in ('pending', 'processing'):
+                                # validate in background, the client polls the challenge until it changes
+                                _validation = self._validate_async(challenge_name, payload)
+                                challenge_dic = self._info(challenge_name)
+                            elif 'status' in challenge_dic:
                                 if challenge_dic['status'] != 'valid':
                                     _validation = self._validate(challenge_name, payload)
                                     # query challenge again (bcs. it could get updated by self._validate)
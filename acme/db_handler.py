@@ -3,6 +3,7 @@
 """ django handler for acme2certifier """
 # pylint: disable=C0413, C0415, E0401
 from __future__ import print_function
+import hashlib
 import os
 import sys
 import json
@@ -14,8 +15,12 @@ def initialize():
     # pylint: disable=E1101
     django.setup()
 initialize()
+from django.db import connection, transaction
 from app.models import Account, Authorization, Certificate, Challenge, Housekeeping, Nonce, Order, Status
 
+# rows per statement/transaction in bulk operations
+BULK_CHUNK_SIZE = 1000
+
 class DBstore(object):
     """ helper to do datebase operations """
 
@@ -33,6 +38,20 @@ class DBstore(object):
         self.logger.debug('DBStore._authorization_getinstance({0})'.format(name))
         return Authorization.objects.get(name=name)
 
+    def _chunked_apply(self, name, row_list, func, chunk_size=BULK_CHUNK_SIZE):
+        """ apply func to row_list in chunks, one transaction per chunk """
+        total = len(row_list)
+        for start in range(0, total, chunk_size):
+            chunk = row_list[start:start + chunk_size]
+            with transaction.atomic():
+                func(chunk)
+            self.logger.info('DBStore.{0}(): {1}/{2} rows processed'.format(name, start + len(chunk), total))
+        return total
+
+    def _jwk_hash(self, jwk):
+        """ hash to look up accounts by jwk via an index """
+        return hashlib.sha256(jwk.encode('utf-8')).hexdigest()
+
     def _order_getinstance(self, value=id, mkey='id'):
         """ get order instance """
         self.logger.debug('DBStore._order_getinstance({0}:{1})'.format(mkey, value))
@@ -51,6 +70,7 @@ class DBstore(object):
             created = False
             aname = account_list['name']
         else:
+            data_dic['jwk_hash'] = self._jwk_hash(data_dic['jwk'])
             obj, created = Account.objects.update_or_create(name=data_dic['name'], defaults=data_dic)
             obj.save()
             aname = data_dic['name']
@@ -59,7 +79,11 @@ class DBstore(object):
     def account_lookup(self, mkey, value):
         """ search account for a given id """
         self.logger.debug('DBStore.account_lookup({0}:{1})'.format(mkey, value))
-        account_dict = Account.objects.filter(**{mkey: value}).values('id', 'jwk', 'name', 'contact', 'alg', 'created_at')[:1]
+        filter_dic = {mkey: value}
+        if mkey == 'jwk':
+            # jwk is a TextField without index
+            filter_dic['jwk_hash'] = self._jwk_hash(value)
+        account_dict = Account.objects.filter(**filter_dic).values('id', 'jwk', 'name', 'contact', 'alg', 'created_at')[:1]
         if account_dict:
             result = account_dict[0]
         else:
@@ -75,6 +99,8 @@ class DBstore(object):
     def account_update(self, data_dic):
         """ update existing account """
         self.logger.debug('DBStore.account_update({0})'.format(data_dic))
+        if 'jwk' in data_dic:
+            data_dic['jwk_hash'] = self._jwk_hash(data_dic['jwk'])
         obj, _created = Account.objects.update_or_create(name=data_dic['name'], defaults=data_dic)
         obj.save()
         self.logger.debug('acct_id({0})'.format(obj.id))
@@ -93,7 +119,7 @@ class DBstore(object):
             'order__authorization__challenge__created_at', 'order__authorization__challenge__status__id', 'order__authorization__challenge__status__name'
             ]
         # for historical reason cert_raw an be NULL or ''; we have to consider both cases during selection
-        return(vlist, list(Account.objects.filter(name__isnull=False).values(*vlist)))
+        return(vlist, Account.objects.filter(name__isnull=False).values(*vlist).iterator(chunk_size=BULK_CHUNK_SIZE))
 
     def authorization_add(self, data_dic):
         """ add authorization to database """
@@ -141,6 +167,13 @@ class DBstore(object):
         self.logger.debug('auth_id({0})'.format(obj.id))
         return obj.id
 
+    def authorizations_update(self, id_list, data_dic, chunk_size=BULK_CHUNK_SIZE):
+        """ set the same values on a list of authorizations """
+        self.logger.debug('DBStore.authorizations_update({0} rows, {1})'.format(len(id_list), data_dic))
+        if 'status' in data_dic:
+            data_dic['status'] = self._status_getinstance(data_dic['status'], 'name')
+        return self._chunked_apply('authorizations_update', id_list, lambda chunk: Authorization.objects.filter(id__in=chunk).update(**data_dic), chunk_size)
+
     def challenge_add(self, data_dic):
         """ add challenge to database """
         self.logger.debug('DBStore.challenge_add({0})'.format(data_dic))
@@ -194,16 +227,33 @@ class DBstore(object):
         self.logger.debug('DBStore.certificate_delete({0}:{1})'.format(mkey, value))
         Certificate.objects.filter(**{mkey: value}).delete()
 
+    def certificates_delete(self, id_list, chunk_size=BULK_CHUNK_SIZE):
+        """ delete a list of certificates """
+        self.logger.debug('DBStore.certificates_delete({0} rows)'.format(len(id_list)))
+        return self._chunked_apply('certificates_delete', id_list, lambda chunk: Certificate.objects.filter(id__in=chunk).delete(), chunk_size)
+
+    def certificates_processing_search(self, mkey, value, vlist=('name', 'order__name')):
+        """ search certificates of orders in status "processing" """
+        self.logger.debug('DBStore.certificates_processing_search({0}:{1})'.format(mkey, value))
+        return Certificate.objects.filter(**{mkey: value}, order__status__id=4).values(*vlist)
+
+    def certificates_update(self, id_list, data_dic, chunk_size=BULK_CHUNK_SIZE):
+        """ set the same values on a list of certificates """
+        self.logger.debug('DBStore.certificates_update({0} rows, {1})'.format(len(id_list), data_dic))
+        return self._chunked_apply('certificates_update', id_list, lambda chunk: Certificate.objects.filter(id__in=chunk).update(**data_dic), chunk_size)
+
     def certificatelist_get(self):
         """ certificatelist_get """
         self.logger.debug('DBStore.certificatelist_get()')
         vlist = [
-            'id', 'name', 'cert_raw', 'csr', 'poll_identifier', 'created_at', 'issue_uts', 'expire_uts',
+            'id', 'name', 'serial', 'cert_raw', 'csr', 'poll_identifier', 'created_at', 'issue_uts', 'expire_uts',
             'order__id', 'order__name', 'order__status__name', 'order__notbefore', 'order__notafter', 'order__expires', 'order__identifiers',
-            'order__account__name', 'order__account__contact', 'order__account__created_at', 'order__account__jwk', 'order__account__alg'
+            'order__account__name', 'order__account__contact', 'order__account__created_at', 'order__account__jwk', 'order__account__alg',
+            # added later, appended to keep the column order of existing reports
+            'issuer', 'san', 'key_fingerprint'
             ]
         # for historical reason cert_raw an be NULL or ''; we have to consider both cases during selection
-        return(vlist, list(Certificate.objects.filter(cert_raw__isnull=False).exclude(cert_raw='').values(*vlist)))
+        return(vlist, Certificate.objects.filter(cert_raw__isnull=False).exclude(cert_raw='').values(*vlist).iterator(chunk_size=BULK_CHUNK_SIZE))
 
     def certificate_lookup(self, mkey, value, vlist=('name', 'csr', 'cert', 'order__name')):
         """ search certificate based on "something" """
@@ -257,6 +307,16 @@ class DBstore(object):
         obj, _created = Challenge.objects.update_or_create(name=data_dic['name'], defaults=data_dic)
         obj.save()
 
+    def challenge_status_change(self, challenge_name, old_status, new_status):
+        """ change status of a challenge only if it is in old_status, returns number of changed rows """
+        self.logger.debug('DBStore.challenge_status_change({0}: {1} -> {2})'.format(challenge_name, old_status, new_status))
+        return Challenge.objects.filter(name=challenge_name, status__name=old_status).update(status=self._status_getinstance(new_status, 'name'))
+
+    def connection_close(self):
+        """ close database connection of the current thread """
+        self.logger.debug('DBStore.connection_close()')
+        connection.close()
+
     def dbversion_get(self):
         """ get db version from housekeeping table """
         self.logger.debug('DBStore.dbversion_get()')
@@ -281,6 +341,11 @@ class DBstore(object):
             jwk_dict['alg'] = account_dict[0]['alg']
         return jwk_dict
 
+    def jwk_hash_get(self, aname):
+        """ get hash of the current account key, None if account does not exist """
+        self.logger.debug('DBStore.jwk_hash_get({0})'.format(aname))
+        return Account.objects.filter(name=aname).values_list('jwk_hash', flat=True).first()
+
     def nonce_add(self, nonce):
         """ check if nonce is in datbase
         in: nonce
@@ -304,6 +369,14 @@ class DBstore(object):
         self.logger.debug('DBStore.nonce_delete({0})'.format(nonce))
         Nonce.objects.filter(nonce=nonce).delete()
 
+    def nonce_consume(self, nonce):
+        """ delete nonce from datbase in a single statement
+        in: nonce
+        return: true in case nonce existed, otherwise false """
+        self.logger.debug('DBStore.nonce_consume({0})'.format(nonce))
+        (deleted, _rows) = Nonce.objects.filter(nonce=nonce).delete()
+        return bool(deleted)
+
     def order_add(self, data_dic):
         """ add order to database """
         self.logger.debug('DBStore.order_add({0})'.format(data_dic))
@@ -342,6 +415,13 @@ class DBstore(object):
         obj, _created = Order.objects.update_or_create(name=data_dic['name'], defaults=data_dic)
         obj.save()
 
+    def orders_update(self, id_list, data_dic, chunk_size=BULK_CHUNK_SIZE):
+        """ set the same values on a list of orders """
+        self.logger.debug('DBStore.orders_update({0} rows, {1})'.format(len(id_list), data_dic))
+        if 'status' in data_dic:
+            data_dic['status'] = self._status_getinstance(data_dic['status'], 'name')
+        return self._chunked_apply('orders_update', id_list, lambda chunk: Order.objects.filter(id__in=chunk).update(**data_dic), chunk_size)
+
     def orders_invalid_search(self, mkey, value, vlist=('id', 'name', 'expires', 'identifiers', 'created_at', 'status__id', 'status__name', 'account__id', 'account__name', 'acccount__contact'), operant='LIKE'):
         """ search order table for a certain key/value pair """
         self.logger.debug('DBStore.orders_search(column:{0}, pattern:{1})'.format(mkey, value))
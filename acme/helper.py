@@ -10,8 +10,11 @@ import calendar
 import copy
 import configparser
 import os
+import signal
 import sys
 import textwrap
+import threading
+import time
 from datetime import datetime
 from string import digits, ascii_letters
 try:
@@ -20,19 +23,55 @@ except ImportError:
     from urlparse import urlparse
 import logging
 import hashlib
-from urllib3.util import connection
 from jwcrypto import jwk, jws
 from dateutil.parser import parse
 import requests
 import pytz
-import dns.resolver
 import OpenSSL
 
 import socket
-import requests.packages.urllib3.util.connection as urllib3_cn
 
+from dnsclient.resolver import get_resolver
+from .httpclient import ValidationHTTPClient
 from .version import __version__
 
+# parsed configuration files shared by all handlers of a process
+CONFIG_CACHE = {}
+CONFIG_CACHE_LOCK = threading.Lock()
+# seconds between two checks if the configuration file changed on disk
+CONFIG_CHECK_INTERVAL = 1
+# http clients used for challenge validation, one per dns server list and timeout
+VALIDATION_CLIENTS = {}
+VALIDATION_CLIENTS_LOCK = threading.Lock()
+
+class ConfigSnapshot(configparser.RawConfigParser):
+    """ configuration which cannot be modified once loaded """
+
+    def _frozen_check(self):
+        """ refuse modifications of a loaded snapshot """
+        if getattr(self, 'frozen', False):
+            raise TypeError('configuration snapshot is read-only')
+
+    def freeze(self):
+        """ mark snapshot as loaded """
+        self.frozen = True
+
+    def add_section(self, section):
+        self._frozen_check()
+        return super(ConfigSnapshot, self).add_section(section)
+
+    def remove_section(self, section):
+        self._frozen_check()
+        return super(ConfigSnapshot, self).remove_section(section)
+
+    def remove_option(self, section, option):
+        self._frozen_check()
+        return super(ConfigSnapshot, self).remove_option(section, option)
+
+    def set(self, section, option, value=None):
+        self._frozen_check()
+        return super(ConfigSnapshot, self).set(section, option, value)
+
 def b64decode_pad(logger, string):
     """ b64 decoding and padding of missing "=" """
     logger.debug('b64decode_pad()')
@@ -181,6 +220,42 @@ def cert_extensions_get(logger, certificate):
     logger.debug('cert_extensions_get() ended with: {0}'.format(extension_list))
     return extension_list
 
+def cert_fingerprint_get(logger, cert):
+    """ get sha256 fingerprint of the public key from certificate in pem format """
+    logger.debug('cert_fingerprint_get()')
+    req = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, cert)
+    return pubkey_fingerprint_get(logger, req.get_pubkey())
+
+def cert_info_get(logger, certificate):
+    """ get serial, sans, issuer, validity and key fingerprint from certificate in one go """
+    logger.debug('cert_info_get()')
+    info_dic = {'serial': '', 'san': '', 'issuer': '', 'key_fingerprint': '', 'issue_uts': 0, 'expire_uts': 0}
+    try:
+        pem_file = build_pem_file(logger, None, b64_url_recode(logger, certificate), True)
+        cert = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, pem_file)
+    except BaseException as err_:
+        logger.error('cert_info_get(): error while loading certificate: {0}'.format(err_))
+        return info_dic
+
+    info_dic['serial'] = str(cert.get_serial_number())
+    san_list = []
+    for i in range(0, cert.get_extension_count()):
+        ext = cert.get_extension(i)
+        if 'subjectAltName' in str(ext.get_short_name()):
+            san_list.extend(san_name.strip() for san_name in str(ext).split(','))
+    info_dic['san'] = ', '.join(san_list)
+    info_dic['issuer'] = cert.to_cryptography().issuer.rfc4514_string()[:255]
+    info_dic['key_fingerprint'] = pubkey_fingerprint_get(logger, cert.get_pubkey())
+    try:
+        info_dic['issue_uts'] = date_to_uts_utc(cert.get_notBefore(), _tformat='%Y%m%dT%H%M%SZ')
+        info_dic['expire_uts'] = date_to_uts_utc(cert.get_notAfter(), _tformat='%Y%m%dT%H%M%SZ')
+    except BaseException:
+        info_dic['issue_uts'] = 0
+        info_dic['expire_uts'] = 0
+
+    logger.debug('cert_info_get() ended with: {0}'.format(info_dic['serial']))
+    return info_dic
+
 def cert_serial_get(logger, certificate):
     """ get serial number form certificate """
     logger.debug('cert_serial_get()')
@@ -233,6 +308,13 @@ def csr_dn_get(logger, csr):
     logger.debug('CAhandler.csr_dn_get() ended with: {0}'.format(subject_str))
     return subject_str
 
+def csr_fingerprint_get(logger, csr):
+    """ get sha256 fingerprint of the public key from certificate request """
+    logger.debug('csr_fingerprint_get()')
+    pem_file = build_pem_file(logger, None, b64_url_recode(logger, csr), True, True)
+    req = OpenSSL.crypto.load_certificate_request(OpenSSL.crypto.FILETYPE_PEM, pem_file)
+    return pubkey_fingerprint_get(logger, req.get_pubkey())
+
 def csr_pubkey_get(logger, csr):
     """ get public key from certificate request """
     logger.debug('CAhandler.csr_pubkey_get()')
@@ -294,6 +376,12 @@ def decode_deserialize(logger, string):
 def decode_message(logger, message):
     """ decode jwstoken and return header, payload and signature """
     logger.debug('decode_message()')
+    (result, error, protected, payload, signature, _jwstoken) = decode_jws(logger, message)
+    return(result, error, protected, payload, signature)
+
+def decode_jws(logger, message):
+    """ decode jwstoken and return header, payload, signature and the deserialized token """
+    logger.debug('decode_jws()')
     jwstoken = jws.JWS()
     result = False
     error = None
@@ -314,7 +402,9 @@ def decode_message(logger, message):
 
     if payload:
         payload = dkeys_lower(payload)
-    return(result, error, protected, payload, signature)
+    if not result:
+        jwstoken = None
+    return(result, error, protected, payload, signature, jwstoken)
 
 def dkeys_lower(tree):
     """ lower characters in payload string """
@@ -363,11 +453,44 @@ def load_config(logger=None, mfilter=None, cfg_file=os.path.dirname(__file__)+'/
     """ small configparser wrappter to load a config file """
     if logger:
         logger.debug('load_config({1}:{0})'.format(mfilter, cfg_file))
-    config = configparser.RawConfigParser()
-    config.optionxform = str
-    config.read(cfg_file)
+    now = time.monotonic()
+    with CONFIG_CACHE_LOCK:
+        entry = CONFIG_CACHE.get(cfg_file)
+        if entry and now - entry['checked'] < CONFIG_CHECK_INTERVAL:
+            return entry['config']
+        fingerprint = config_fingerprint_get(cfg_file)
+        if entry and entry['fingerprint'] == fingerprint:
+            entry['checked'] = now
+            return entry['config']
+        config = ConfigSnapshot()
+        config.optionxform = str
+        config.read(cfg_file)
+        config.freeze()
+        CONFIG_CACHE[cfg_file] = {'config': config, 'fingerprint': fingerprint, 'checked': now}
     return config
 
+def config_fingerprint_get(cfg_file):
+    """ get values telling if a config file changed on disk """
+    try:
+        stat = os.stat(cfg_file)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def config_cache_clear(*_args):
+    """ drop cached configuration, next load_config() call reads from disk again """
+    # no locking, this runs as signal handler; clear() is atomic
+    CONFIG_CACHE.clear()
+
+def config_reload_on_sighup():
+    """ reload configuration on SIGHUP """
+    if hasattr(signal, 'SIGHUP'):
+        try:
+            signal.signal(signal.SIGHUP, config_cache_clear)
+        except ValueError:
+            # signal handlers can only be installed from the main thread
+            pass
+
 def parse_url(logger, url):
     """ split url into pieces """
     logger.debug('parse_url({0})'.format(url))
@@ -458,6 +581,13 @@ def jwk_thumbprint_get(logger, pub_key):
     logger.debug('jwk_thumbprint_get() ended with: {0}'.format(thumbprint))
     return thumbprint
 
+def pubkey_fingerprint_get(logger, pubkey):
+    """ sha256 fingerprint (hex) of the SubjectPublicKeyInfo of a public key """
+    logger.debug('pubkey_fingerprint_get()')
+    result = hashlib.sha256(OpenSSL.crypto.dump_publickey(OpenSSL.crypto.FILETYPE_ASN1, pubkey)).hexdigest()
+    logger.debug('pubkey_fingerprint_get() ended with: {0}'.format(result))
+    return result
+
 def sha256_hash(logger, string):
     """ hash string """
     logger.debug('sha256_hash()')
@@ -474,7 +604,10 @@ def signature_check(logger, message, pub_key):
     result = False
     error = None
 
-    if pub_key:
+    if isinstance(pub_key, jwk.JWK):
+        # key got already parsed by caller
+        jwkey = pub_key
+    elif pub_key:
         # load key
         try:
             jwkey = jwk.JWK(**pub_key)
@@ -486,8 +619,12 @@ def signature_check(logger, message, pub_key):
 
         # verify signature
         if jwkey:
-            jwstoken = jws.JWS()
-            jwstoken.deserialize(message)
+            if isinstance(message, jws.JWS):
+                # message got already deserialized by caller
+                jwstoken = message
+            else:
+                jwstoken = jws.JWS()
+                jwstoken.deserialize(message)
             try:
                 jwstoken.verify(jwkey)
                 result = True
@@ -500,30 +637,11 @@ def signature_check(logger, message, pub_key):
     # return result
     return(result, error)
 
-def fqdn_resolve(host, dnssrv=None):
-    """ dns resolver """
-    req = dns.resolver.Resolver(configure=False)
-
+def fqdn_resolve(host, dnssrv=None, timeout=None):
+    """ dns resolver (system resolver if dnssrv is not set) """
     # hack to cover github workflows
     if '.' in host:
-        if dnssrv:
-            # add specific dns server
-            req.nameservers = dnssrv
-        for rrtype in ['A', 'AAAA']:
-            try:
-                answers = req.query(host, rrtype)
-                for rdata in answers:
-                    result = str(rdata)
-                    invalid = False
-                    break
-            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-                result = None
-                invalid = True
-            except BaseException:
-                result = None
-                invalid = False
-            if result != None:
-                break
+        (result, invalid) = get_resolver(dnssrv, timeout).address_get(host)
     else:
         result = None
         invalid = False
@@ -547,72 +665,69 @@ def dns_server_list_load():
 
     return dns_server_list
 
-def patched_create_connection(address, *args, **kwargs):
-    """ Wrap urllib3's create_connection to resolve the name elsewhere"""
-    # load dns-servers from config file
-    dns_server_list = dns_server_list_load()
-    # resolve hostname to an ip address; use your own resolver
-    host, port = address
-    (hostname, _invalid) = fqdn_resolve(host, dns_server_list)
-    # pylint: disable=W0212
-    return connection._orig_create_connection((hostname, port), *args, **kwargs)
-
-def url_get_with_own_dns(logger, url):
+def validation_client_get(dns_server_list, timeout=None):
+    """ get shared http client resolving host names via the given dns servers (ipv4 only via system resolver if None) """
+    key = (tuple(dns_server_list or ()), timeout)
+    with VALIDATION_CLIENTS_LOCK:
+        if key not in VALIDATION_CLIENTS:
+            if dns_server_list:
+                servers = list(dns_server_list)
+                resolver = lambda host: fqdn_resolve(host, servers, timeout)[0]
+            else:
+                resolver = ipv4_resolve
+            VALIDATION_CLIENTS[key] = ValidationHTTPClient(
+                resolver,
+                timeout=timeout,
+                headers={'Accept-Encoding': 'gzip', 'User-Agent': 'acme2certifier/{0}'.format(__version__)})
+        return VALIDATION_CLIENTS[key]
+
+def url_get_with_own_dns(logger, url, timeout=None, dns_server_list=None):
     """ request by using an own dns resolver """
     logger.debug('url_get_with_own_dns({0})'.format(url))
-    # patch an own connection handler into URL lib
-    # pylint: disable=W0212
-    connection._orig_create_connection = connection.create_connection
-    connection.create_connection = patched_create_connection
+    if not dns_server_list:
+        dns_server_list = dns_server_list_load()
     try:
-        req = requests.get(url, headers={'Connection':'close', 'Accept-Encoding': 'gzip', 'User-Agent': 'acme2certifier/{0}'.format(__version__)})
+        req = validation_client_get(dns_server_list, timeout).get(url)
         result = req.text
     except BaseException as err_:
         result = None
         logger.error('url_get error: {0}'.format(err_))
-    # cleanup
-    connection.create_connection = connection._orig_create_connection
     return result
 
-def allowed_gai_family():
-    family = socket.AF_INET    # force IPv4
-    return family
+def ipv4_resolve(host):
+    """ resolve host name to an ipv4 address using the system resolver """
+    try:
+        return socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)[0][4][0]
+    except socket.gaierror:
+        return None
 
-def url_get(logger, url, dns_server_list=None):
+def url_get(logger, url, dns_server_list=None, timeout=None):
     """ http get """
     logger.debug('url_get({0})'.format(url))
     if dns_server_list:
-        result = url_get_with_own_dns(logger, url)
+        result = url_get_with_own_dns(logger, url, timeout, dns_server_list)
     else:
         try:
-            req = requests.get(url, headers={'Connection':'close', 'Accept-Encoding': 'gzip', 'User-Agent': 'acme2certifier/{0}'.format(__version__)})
+            req = requests.get(url, headers={'Connection':'close', 'Accept-Encoding': 'gzip', 'User-Agent': 'acme2certifier/{0}'.format(__version__)}, timeout=timeout)
             result = req.text
         except BaseException as err_:
             # force fallback to ipv4
             logger.debug('url_get({0}): fallback to v4'.format(url))
-            old_gai_family = urllib3_cn.allowed_gai_family
             try:
-                urllib3_cn.allowed_gai_family = allowed_gai_family
-                req = requests.get(url, headers={'Connection':'close', 'Accept-Encoding': 'gzip', 'User-Agent': 'acme2certifier/{0}'.format(__version__)})
+                req = validation_client_get(None, timeout).get(url)
                 result = req.text
-                print(result)
             except BaseException as err_:
                 result = None
                 logger.error('url_get error: {0}'.format(err_))
-            urllib3_cn.allowed_gai_family = old_gai_family
     logger.debug('url_get() ended with: {0}'.format(result))
     return result
 
-def txt_get(logger, fqdn, dns_srv=None):
+def txt_get(logger, fqdn, dns_srv=None, timeout=None):
     """ dns query to get the TXt record """
     logger.debug('txt_get({0}: {1})'.format(fqdn, dns_srv))
 
-    # rewrite dns resolver if configured
-    if dns_srv:
-        dns.resolver.default_resolver = dns.resolver.Resolver(configure=False)
-        dns.resolver.default_resolver.nameservers = dns_srv
     try:
-        result = dns.resolver.query(fqdn, 'TXT').response.answer[0][-1].strings[0]
+        result = get_resolver(dns_srv, timeout).txt_get(fqdn)
     except BaseException as err_:
         logger.error('txt_get() error: {0}'.format(err_))
         result = None
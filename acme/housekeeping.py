@@ -3,12 +3,13 @@
 """ Housekeeping class """
 from __future__ import print_function
 import csv
+import itertools
 import json
 from acme.db_handler import DBstore
 from acme.authorization import Authorization
 from acme.certificate import Certificate
 from acme.order import Order
-from acme.helper import load_config, uts_to_date_utc, cert_dates_get, cert_serial_get, uts_now
+from acme.helper import load_config, uts_to_date_utc, uts_now
 from acme.version import __version__
 
 class Housekeeping(object):
@@ -57,40 +58,7 @@ class Housekeeping(object):
         """ convert data from uts to real date """
         self.logger.debug('Housekeeping._convert_dates()')
         for cert in cert_list:
-            expire_list = ('order.expires', 'authorization.expires', 'challenge.expires')
-            for ele in expire_list:
-                if ele in cert and cert[ele]:
-                    cert[ele] = uts_to_date_utc(cert[ele], '%Y-%m-%d %H:%M:%S')
-
-            # set uts to 0 if we do not have them in dictionary
-            if 'certificate.issue_uts' not in cert or 'certificate.expire_uts' not in cert:
-                cert['certificate.issue_uts'] = 0
-                cert['certificate.expire_uts'] = 0
-
-            # if uts is zero we try to get the dates from certificate
-            if cert['certificate.issue_uts'] == 0 or cert['certificate.expire_uts'] == 0:
-                # cover cases without certificate in dict
-                if 'certificate.cert_raw' in cert:
-                    (issue_uts, expire_uts) = cert_dates_get(self.logger, cert['certificate.cert_raw'])
-                    cert['certificate.issue_uts'] = issue_uts
-                    cert['certificate.expire_uts'] = expire_uts
-                else:
-                    cert['certificate.issue_uts'] = 0
-                    cert['certificate.expire_uts'] = 0
-
-            if cert['certificate.issue_uts'] > 0 and cert['certificate.expire_uts'] > 0:
-                cert['certificate.issue_date'] = uts_to_date_utc(cert['certificate.issue_uts'], '%Y-%m-%d %H:%M:%S')
-                cert['certificate.expire_date'] = uts_to_date_utc(cert['certificate.expire_uts'], '%Y-%m-%d %H:%M:%S')
-            else:
-                cert['certificate.issue_date'] = ''
-                cert['certificate.expire_date'] = ''
-
-           # add serial number
-            if 'certificate.cert_raw' in cert:
-                try:
-                    cert['certificate.serial'] = cert_serial_get(self.logger, cert['certificate.cert_raw'])
-                except BaseException:
-                    cert['certificate.serial'] = ''
+            self._row_convert(cert)
 
         return cert_list
 
@@ -132,21 +100,99 @@ class Housekeeping(object):
 
         field_dic = self._fieldlist_normalize(field_list, prefix)
 
-        new_list = []
-        for v_list in value_list:
-            # create a temporary dictionary wiht the renamed fields
-            tmp_dic = {}
-            for field in v_list:
-                if field in field_dic:
-                    tmp_dic[field_dic[field]] = v_list[field]
-            # append dicutionary to list
-            new_list.append(tmp_dic)
+        new_list = [self._row_normalize(field_dic, v_list) for v_list in value_list]
 
         # get field_list
         field_list = list(field_dic.values())
 
         return(field_list, new_list)
 
+    def _row_convert(self, cert):
+        """ convert dates of a single row from uts to real date """
+        expire_list = ('order.expires', 'authorization.expires', 'challenge.expires')
+        for ele in expire_list:
+            if ele in cert and cert[ele]:
+                cert[ele] = uts_to_date_utc(cert[ele], '%Y-%m-%d %H:%M:%S')
+
+        # set uts to 0 if we do not have them in dictionary
+        # (dates and serial get extracted when storing the certificate)
+        if 'certificate.issue_uts' not in cert or 'certificate.expire_uts' not in cert:
+            cert['certificate.issue_uts'] = 0
+            cert['certificate.expire_uts'] = 0
+
+        if cert['certificate.issue_uts'] > 0 and cert['certificate.expire_uts'] > 0:
+            cert['certificate.issue_date'] = uts_to_date_utc(cert['certificate.issue_uts'], '%Y-%m-%d %H:%M:%S')
+            cert['certificate.expire_date'] = uts_to_date_utc(cert['certificate.expire_uts'], '%Y-%m-%d %H:%M:%S')
+        else:
+            cert['certificate.issue_date'] = ''
+            cert['certificate.expire_date'] = ''
+
+        # serial numbers are stored as string but reported as number
+        if cert.get('certificate.serial'):
+            cert['certificate.serial'] = int(cert['certificate.serial'])
+
+        return cert
+
+    def _row_normalize(self, field_dic, v_list):
+        """ rename the fields of a single row """
+        # create a temporary dictionary wiht the renamed fields
+        tmp_dic = {}
+        for field in v_list:
+            if field in field_dic:
+                tmp_dic[field_dic[field]] = v_list[field]
+        return tmp_dic
+
+    def _row_to_list(self, field_list, cert):
+        """ convert a single row to csv format """
+        tmp_list = []
+        # enumarte fields and store them in temporary list
+        for field in field_list:
+            # in case we are missing a field put empty string in
+            if field in cert:
+                try:
+                    # we need to deal with some errors from past
+                    value = cert[field].replace('\r\n', '\n')
+                    value = value.replace('\r', '')
+                    value = value.replace('\n', '')
+                    tmp_list.append(value)
+                except BaseException:
+                    tmp_list.append(cert[field])
+            else:
+                tmp_list.append('')
+        return tmp_list
+
+    def _rows_stream(self, field_dic, value_list):
+        """ normalize and convert rows one at a time """
+        self.logger.debug('Housekeeping._rows_stream()')
+        for v_list in value_list:
+            yield self._row_convert(self._row_normalize(field_dic, v_list))
+
+    def _stream_dump(self, filename, report_format, field_list, row_list):
+        """ write rows to file while they are read from database """
+        self.logger.debug('Housekeeping._stream_dump({0})'.format(filename))
+        count = 0
+        with open(filename, 'w', newline='') as file_:
+            if report_format == 'csv':
+                writer = csv.writer(file_, delimiter=',', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+                writer.writerow(field_list)
+                for row in row_list:
+                    writer.writerow(self._row_to_list(field_list, row))
+                    count += 1
+            elif report_format == 'ndjson':
+                for row in row_list:
+                    file_.write(json.dumps(row, ensure_ascii=False, default=str))
+                    file_.write('\n')
+                    count += 1
+            else:
+                # json array, formatted the same way as _json_dump()
+                for row in row_list:
+                    file_.write(',\n    ' if count else '[\n    ')
+                    file_.write(json.dumps(row, ensure_ascii=False, indent=4, default=str).replace('\n', '\n    '))
+                    count += 1
+                file_.write('\n]' if count else '[]')
+        self.logger.debug('Housekeeping._stream_dump() ended with {0} entries'.format(count))
+        return count
+
     def _to_acc_json(self, account_list):
         """ stack list to json """
         self.logger.debug('Housekeeping._to_acc_json()')
@@ -225,84 +271,95 @@ class Housekeeping(object):
         if field_list:
             csv_list.append(field_list)
         for cert in cert_list:
-            tmp_list = []
-            # enumarte fields and store them in temporary list
-            for field in field_list:
-                # in case we are missing a field put empty string in
-                if field in cert:
-                    try:
-                        # we need to deal with some errors from past
-                        value = cert[field].replace('\r\n', '\n')
-                        value = value.replace('\r', '')
-                        value = value.replace('\n', '')
-                        tmp_list.append(value)
-                    except BaseException:
-                        tmp_list.append(cert[field])
-                else:
-                    tmp_list.append('')
-
-            # append list to output
-            csv_list.append(tmp_list)
+            csv_list.append(self._row_to_list(field_list, cert))
         self.logger.debug('Housekeeping._to_list() ended with {0} entries'.format(len(csv_list)))
         return csv_list
 
+    def _accountreport_rows(self):
+        """ get field list and a row iterator of the account report """
+        (field_list, account_list) = self._accountlist_get()
+
+        # normalize field names
+        field_dic = self._fieldlist_normalize(field_list, 'account')
+        field_list = list(field_dic.values())
+
+        # normalize rows and convert dates into human readable format while reading them
+        return (field_list, self._rows_stream(field_dic, account_list))
+
+    def _certreport_rows(self):
+        """ get field list and a row iterator of the certificate report """
+        (field_list, cert_list) = self._certificatelist_get()
+
+        # normalize field names
+        field_dic = self._fieldlist_normalize(field_list, 'certificate')
+        field_list = list(field_dic.values())
+
+        # extend list by additional fields to have the fileds in output
+        field_list.insert(7, 'certificate.issue_date')
+        field_list.insert(8, 'certificate.expire_date')
+
+        # normalize rows and convert dates into human readable format while reading them
+        return (field_list, self._rows_stream(field_dic, cert_list))
+
+    def _report_dump(self, report_name, report_format, field_list, row_list):
+        """ dump report rows into a file, returns the number of entries """
+        if report_format not in ('csv', 'json', 'ndjson'):
+            self.logger.info('Housekeeping._report_dump(): unknown format {0}, no dump'.format(report_format))
+            return 0
+        # peek at first entry to skip the dump of empty reports
+        row_list = iter(row_list)
+        first = next(row_list, None)
+        if not first:
+            return 0
+        self.logger.debug('output to dump: {0}.{1}'.format(report_name, report_format))
+        return self._stream_dump('{0}.{1}'.format(report_name, report_format), report_format, field_list, itertools.chain([first], row_list))
+
     def accountreport_get(self, report_format='csv', report_name=None, nested=False):
         """ get account report """
         self.logger.debug('Housekeeping.accountreport_get()')
-        (field_list, account_list) = self._accountlist_get()
+        (field_list, account_list) = self._accountreport_rows()
+        account_list = list(account_list)
+
+        if report_name and account_list:
+            if report_format == 'json' and nested:
+                account_list = self._to_acc_json(account_list)
+                self._json_dump('{0}.{1}'.format(report_name, report_format), account_list)
+            else:
+                self._report_dump(report_name, report_format, field_list, account_list)
 
-        # normalize lists
-        (field_list, account_list) = self._lists_normalize(field_list, account_list, 'account')
+        return account_list
 
-        # convert dates into human readable format
-        account_list = self._convert_data(account_list)
+    def accountreport_dump(self, report_name, report_format='csv', nested=False):
+        """ dump account report into a file while reading it, returns the number of entries """
+        self.logger.debug('Housekeeping.accountreport_dump()')
+        (field_list, account_list) = self._accountreport_rows()
 
-        if report_name:
+        if report_format == 'json' and nested:
+            # nesting needs all rows of an account
+            account_list = list(account_list)
             if account_list:
-                self.logger.debug('output to dump: {0}.{1}'.format(report_name, report_format))
-                if report_format == 'csv':
-                    self.logger.debug('Housekeeping.certreport_get() dump in csv-format')
-                    csv_list = self._to_list(field_list, account_list)
-                    self._csv_dump('{0}.{1}'.format(report_name, report_format), csv_list)
-                elif report_format == 'json':
-                    if nested:
-                        account_list = self._to_acc_json(account_list)
-                    self._json_dump('{0}.{1}'.format(report_name, report_format), account_list)
+                self._json_dump('{0}.{1}'.format(report_name, report_format), self._to_acc_json(account_list))
+            return len(account_list)
 
-        return account_list
+        return self._report_dump(report_name, report_format, field_list, account_list)
 
     def certreport_get(self, report_format='csv', report_name=None):
         """ get certificate report """
         self.logger.debug('Housekeeping.certreport_get()')
+        (field_list, cert_list) = self._certreport_rows()
+        cert_list = list(cert_list)
 
-        (field_list, cert_list) = self._certificatelist_get()
-
-        # normalize lists
-        (field_list, cert_list) = self._lists_normalize(field_list, cert_list, 'certificate')
-
-        # convert dates into human readable format
-        cert_list = self._convert_data(cert_list)
-
-        # extend list by additional fields to have the fileds in output
-        field_list.insert(2, 'certificate.serial')
-        field_list.insert(7, 'certificate.issue_date')
-        field_list.insert(8, 'certificate.expire_date')
-
-        if report_name:
-            if cert_list:
-                self.logger.debug('output to dump: {0}.{1}'.format(report_name, report_format))
-                if report_format == 'csv':
-                    self.logger.debug('Housekeeping.certreport_get(): Dump in csv-format')
-                    csv_list = self._to_list(field_list, cert_list)
-                    self._csv_dump('{0}.{1}'.format(report_name, report_format), csv_list)
-                elif report_format == 'json':
-                    self.logger.debug('Housekeeping.certreport_get(): Dump in json-format')
-                    self._json_dump('{0}.{1}'.format(report_name, report_format), cert_list)
-                else:
-                    self.logger.info('Housekeeping.certreport_get(): No dump just return report')
+        if report_name and cert_list:
+            self._report_dump(report_name, report_format, field_list, cert_list)
 
         return cert_list
 
+    def certreport_dump(self, report_name, report_format='csv'):
+        """ dump certificate report into a file while reading it, returns the number of entries """
+        self.logger.debug('Housekeeping.certreport_dump()')
+        (field_list, cert_list) = self._certreport_rows()
+        return self._report_dump(report_name, report_format, field_list, cert_list)
+
     def certificate_dates_update(self):
         """ scan certificates and update issue/expiry date """
         self.logger.debug('Housekeeping.certificate_dates_update()')
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" http client resolving host names with an own resolver (used for challenge validation) """
+from __future__ import print_function
+import ipaddress
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLBLOCK
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.poolmanager import PoolManager
+from urllib3.util import connection
+
+
+class ResolvingConnectionMixin(object):
+    """ connect to the address returned by the resolver instead of using getaddrinfo()
+
+    the host name is kept for the Host header, SNI and certificate checks """
+
+    def __init__(self, *args, **kwargs):
+        self.resolver = kwargs.pop('resolver')
+        super(ResolvingConnectionMixin, self).__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        """ establish socket connection to the resolved address """
+        host = self._dns_host
+        try:
+            ipaddress.ip_address(host)
+            address = host
+        except ValueError:
+            address = self.resolver(host)
+        if not address:
+            raise NewConnectionError(self, 'Failed to establish a new connection: could not resolve {0}'.format(host))
+
+        extra_kw = {}
+        if self.source_address:
+            extra_kw['source_address'] = self.source_address
+        if self.socket_options:
+            extra_kw['socket_options'] = self.socket_options
+        try:
+            conn = connection.create_connection((address, self.port), self.timeout, **extra_kw)
+        except socket.timeout:
+            raise ConnectTimeoutError(self, 'Connection to {0} timed out. (connect timeout={1})'.format(host, self.timeout))
+        except socket.error as err_:
+            raise NewConnectionError(self, 'Failed to establish a new connection: {0}'.format(err_))
+        return conn
+
+
+class ResolvingHTTPConnection(ResolvingConnectionMixin, HTTPConnection):
+    """ http connection using an own resolver """
+
+
+class ResolvingHTTPSConnection(ResolvingConnectionMixin, HTTPSConnection):
+    """ https connection using an own resolver """
+
+
+class ResolvingPoolManager(PoolManager):
+    """ pool manager creating connections with an own resolver """
+
+    def __init__(self, resolver, *args, **kwargs):
+        self.resolver = resolver
+        super(ResolvingPoolManager, self).__init__(*args, **kwargs)
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super(ResolvingPoolManager, self)._new_pool(scheme, host, port, request_context)
+        if scheme == 'https':
+            pool.ConnectionCls = ResolvingHTTPSConnection
+        else:
+            pool.ConnectionCls = ResolvingHTTPConnection
+        pool.conn_kw = dict(pool.conn_kw, resolver=self.resolver)
+        return pool
+
+
+class ResolvingHTTPAdapter(HTTPAdapter):
+    """ requests transport adapter using an own resolver """
+
+    def __init__(self, resolver, **kwargs):
+        # must be set before HTTPAdapter.__init__() creates the pool manager
+        self.resolver = resolver
+        super(ResolvingHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=DEFAULT_POOLBLOCK, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = ResolvingPoolManager(self.resolver, num_pools=connections, maxsize=maxsize, block=block, strict=True, **pool_kwargs)
+
+
+class ValidationHTTPClient(object):
+    """ thread-safe http client for challenge validation
+
+    every thread gets its own pooled session, no global state gets modified """
+
+    def __init__(self, resolver, timeout=None, headers=None, pool_connections=10, pool_maxsize=10):
+        self.resolver = resolver
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        """ pooled session of the current thread """
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = ResolvingHTTPAdapter(self.resolver, pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(self.headers)
+            self.local.session = session
+        return session
+
+    def get(self, url, timeout=None):
+        """ http get """
+        return self.session.get(url, timeout=timeout or self.timeout)
@@ -3,12 +3,21 @@
 """ ca hanlder for Insta Certifier via REST-API class """
 from __future__ import print_function
 import json
-from acme.helper import decode_message, load_config
+from acme.helper import decode_jws, load_config
 from acme.error import Error
 from acme.db_handler import DBstore
 from acme.nonce import Nonce
 from acme.signature import Signature
 
+class ParsedMessage(object):
+    """ request-scoped jws message, decoded exactly once """
+
+    def __init__(self, logger, content):
+        self.content = content
+        (self.result, self.error, self.protected, self.payload, self.signature, self.jwstoken) = decode_jws(logger, content)
+        self.account_name = None
+
+
 class Message(object):
     """ Message  handler """
 
@@ -20,6 +29,7 @@ class Message(object):
         self.server_name = srv_name
         self.path_dic = {'acct_path' : '/acme/acct/', 'revocation_path' : '/acme/revokecert'}
         self.disable_dic = {'signature_check_disable' : False, 'nonce_check_disable' : False}
+        self.parsed = None
         self._config_load()
 
     def __enter__(self):
@@ -82,7 +92,8 @@ class Message(object):
             skip_signature_check = False
 
         # decode message
-        (result, error_detail, protected, payload, _signature) = decode_message(self.logger, content)
+        self.parsed = ParsedMessage(self.logger, content)
+        (result, error_detail, protected, payload) = (self.parsed.result, self.parsed.error, self.parsed.protected, self.parsed.payload)
         account_name = None
         if result:
             # decoding successful - check nonce for anti replay protection
@@ -101,9 +112,10 @@ class Message(object):
             if code == 200 and not skip_signature_check:
                 # nonce check successful - check signature
                 account_name = self._name_get(protected)
+                self.parsed.account_name = account_name
                 signature = Signature(self.debug, self.server_name, self.logger)
                 # we need the decoded protected header to grab a key to verify signature
-                (sig_check, error, error_detail) = signature.check(account_name, content, use_emb_key, protected)
+                (sig_check, error, error_detail) = signature.check(account_name, self.parsed.jwstoken, use_emb_key, protected)
                 if sig_check:
                     code = 200
                     message = None
@@ -2,8 +2,266 @@
 # -*- coding: utf-8 -*-
 """ Nonce class """
 from __future__ import print_function
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from acme.helper import load_config
 from acme.db_handler import DBstore
+from dnsclient.helpers import get_redis_connection, get_redis_pool
+
+# default lifetime of a nonce in seconds
+NONCE_LIFETIME = 3600
+# key prefix used for nonces stored in redis
+REDIS_NONCE_PREFIX = 'acme:nonce:'
+# key prefix used for consumed stateless nonces stored in redis
+REDIS_CONSUMED_PREFIX = 'acme:nonce:consumed:'
+# maximum number of nonces kept by the memory backend
+NONCE_MEMORY_MAXSIZE = 100000
+# size of the replay filter of stateless nonces (bits per generation)
+CONSUMED_FILTER_BITS = 1 << 23
+
+
+class NonceDBStore(object):
+    """ nonce store using the database (default) """
+
+    stateless = False
+
+    def __init__(self, debug=None, logger=None):
+        self.logger = logger
+        self.dbstore = DBstore(debug, self.logger)
+
+    def add(self, nonce):
+        """ store a nonce """
+        return self.dbstore.nonce_add(nonce)
+
+    def consume(self, nonce):
+        """ check if nonce exists and delete it """
+        return self.dbstore.nonce_consume(nonce)
+
+
+class NonceMemoryStore(object):
+    """ in-process nonce store with expiry """
+
+    stateless = False
+
+    def __init__(self, lifetime=NONCE_LIFETIME, maxsize=NONCE_MEMORY_MAXSIZE):
+        self.lifetime = lifetime
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        # nonces are added with a fixed lifetime, so insertion order is expiry order
+        self.nonces = OrderedDict()
+
+    def _evict(self, now):
+        """ drop expired nonces from the head of the store """
+        while self.nonces:
+            nonce, expires = next(iter(self.nonces.items()))
+            if expires > now:
+                break
+            del self.nonces[nonce]
+
+    def add(self, nonce):
+        """ store a nonce """
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            # store is full: drop the oldest nonces, clients retry on badNonce
+            while len(self.nonces) >= self.maxsize:
+                self.nonces.popitem(last=False)
+            self.nonces[nonce] = now + self.lifetime
+
+    def consume(self, nonce):
+        """ check if nonce exists and delete it in a single step """
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            return self.nonces.pop(nonce, None) is not None
+
+    def __len__(self):
+        with self.lock:
+            self._evict(time.monotonic())
+            return len(self.nonces)
+
+
+class NonceRedisStore(object):
+    """ nonce store using redis, nonces expire via redis ttl """
+
+    stateless = False
+
+    def __init__(self, pool, lifetime=NONCE_LIFETIME):
+        self.pool = pool
+        self.lifetime = lifetime
+
+    @property
+    def redis(self):
+        """ get a connection from the pool """
+        return get_redis_connection(self.pool)
+
+    def add(self, nonce):
+        """ store a nonce """
+        self.redis.set(REDIS_NONCE_PREFIX + nonce, 1, ex=self.lifetime)
+
+    def consume(self, nonce):
+        """ check if nonce exists and delete it (DEL is atomic) """
+        return bool(self.redis.delete(REDIS_NONCE_PREFIX + nonce))
+
+
+class ConsumedNonceFilter(object):
+    """ bounded-memory filter of recently consumed nonces
+
+    two rotating bloom filters, each covering one nonce lifetime, so every nonce
+    is remembered at least until it expires. false positives are reported as
+    badNonce which clients handle by retrying with a fresh nonce """
+
+    def __init__(self, lifetime=NONCE_LIFETIME, bits=CONSUMED_FILTER_BITS, hashes=4):
+        self.lifetime = lifetime
+        self.bits = bits
+        self.hashes = hashes
+        self.lock = threading.Lock()
+        self.current = bytearray(bits // 8)
+        self.previous = bytearray(bits // 8)
+        self.rotated_at = time.time()
+
+    def _positions(self, nonce):
+        """ get bit positions of a nonce """
+        digest = hashlib.blake2b(nonce.encode(), digest_size=8 * self.hashes).digest()
+        return [int.from_bytes(digest[i * 8:(i + 1) * 8], 'big') % self.bits for i in range(self.hashes)]
+
+    def _rotate(self, now):
+        """ start a new generation once the current one covered a full lifetime """
+        if now - self.rotated_at >= self.lifetime:
+            if now - self.rotated_at >= 2 * self.lifetime:
+                self.previous = bytearray(self.bits // 8)
+            else:
+                self.previous = self.current
+            self.current = bytearray(self.bits // 8)
+            self.rotated_at = now
+
+    def add(self, nonce):
+        """ mark nonce as consumed, returns false if it has been consumed already """
+        positions = self._positions(nonce)
+        with self.lock:
+            self._rotate(time.time())
+            seen = True
+            for pos in positions:
+                if not self.current[pos >> 3] & (1 << (pos & 7)) and not self.previous[pos >> 3] & (1 << (pos & 7)):
+                    seen = False
+                    break
+            if seen:
+                return False
+            for pos in positions:
+                self.current[pos >> 3] |= 1 << (pos & 7)
+            return True
+
+
+class NonceHMACStore(object):
+    """ stateless nonces: timestamp and random part signed with a server secret
+
+    consumed nonces are recorded in redis if a pool is given (shared by all workers and nodes),
+    otherwise in a per-process filter """
+
+    stateless = True
+
+    def __init__(self, secret, lifetime=NONCE_LIFETIME, pool=None):
+        self.secret = secret
+        self.lifetime = lifetime
+        self.pool = pool
+        self.consumed = None if pool else ConsumedNonceFilter(lifetime)
+
+    @property
+    def redis(self):
+        """ get a connection from the pool """
+        return get_redis_connection(self.pool)
+
+    def _sign(self, data):
+        """ truncated hmac over nonce data """
+        return hmac.new(self.secret, data, hashlib.sha256).digest()[:16]
+
+    def generate(self):
+        """ generate a new nonce """
+        data = struct.pack('>Q', int(time.time())) + os.urandom(8)
+        return base64.urlsafe_b64encode(data + self._sign(data)).rstrip(b'=').decode()
+
+    def add(self, _nonce):
+        """ nothing to store """
+
+    def consume(self, nonce):
+        """ verify nonce signature and lifetime and mark it as consumed """
+        try:
+            raw = base64.urlsafe_b64decode(nonce + '=' * (-len(nonce) % 4))
+        except (TypeError, ValueError):
+            return False
+        if len(raw) != 32:
+            return False
+        data, signature = raw[:16], raw[16:]
+        if not hmac.compare_digest(signature, self._sign(data)):
+            return False
+        (issued,) = struct.unpack('>Q', data[:8])
+        age = time.time() - issued
+        # allow one second of clock skew between nodes
+        if age < -1 or age > self.lifetime:
+            return False
+        if self.pool:
+            # remembered until the nonce expires, SET NX lets exactly one consumer win
+            return bool(self.redis.set(REDIS_CONSUMED_PREFIX + nonce, 1, nx=True, ex=max(1, int(self.lifetime - age) + 1)))
+        return self.consumed.add(nonce)
+
+
+# process-wide stores, shared by all Nonce instances: backend -> (settings, store)
+NONCE_STORES = {}
+NONCE_STORES_LOCK = threading.Lock()
+
+
+def _nonce_store_create(logger, backend, settings):
+    """ create a nonce store for the given backend and settings """
+    if backend == 'memory':
+        return NonceMemoryStore(settings['lifetime'], settings['maxsize'])
+    if backend == 'redis':
+        return NonceRedisStore(get_redis_pool(settings['redis']), settings['lifetime'])
+    if backend == 'stateless':
+        secret = settings['secret']
+        if secret:
+            secret = secret.encode()
+        else:
+            logger.warning('Nonce: nonce_secret is not configured, stateless nonces are only valid within this process')
+            secret = os.urandom(32)
+        if settings['redis']:
+            return NonceHMACStore(secret, settings['lifetime'], get_redis_pool(settings['redis']))
+        logger.warning('Nonce: no [redis] section configured, stateless nonces are only replay-safe with a single worker process')
+        return NonceHMACStore(secret, settings['lifetime'])
+    return None
+
+
+def nonce_store_get(debug, logger, config_dic):
+    """ get the nonce store configured in the [Nonce] section """
+    backend = 'database'
+    settings = {'lifetime': NONCE_LIFETIME, 'maxsize': NONCE_MEMORY_MAXSIZE, 'secret': None, 'redis': {}}
+    if 'Nonce' in config_dic:
+        backend = config_dic.get('Nonce', 'nonce_backend', fallback=backend).lower()
+        settings['lifetime'] = config_dic.getint('Nonce', 'nonce_lifetime', fallback=NONCE_LIFETIME)
+        settings['maxsize'] = config_dic.getint('Nonce', 'nonce_memory_maxsize', fallback=NONCE_MEMORY_MAXSIZE)
+        settings['secret'] = config_dic.get('Nonce', 'nonce_secret', fallback=None)
+    if 'redis' in config_dic:
+        settings['redis'] = dict(config_dic['redis'])
+
+    if backend == 'database':
+        return NonceDBStore(debug, logger)
+
+    with NONCE_STORES_LOCK:
+        # a reloaded configuration with changed settings gets a new store
+        if backend not in NONCE_STORES or NONCE_STORES[backend][0] != settings:
+            store = _nonce_store_create(logger, backend, settings)
+            if store is None:
+                logger.error('Nonce: unknown nonce_backend "{0}", falling back to database'.format(backend))
+                return NonceDBStore(debug, logger)
+            NONCE_STORES[backend] = (settings, store)
+        return NONCE_STORES[backend][1]
+
 
 class Nonce(object):
     """ Nonce handler """
@@ -11,7 +269,7 @@ class Nonce(object):
     def __init__(self, debug=None, logger=None):
         self.debug = debug
         self.logger = logger
-        self.dbstore = DBstore(self.debug, self.logger)
+        self.store = nonce_store_get(self.debug, self.logger, load_config())
 
     def __enter__(self):
         """ Makes ACMEHandler a Context Manager """
@@ -25,16 +283,12 @@ class Nonce(object):
         self.logger.debug('Nonce.nonce._check_and_delete({0})'.format(nonce))
 
         try:
-            nonce_chk_result = self.dbstore.nonce_check(nonce)
+            nonce_chk_result = self.store.consume(nonce)
         except BaseException as err_:
             self.logger.critical('acme2certifier database error in Nonce._check_and_delete(): {0}'.format(err_))
             nonce_chk_result = False
 
         if nonce_chk_result:
-            try:
-                self.dbstore.nonce_delete(nonce)
-            except BaseException as err_:
-                self.logger.critical('acme2certifier database error in Nonce._check_and_delete(): {0}'.format(err_))
             code = 200
             message = None
             detail = None
@@ -48,6 +302,8 @@ class Nonce(object):
     def _new(self):
         """ generate a new nonce """
         self.logger.debug('Nonce.nonce__new()')
+        if self.store.stateless:
+            return self.store.generate()
         return uuid.uuid4().hex
 
     def check(self, protected_decoded):
@@ -67,9 +323,8 @@ class Nonce(object):
         self.logger.debug('Nonce.nonce_generate_and_add()')
         nonce = self._new()
         self.logger.debug('got nonce: {0}'.format(nonce))
-        # self.logger.critical('foo')
         try:
-            _id = self.dbstore.nonce_add(nonce)
+            _id = self.store.add(nonce)
         except BaseException as err_:
             self.logger.critical('acme2certifier database error in Nonce.generate_and_add(): {0}'.format(err_))
         self.logger.debug('Nonce.generate_and_add() ended with:{0}'.format(nonce))
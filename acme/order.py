@@ -200,7 +200,7 @@ class Order(object):
                 code = 200
                 # this is a polling request; lookup certificate
                 try:
-                    cert_dic = self.dbstore.certificate_lookup('order__name', order_name)
+                    cert_dic = self.dbstore.certificate_lookup('order__name', order_name, ('name', 'csr', 'cert', 'poll_identifier', 'order__name'))
                 except BaseException as err_:
                     self.logger.critical('acme2certifier database error in Order._process(): {0}'.format(err_))
                     cert_dic = {}
@@ -209,6 +209,12 @@ class Order(object):
                     # pylint: disable=R1715
                     if 'name' in cert_dic:
                         certificate_name = cert_dic['name']
+                    # enrollment is still pending at the ca; try to fetch the certificate
+                    if not cert_dic.get('cert') and cert_dic.get('poll_identifier'):
+                        order_dic = self._info(order_name)
+                        if order_dic and order_dic.get('status') == 'processing':
+                            with Certificate(self.debug, self.server_name, self.logger) as certificate:
+                                certificate.poll(certificate_name, cert_dic['poll_identifier'], cert_dic['csr'], order_name)
         else:
             code = 400
             message = 'urn:ietf:params:acme:error:malformed'
@@ -324,13 +330,14 @@ class Order(object):
             # print(order['id'])
             # select all orders which are not invalid
             if 'name' in order and 'status__name' in order and order['status__name'] != 'invalid':
-                # change status and add to output list
+                # add to output list, status gets changed below
                 output_list.append(order)
-                data_dic = {'name': order['name'], 'status': 'invalid'}
-                try:
-                    self.dbstore.order_update(data_dic)
-                except BaseException as err_:
-                    self.logger.critical('acme2certifier database error in Order._invalidate() upd: {0}'.format(err_))
+
+        if output_list:
+            try:
+                self.dbstore.orders_update([order['id'] for order in output_list], {'status': 'invalid'})
+            except BaseException as err_:
+                self.logger.critical('acme2certifier database error in Order._invalidate() upd: {0}'.format(err_))
 
         self.logger.debug('Order.invalidate() ended: {0} orders identified'.format(len(output_list)))
         return (field_list, output_list)
@@ -2,9 +2,78 @@
 # -*- coding: utf-8 -*-
 """ Signature class """
 from __future__ import print_function
+import threading
+import time
+from collections import OrderedDict
+from jwcrypto import jwk
 from acme.helper import signature_check
 from acme.db_handler import DBstore
 
+# maximum number of account keys kept in the cache
+JWK_CACHE_SIZE = 1024
+# seconds after which an unused key gets dropped; entries are keyed on the key hash
+# stored with the account, so key changes done by other processes are seen right away
+JWK_CACHE_TTL = 3600
+
+
+class JWKCache(object):
+    """ bounded lru cache of parsed account keys, keyed on (account name, key hash) """
+
+    def __init__(self, maxsize=JWK_CACHE_SIZE, ttl=JWK_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, aname, jwk_hash):
+        """ get key for an account, None if not cached """
+        with self.lock:
+            entry = self.keys.get((aname, jwk_hash))
+            if entry and entry[1] > time.monotonic():
+                self.keys.move_to_end((aname, jwk_hash))
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self.keys[(aname, jwk_hash)]
+            self.misses += 1
+            return None
+
+    def set(self, aname, jwk_hash, jwkey):
+        """ cache key of an account """
+        with self.lock:
+            # an account has one valid key, drop entries of a previous one
+            for key in [key for key in self.keys if key[0] == aname and key[1] != jwk_hash]:
+                del self.keys[key]
+            self.keys[(aname, jwk_hash)] = (jwkey, time.monotonic() + self.ttl)
+            self.keys.move_to_end((aname, jwk_hash))
+            while len(self.keys) > self.maxsize:
+                self.keys.popitem(last=False)
+
+    def invalidate(self, aname):
+        """ drop key of an account (key change, deactivation) """
+        with self.lock:
+            for key in [key for key in self.keys if key[0] == aname]:
+                del self.keys[key]
+
+    def clear(self):
+        """ drop all keys and reset counters """
+        with self.lock:
+            self.keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """ cache statistics """
+        with self.lock:
+            return {'size': len(self.keys), 'hits': self.hits, 'misses': self.misses}
+
+
+# process-wide cache shared by all Signature instances
+JWK_CACHE = JWKCache()
+
+
 class Signature(object):
     """ Signature handler """
 
@@ -26,6 +95,38 @@ class Signature(object):
             result = None
         return result
 
+    def _jwk_hash_get(self, aname):
+        """ get hash of the current account key """
+        self.logger.debug('Signature._jwk_hash_get({0})'.format(aname))
+        try:
+            result = self.dbstore.jwk_hash_get(aname)
+        except BaseException as err_:
+            self.logger.critical('acme2certifier database error in Signature._jwk_hash_get(): {0}'.format(err_))
+            result = None
+        return result
+
+    def _jwkey_get(self, aname):
+        """ get parsed key for an account from cache or database """
+        self.logger.debug('Signature._jwkey_get({0})'.format(aname))
+        # the stored key hash is checked on every request, so a key changed or
+        # an account deleted by another worker is never served from the cache
+        jwk_hash = self._jwk_hash_get(aname)
+        if jwk_hash is None:
+            return None
+        jwkey = JWK_CACHE.get(aname, jwk_hash) if jwk_hash else None
+        if not jwkey:
+            pub_key = self._jwk_load(aname)
+            if pub_key:
+                try:
+                    jwkey = jwk.JWK(**pub_key)
+                except BaseException as err_:
+                    self.logger.error('load key failed {0}'.format(err_))
+                    # let signature_check() report the error
+                    return pub_key
+                if jwk_hash:
+                    JWK_CACHE.set(aname, jwk_hash, jwkey)
+        return jwkey
+
     def check(self, aname, content, use_emb_key=False, protected=None):
         """ signature check """
         self.logger.debug('Signature.check({0})'.format(aname))
@@ -34,7 +135,7 @@ class Signature(object):
             error = None
             if aname:
                 self.logger.debug('check signature against account key')
-                pub_key = self._jwk_load(aname)
+                pub_key = self._jwkey_get(aname)
                 if pub_key:
                     (result, error) = signature_check(self.logger, content, pub_key)
                 else:
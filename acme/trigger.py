@@ -4,9 +4,8 @@
 from __future__ import print_function
 import json
 import importlib
-from acme.certificate import Certificate
 from acme.db_handler import DBstore
-from acme.helper import convert_byte_to_string, cert_pubkey_get, csr_pubkey_get, cert_der2pem, b64_decode, load_config, ca_handler_get
+from acme.helper import convert_byte_to_string, cert_fingerprint_get, cert_info_get, cert_der2pem, b64_decode, load_config, ca_handler_get
 
 class Trigger(object):
     """ Challenge handler """
@@ -32,19 +31,17 @@ class Trigger(object):
         self.logger.debug('Trigger._certname_lookup()')
 
         result_list = []
-        # extract the public key form certificate
-        cert_pubkey = cert_pubkey_get(self.logger, cert_pem)
-        with Certificate(self.debug, 'foo', self.logger) as certificate:
+        # fingerprint of the public key from certificate, the one from csr got stored by store_csr()
+        fingerprint = cert_fingerprint_get(self.logger, cert_pem)
+        try:
             # search certificates in status "processing"
-            cert_list = certificate.certlist_search('order__status_id', 4, ('name', 'csr', 'order__name'))
-
-            for cert in cert_list:
-                # extract public key from certificate and compare it with pub from cert
-                if 'csr' in cert:
-                    if cert['csr']:
-                        csr_pubkey = csr_pubkey_get(self.logger, cert['csr'])
-                        if csr_pubkey == cert_pubkey:
-                            result_list.append({'cert_name': cert['name'], 'order_name': cert['order__name']})
+            cert_list = self.dbstore.certificates_processing_search('key_fingerprint', fingerprint, ('name', 'order__name'))
+        except BaseException as err_:
+            self.logger.critical('acme2certifier database error in Trigger._certname_lookup(): {0}'.format(err_))
+            cert_list = []
+
+        for cert in cert_list:
+            result_list.append({'cert_name': cert['name'], 'order_name': cert['order__name']})
         self.logger.debug('Trigger._certname_lookup() ended with: {0}'.format(result_list))
 
         return result_list
@@ -88,8 +85,11 @@ class Trigger(object):
                     cert_name_list = self._certname_lookup(cert_pem)
 
                     if cert_name_list:
+                        # serial, sans, issuer, validity and key fingerprint
+                        info_dic = cert_info_get(self.logger, cert_raw)
                         for cert in cert_name_list:
                             data_dic = {'cert' : cert_bundle, 'name': cert['cert_name'], 'cert_raw' : cert_raw}
+                            data_dic.update(info_dic)
                             try:
                                 self.dbstore.certificate_add(data_dic)
                             except BaseException as err_:
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" background worker pool for challenge validation """
+from __future__ import print_function
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ValidationPool(object):
+    """ bounded thread pool running challenge validations in the background """
+
+    def __init__(self, workers, queue_size, logger=None):
+        self.logger = logger
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='acme-validation')
+        self.lock = threading.Lock()
+        # challenges queued or being validated
+        self.pending = set()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _run(self, key, func, submitted):
+        """ run a validation job and record metrics """
+        started = time.monotonic()
+        with self.lock:
+            self.running += 1
+        failed = False
+        try:
+            func()
+        except BaseException as err_:
+            failed = True
+            if self.logger:
+                self.logger.error('ValidationPool._run({0}) failed: {1}'.format(key, err_))
+        finally:
+            finished = time.monotonic()
+            with self.lock:
+                self.pending.discard(key)
+                self.running -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self.wait_total += started - submitted
+                self.latency_total += finished - submitted
+                self.latency_max = max(self.latency_max, finished - submitted)
+
+    def submit(self, key, func, queued=None):
+        """ queue a validation job
+
+        returns True if the job is queued (or a job for key is already queued),
+        False if the queue is full. queued() is called before a new job is handed to a worker """
+        with self.lock:
+            if key in self.pending:
+                return True
+            if len(self.pending) >= self.queue_size:
+                self.rejected += 1
+                return False
+            self.pending.add(key)
+        if queued:
+            queued()
+        self.executor.submit(self._run, key, func, time.monotonic())
+        return True
+
+    def stats(self):
+        """ queue depth and latency metrics """
+        with self.lock:
+            done = self.completed + self.failed
+            return {
+                'queued': len(self.pending) - self.running,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait_avg': self.wait_total / done if done else 0.0,
+                'latency_avg': self.latency_total / done if done else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+    def shutdown(self, wait=True):
+        """ stop workers """
+        self.executor.shutdown(wait=wait)
+
+
+# process-wide pool, created on first use
+VALIDATION_POOL = None
+VALIDATION_POOL_LOCK = threading.Lock()
+
+
+def validation_pool_get(workers, queue_size, logger=None):
+    """ get process-wide validation pool """
+    global VALIDATION_POOL  # pylint: disable=W0603
+    with VALIDATION_POOL_LOCK:
+        if VALIDATION_POOL is None:
+            VALIDATION_POOL = ValidationPool(workers, queue_size, logger)
+        return VALIDATION_POOL
@@ -18,4 +18,6 @@ if PROJECT_HOME not in sys.path:
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'acme2certifier.settings')
 
 from django.core.wsgi import get_wsgi_application
+from acme.helper import config_reload_on_sighup
 application = get_wsgi_application()
+config_reload_on_sighup()
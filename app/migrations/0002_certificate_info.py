@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+""" certificate details extracted from cert_raw, backfilled for existing certificates """
+from __future__ import unicode_literals
+import base64
+import calendar
+import hashlib
+import logging
+import time
+
+from django.db import migrations, models
+from OpenSSL import crypto
+
+# certificates per database fetch and per bulk_update
+BATCH_SIZE = 500
+INFO_FIELDS = ('serial', 'san', 'issuer', 'key_fingerprint', 'issue_uts', 'expire_uts')
+
+
+def cert_info_parse(cert_raw):
+    """ serial, sans, issuer, key fingerprint and validity of a base64 encoded certificate
+
+    a copy of acme.helper.cert_info_get() as of this migration """
+    padding = '=' * ((4 - len(cert_raw) % 4) % 4)
+    cert = crypto.load_certificate(crypto.FILETYPE_ASN1, base64.b64decode((cert_raw + padding).translate(str.maketrans('-_', '+/'))))
+    san_list = []
+    for i in range(0, cert.get_extension_count()):
+        ext = cert.get_extension(i)
+        if 'subjectAltName' in str(ext.get_short_name()):
+            san_list.extend(san_name.strip() for san_name in str(ext).split(','))
+    return {
+        'serial': str(cert.get_serial_number()),
+        'san': ', '.join(san_list),
+        'issuer': cert.to_cryptography().issuer.rfc4514_string()[:255],
+        'key_fingerprint': hashlib.sha256(crypto.dump_publickey(crypto.FILETYPE_ASN1, cert.get_pubkey())).hexdigest(),
+        'issue_uts': calendar.timegm(time.strptime(cert.get_notBefore().decode(), '%Y%m%d%H%M%SZ')),
+        'expire_uts': calendar.timegm(time.strptime(cert.get_notAfter().decode(), '%Y%m%d%H%M%SZ')),
+    }
+
+
+def certificates_backfill(apps, _schema_editor):
+    """ fill the new columns for all stored certificates """
+    logger = logging.getLogger(__name__)
+    Certificate = apps.get_model('app', 'Certificate')
+    queryset = Certificate.objects.filter(cert_raw__isnull=False).exclude(cert_raw='').order_by('id')
+
+    done = 0
+    obj_list = []
+    for (cert_id, cert_raw) in queryset.values_list('id', 'cert_raw').iterator(chunk_size=BATCH_SIZE):
+        try:
+            obj_list.append(Certificate(id=cert_id, **cert_info_parse(cert_raw)))
+        except BaseException as err_:
+            # keep stored dates if the certificate cannot be parsed
+            logger.error('certificates_backfill(): error while loading certificate {0}: {1}'.format(cert_id, err_))
+        if len(obj_list) >= BATCH_SIZE:
+            Certificate.objects.bulk_update(obj_list, INFO_FIELDS)
+            done += len(obj_list)
+            obj_list = []
+            logger.info('certificates_backfill(): {0} certificates updated'.format(done))
+    if obj_list:
+        Certificate.objects.bulk_update(obj_list, INFO_FIELDS)
+        done += len(obj_list)
+        logger.info('certificates_backfill(): {0} certificates updated'.format(done))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='serial',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='san',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='issuer',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='key_fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(certificates_backfill, migrations.RunPython.noop),
+    ]
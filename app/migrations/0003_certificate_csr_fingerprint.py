@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+""" key fingerprint for certificates of orders in processing state, taken from the csr """
+from __future__ import unicode_literals
+import base64
+import hashlib
+import logging
+
+from django.db import migrations
+from OpenSSL import crypto
+
+BATCH_SIZE = 500
+
+
+def csr_fingerprint_parse(csr):
+    """ sha256 fingerprint of the public key of a base64 encoded csr
+
+    a copy of acme.helper.csr_fingerprint_get() as of this migration """
+    padding = '=' * ((4 - len(csr) % 4) % 4)
+    req = crypto.load_certificate_request(crypto.FILETYPE_ASN1, base64.b64decode((csr + padding).translate(str.maketrans('-_', '+/'))))
+    return hashlib.sha256(crypto.dump_publickey(crypto.FILETYPE_ASN1, req.get_pubkey())).hexdigest()
+
+
+def fingerprints_backfill(apps, _schema_editor):
+    """ certificates issued after the migration get the fingerprint in Certificate.store_csr() """
+    logger = logging.getLogger(__name__)
+    Certificate = apps.get_model('app', 'Certificate')
+    # Trigger only looks up certificates of orders in status "processing"
+    queryset = Certificate.objects.filter(order__status__id=4, key_fingerprint='', csr__isnull=False).exclude(csr='').order_by('id')
+    obj_list = []
+    for (cert_id, csr) in queryset.values_list('id', 'csr').iterator(chunk_size=BATCH_SIZE):
+        try:
+            obj_list.append(Certificate(id=cert_id, key_fingerprint=csr_fingerprint_parse(csr)))
+        except BaseException as err_:
+            logger.error('fingerprints_backfill(): error while loading csr of certificate {0}: {1}'.format(cert_id, err_))
+        if len(obj_list) >= BATCH_SIZE:
+            Certificate.objects.bulk_update(obj_list, ['key_fingerprint'])
+            obj_list = []
+    if obj_list:
+        Certificate.objects.bulk_update(obj_list, ['key_fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_certificate_info'),
+    ]
+
+    operations = [
+        migrations.RunPython(fingerprints_backfill, migrations.RunPython.noop),
+    ]
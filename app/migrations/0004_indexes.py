@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+""" indexes for the columns DBstore filters on and a hash column for jwk lookups """
+from __future__ import unicode_literals
+import hashlib
+import logging
+
+from django.db import migrations, models
+
+# accounts per database fetch and per bulk_update
+BATCH_SIZE = 500
+
+
+def jwk_hashes_backfill(apps, _schema_editor):
+    """ same hash as DBstore._jwk_hash() """
+    logger = logging.getLogger(__name__)
+    Account = apps.get_model('app', 'Account')
+
+    done = 0
+    obj_list = []
+    for (account_id, jwk) in Account.objects.values_list('id', 'jwk').order_by('id').iterator(chunk_size=BATCH_SIZE):
+        obj_list.append(Account(id=account_id, jwk_hash=hashlib.sha256(jwk.encode('utf-8')).hexdigest()))
+        if len(obj_list) >= BATCH_SIZE:
+            Account.objects.bulk_update(obj_list, ['jwk_hash'])
+            done += len(obj_list)
+            obj_list = []
+            logger.info('jwk_hashes_backfill(): {0} accounts updated'.format(done))
+    if obj_list:
+        Account.objects.bulk_update(obj_list, ['jwk_hash'])
+        done += len(obj_list)
+        logger.info('jwk_hashes_backfill(): {0} accounts updated'.format(done))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_certificate_csr_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='jwk_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='authorization',
+            name='expires',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='certificate',
+            name='expire_uts',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='certificate',
+            name='issue_uts',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='challenge',
+            name='token',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='nonce',
+            name='nonce',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='expires',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(jwk_hashes_backfill, migrations.RunPython.noop),
+    ]
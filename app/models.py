@@ -6,7 +6,7 @@ from django.db import models
 # Create your models here.
 class Nonce(models.Model):
     """ nonce table """
-    nonce = models.CharField(max_length=50)
+    nonce = models.CharField(max_length=50, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     def __unicode__(self):
         return self.nonce
@@ -15,6 +15,8 @@ class Account(models.Model):
     """ account table """
     name = models.CharField(max_length=15, unique=True)
     jwk = models.TextField(blank=True)
+    # sha256 of jwk, TextFields cannot be indexed on all databases
+    jwk_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
     alg = models.CharField(max_length=10)
     contact = models.CharField(max_length=256)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -35,7 +37,7 @@ class Order(models.Model):
     notafter = models.IntegerField(default=0)
     identifiers = models.CharField(max_length=1048)
     status = models.ForeignKey(Status, default=2, on_delete=models.CASCADE)
-    expires = models.IntegerField(default=0)
+    expires = models.IntegerField(default=0, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     def __unicode__(self):
         return self.name
@@ -47,7 +49,7 @@ class Authorization(models.Model):
     type = models.CharField(max_length=5)
     value = models.CharField(max_length=64)
     token = models.CharField(max_length=64, blank=True)
-    expires = models.IntegerField(default=0)
+    expires = models.IntegerField(default=0, db_index=True)
     status = models.ForeignKey(Status, default=1, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     def __unicode__(self):
@@ -58,7 +60,7 @@ class Challenge(models.Model):
     name = models.CharField(max_length=15, unique=True)
     authorization = models.ForeignKey(Authorization, on_delete=models.CASCADE)
     type = models.CharField(max_length=10)
-    token = models.CharField(max_length=64)
+    token = models.CharField(max_length=64, db_index=True)
     expires = models.IntegerField(default=0)
     status = models.ForeignKey(Status, default=2, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -76,8 +78,13 @@ class Certificate(models.Model):
     cert_raw = models.TextField(blank=True, null=True)
     error = models.TextField(blank=True, null=True)
     poll_identifier = models.TextField(blank=True, null=True)
-    expire_uts = models.IntegerField(default=0)
-    issue_uts = models.IntegerField(default=0)
+    expire_uts = models.IntegerField(default=0, db_index=True)
+    issue_uts = models.IntegerField(default=0, db_index=True)
+    # extracted from cert_raw when storing the certificate
+    serial = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    san = models.TextField(blank=True, default='')
+    issuer = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    key_fingerprint = models.CharField(max_length=64, blank=True, default='', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     def __unicode__(self):
         return self.name
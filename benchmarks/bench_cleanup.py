@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" benchmark: certificate cleanup and order invalidation on a synthetic dataset
+
+runs against a temporary test database created from the configured django
+settings (sqlite: in memory). the previous per-row code path is timed on a
+sample only and extrapolated, running it on 1M rows takes hours.
+
+usage: python benchmarks/bench_cleanup.py [rows] [per-row sample]
+"""
+from __future__ import print_function
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from django.db import connection
+from acme.certificate import Certificate as CertificateHandler
+from acme.db_handler import DBstore
+from acme.order import Order as OrderHandler
+from app.models import Account, Certificate, Order, Status
+
+STATUS_LIST = ('invalid', 'pending', 'ready', 'processing', 'valid', 'expired', 'deactivated', 'revoked')
+
+
+def populate(rows, batch=10000):
+    """ rows orders with one certificate each, all expired """
+    account = Account.objects.create(name='bench', jwk='{}', alg='RS256', contact='mailto:bench@example.com')
+    for start in range(0, rows, batch):
+        Order.objects.bulk_create(
+            Order(name='o{0}'.format(i), account=account, identifiers='[]', expires=100) for i in range(start, min(start + batch, rows)))
+    order_ids = list(Order.objects.values_list('id', flat=True))
+    for start in range(0, rows, batch):
+        Certificate.objects.bulk_create(
+            Certificate(name='c{0}'.format(i), order_id=order_ids[i], cert='pem', cert_raw='raw', expire_uts=100) for i in range(start, min(start + batch, rows)))
+
+
+def per_row(dbstore, sample):
+    """ previous code path: one update_or_create per certificate and order """
+    for cert in Certificate.objects.values('name', 'expire_uts', 'issue_uts', 'cert_raw')[:sample]:
+        dbstore.certificate_add({'name': cert['name'], 'expire_uts': cert['expire_uts'], 'issue_uts': cert['issue_uts'], 'cert': 'removed', 'cert_raw': cert['cert_raw']})
+    for order in Order.objects.values('name')[:sample]:
+        dbstore.order_update({'name': order['name'], 'status': 'invalid'})
+
+
+if __name__ == '__main__':
+
+    ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    SAMPLE = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    LOGGER = logging.getLogger('bench')
+    LOGGER.addHandler(logging.NullHandler())
+
+    OLD_NAME = connection.creation.create_test_db(verbosity=0)
+    try:
+        for PK, NAME in enumerate(STATUS_LIST, 1):
+            Status.objects.create(pk=PK, name=NAME)
+        START = time.time()
+        populate(ROWS)
+        print('{0} rows created in {1:.1f}s'.format(ROWS, time.time() - START))
+
+        START = time.time()
+        per_row(DBstore(False, LOGGER), SAMPLE)
+        PER_ROW = (time.time() - START) / SAMPLE
+        Order.objects.update(status_id=2)
+
+        with CertificateHandler(False, None, LOGGER) as CERTIFICATE:
+            START = time.time()
+            CERTIFICATE.cleanup(timestamp=500)
+            CLEANUP = time.time() - START
+            START = time.time()
+            CERTIFICATE.cleanup(timestamp=500, purge=True)
+            PURGE = time.time() - START
+        with OrderHandler(False, None, LOGGER) as ORDER:
+            START = time.time()
+            ORDER.invalidate(timestamp=500)
+            INVALIDATE = time.time() - START
+    finally:
+        connection.creation.destroy_test_db(OLD_NAME, verbosity=0)
+
+    print('{0:28s} {1:10.1f}s (extrapolated from {2} rows)'.format('per-row cleanup+invalidate', PER_ROW * ROWS, SAMPLE))
+    print('{0:28s} {1:10.1f}s'.format('cleanup', CLEANUP))
+    print('{0:28s} {1:10.1f}s'.format('cleanup purge', PURGE))
+    print('{0:28s} {1:10.1f}s'.format('order invalidate', INVALIDATE))
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" benchmark: reading acme_srv.cfg per handler vs. the shared config snapshot
+
+a new-order request constructs several handlers, each calling load_config().
+this counts the file system calls and time spent for that per request.
+
+usage: python benchmarks/bench_config_load.py [config file] [iterations]
+"""
+from __future__ import print_function
+import builtins
+import os
+import sys
+import timeit
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from acme import helper
+
+# load_config() calls during a new-order request (Order, Message, Nonce, ...)
+CALLS_PER_REQUEST = 6
+
+
+class SyscallCounter(object):
+    """ count open() and os.stat() calls """
+
+    def __init__(self):
+        self.opens = 0
+        self.stats = 0
+        self._open = builtins.open
+        self._stat = os.stat
+
+    def __enter__(self):
+        def counting_open(*args, **kwargs):
+            self.opens += 1
+            return self._open(*args, **kwargs)
+
+        def counting_stat(*args, **kwargs):
+            self.stats += 1
+            return self._stat(*args, **kwargs)
+
+        builtins.open = counting_open
+        os.stat = counting_stat
+        return self
+
+    def __exit__(self, *args):
+        builtins.open = self._open
+        os.stat = self._stat
+
+
+def request_uncached(cfg_file):
+    """ previous behaviour: every handler parses the file """
+    for _ in range(CALLS_PER_REQUEST):
+        helper.config_cache_clear()
+        helper.load_config(cfg_file=cfg_file)
+
+
+def request_cached(cfg_file):
+    """ current behaviour: handlers share the parsed snapshot """
+    for _ in range(CALLS_PER_REQUEST):
+        helper.load_config(cfg_file=cfg_file)
+
+
+if __name__ == '__main__':
+
+    CFG_FILE = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), os.path.pardir, 'config', 'acme_srv.zerossl.cfg')
+    ITERATIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for name, func in (('uncached', request_uncached), ('cached', request_cached)):
+        helper.config_cache_clear()
+        with SyscallCounter() as counter:
+            duration = timeit.timeit(lambda: func(CFG_FILE), number=ITERATIONS)
+        print('{0:10s} {1:8.1f} us/request {2:6.2f} open/request {3:6.2f} stat/request'.format(
+            name, duration / ITERATIONS * 1e6, counter.opens / ITERATIONS, counter.stats / ITERATIONS))
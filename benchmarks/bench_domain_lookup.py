@@ -0,0 +1,50 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" benchmark: Client.verify() with many configured zones and prefixes
+
+compares the previous linear scan over all domains/prefixes with the reversed-label trie.
+
+usage: python benchmarks/bench_domain_lookup.py [zones] [prefixes per zone] [lookups]
+"""
+from __future__ import print_function
+import os
+import random
+import sys
+import timeit
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from dnsclient import Client, ClientType, Domain
+from dnsclient.zones import DomainIndex
+
+
+def linear_verify(domains, host):
+    """ previous implementation of Client.verify() """
+    for domain in domains:
+        name = domain.name
+        if host.endswith('.{0}'.format(name)):
+            subdomain_with_prefix = host.replace('.{0}'.format(name), '')
+            try:
+                subdomain, prefix = subdomain_with_prefix.split('.', 1)
+            except ValueError:
+                subdomain, prefix = subdomain_with_prefix, ''
+            if not any(prefix == allowed or prefix.endswith(allowed) for allowed in domain.allowed_prefixes):
+                raise ValueError(prefix)
+            return subdomain, prefix, domain
+    raise ValueError(host)
+
+
+if __name__ == '__main__':
+
+    ZONES = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    PREFIXES = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    LOOKUPS = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    DOMAINS = [Domain('zone{0}.grid.tf'.format(i), ['gw{0}'.format(j) for j in range(PREFIXES)]) for i in range(ZONES)]
+    HOSTS = ['a.gw{0}.zone{1}.grid.tf'.format(random.randrange(PREFIXES), random.randrange(ZONES)) for _ in range(LOOKUPS)]
+
+    BUILD = timeit.timeit(lambda: DomainIndex(DOMAINS), number=1)
+    CLIENT = Client([ClientType.NAMECOM], DOMAINS, {})
+
+    for name, func in (('linear', lambda host: linear_verify(DOMAINS, host)), ('trie', CLIENT.verify)):
+        duration = timeit.timeit(lambda: [func(host) for host in HOSTS], number=1)
+        print('{0:8s} {1:10.2f} us/lookup'.format(name, duration / LOOKUPS * 1e6))
+    print('trie build for {0} zones: {1:.1f} ms'.format(ZONES, BUILD * 1e3))
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" microbenchmark: decoding a signed acme request once vs. twice
+
+usage: python benchmarks/bench_jws_decode.py [iterations]
+"""
+from __future__ import print_function
+import json
+import logging
+import os
+import sys
+import timeit
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from jwcrypto import jwk, jws
+from acme.helper import decode_message, decode_jws, signature_check
+
+LOGGER = logging.getLogger('bench')
+
+
+def signed_message(key):
+    """ build a jws like an acme client would send it """
+    protected = {
+        'alg': 'RS256',
+        'kid': 'http://localhost/acme/acct/abcdefghijkl',
+        'nonce': 'f9a8a8c4cd2b4b6a8b5a4a3e3c0f6b8e',
+        'url': 'http://localhost/acme/order/xyz',
+    }
+    token = jws.JWS(json.dumps({}).encode())
+    token.add_signature(key, None, json.dumps(protected))
+    return token.serialize()
+
+
+def two_pass(message, key):
+    """ previous flow: decode_message() and a second deserialize in signature_check() """
+    decode_message(LOGGER, message)
+    signature_check(LOGGER, message, key)
+
+
+def single_pass(message, key):
+    """ current flow: decode once and verify the already deserialized token """
+    jwstoken = decode_jws(LOGGER, message)[5]
+    signature_check(LOGGER, jwstoken, key)
+
+
+if __name__ == '__main__':
+
+    ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    KEY = jwk.JWK.generate(kty='RSA', size=2048)
+    PUB_KEY = jwk.JWK(**json.loads(KEY.export_public()))
+    MESSAGE = signed_message(KEY)
+
+    for name, func in (('two-pass', two_pass), ('single-pass', single_pass)):
+        duration = timeit.timeit(lambda: func(MESSAGE, PUB_KEY), number=ITERATIONS)
+        print('{0:12s} {1:8.1f} us/request'.format(name, duration / ITERATIONS * 1e6))
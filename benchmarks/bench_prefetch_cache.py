@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" benchmark: redis memory per prefetched certificate
+
+compares the previous layout (key: str(tuple(domains)), value: json with the pem
+bundle, base64 der and pem key) with the compact one (hashed key, der entries,
+shared chain). needs a redis server, the benchmark uses its own key prefix.
+
+usage: python benchmarks/bench_prefetch_cache.py [domain sets] [certificates per set]
+"""
+from __future__ import print_function
+import base64
+import json
+import os
+import sys
+import uuid
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+from OpenSSL import crypto
+from acme.helper import cert_pem2der
+from zerossl_ca_handler import PrefetchingCache
+
+
+def make_cert(name, issuer=None, issuer_key=None):
+    """ rsa 2048 certificate as issued by zerossl """
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    cert = crypto.X509()
+    cert.get_subject().CN = name
+    cert.set_issuer(issuer.get_subject() if issuer else cert.get_subject())
+    cert.set_serial_number(int(uuid.uuid4().int >> 64))
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(90 * 86400)
+    cert.set_pubkey(key)
+    san = ', '.join('DNS:{0}'.format(name) for name in (name, 'www.' + name))
+    cert.add_extensions([crypto.X509Extension(b'subjectAltName', False, san.encode())])
+    cert.sign(issuer_key or key, 'sha256')
+    return cert, key
+
+
+def memory_usage(redis, pattern):
+    """ sum of MEMORY USAGE of all keys matching pattern """
+    return sum(redis.memory_usage(key, samples=0) for key in redis.scan_iter(pattern))
+
+
+if __name__ == '__main__':
+
+    DOMAIN_SETS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    PER_SET = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    CA, CA_KEY = make_cert('ZeroSSL RSA Domain Secure Site CA')
+    CHAIN = crypto.dump_certificate(crypto.FILETYPE_PEM, CA).decode()
+    ENTRIES = []
+    for set_no in range(DOMAIN_SETS):
+        domains = ('a{0}.myvdc.grid.tf'.format(set_no), 'b{0}.myvdc.grid.tf'.format(set_no))
+        for _ in range(PER_SET):
+            cert, key = make_cert(domains[0], CA, CA_KEY)
+            cert_pem = crypto.dump_certificate(crypto.FILETYPE_PEM, cert).decode()
+            ENTRIES.append((
+                domains,
+                '\n'.join([cert_pem, CHAIN, CHAIN]),
+                base64.b64encode(cert_pem2der(cert_pem)).decode(),
+                crypto.dump_privatekey(crypto.FILETYPE_PEM, key).decode()))
+
+    CACHE = PrefetchingCache({})
+    PREFIX = 'bench:{0}:'.format(uuid.uuid4().hex)
+    try:
+        # previous layout: one json value per domain set
+        for (domains, bundle, raw, key) in ENTRIES:
+            CACHE.redis.rpush(PREFIX + 'old:' + str(domains), json.dumps({'bundle': bundle, 'raw': raw, 'key': key}))
+        OLD = memory_usage(CACHE.redis, PREFIX + 'old:*')
+
+        CACHE.PREFIX = PREFIX + 'new:'
+        for (domains, bundle, raw, key) in ENTRIES:
+            CACHE.add(domains, bundle, raw, key)
+        CACHE.redis.delete(CACHE.stats_key)
+        NEW = memory_usage(CACHE.redis, PREFIX + 'new:*')
+    finally:
+        for KEY in CACHE.redis.scan_iter(PREFIX + '*'):
+            CACHE.redis.delete(KEY)
+
+    print('{0} certificates in {1} domain sets'.format(len(ENTRIES), DOMAIN_SETS))
+    print('{0:8s} {1:8.0f} bytes/certificate'.format('json', OLD / len(ENTRIES)))
+    print('{0:8s} {1:8.0f} bytes/certificate ({2:.0%})'.format('compact', NEW / len(ENTRIES), NEW / OLD))
@@ -1,8 +1,15 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from typing import List
 
 from .name import NameComClient
-from .exceptions import DomainConfigError, PrefixIsNotAllowed
+from .exceptions import DomainConfigError, PrefixIsNotAllowed, RecordsError
+from .helpers import Factory
+from .zones import get_domain_index
+
+# default number of concurrent record operations
+DEFAULT_MAX_WORKERS = 5
 
 
 class ClientType(Enum):
@@ -14,6 +21,15 @@ CLIENTS = {
 }
 
 
+class ProviderFactory(Factory):
+    def create(self, client_type, domain_name, options):
+        return CLIENTS[client_type](domain_name, {client_type.value: dict(options)})
+
+
+# provider clients per client type, domain and options, shared by all Client instances of this process
+PROVIDER_CLIENTS = ProviderFactory()
+
+
 class Domain:
     def __init__(self, name, allowed_prefixes, preferred_client_type=None):
         self.name = name
@@ -36,31 +52,21 @@ class Client:
     def __init__(self, client_types, domains: List[Domain], options):
         self.client_types = client_types
         self.domains = domains
+        self.domain_index = get_domain_index(domains)
         self.domain_clients = {}
         self.options = options
-
-    def is_same_zone(self, subdomain, prefix):
-        if not prefix:
-            return True
-        return subdomain == prefix or subdomain.endswith(prefix)
+        # record listings per zone (provider client), shared by the batch operations of this client
+        self.zone_listings = {}
+        self.lock = threading.Lock()
 
     def verify(self, host):
-        for domain in self.domains:
-            name = domain.name
+        """
+        check that records can be created for host (its domain is configured and the prefix is allowed)
 
-            if host.endswith(f".{name}"):
-                subdomain_with_prefix = host.replace(f".{name}", "")
-                try:
-                    subdomain, prefix = subdomain_with_prefix.split(".", 1)
-                except ValueError:
-                    # no prefix is provided
-                    subdomain, prefix = subdomain_with_prefix, ""
-
-                if not any([self.is_same_zone(prefix, allowed_prefix) for allowed_prefix in domain.allowed_prefixes]):
-                    raise PrefixIsNotAllowed(f"'{prefix}' prefix is not allowed in '{name}' configuration")
-                return subdomain, prefix, domain
-
-        raise DomainConfigError(f"main/parent domain of '{host}' is not configured")
+        Returns:
+            tuple: (subdomain, prefix, Domain)
+        """
+        return self.domain_index.lookup(host)
 
     def select(self, host):
         subdomain, prefix, domain = self.verify(host)
@@ -68,12 +74,13 @@ class Client:
             return subdomain, prefix, self.domain_clients[domain]
 
         if domain.preferred_client_type and domain.preferred_client_type.value in self.options:
-            client_type = CLIENTS[domain.preferred_client_type]
+            client_type = domain.preferred_client_type
         else:
             # get default (first) client type
-            client_type = CLIENTS[self.client_types[0]]
+            client_type = self.client_types[0]
 
-        client = client_type(domain.name, self.options)
+        options = tuple(sorted(dict(self.options.get(client_type.value, {})).items()))
+        client = PROVIDER_CLIENTS.get(client_type, domain.name, options)
         self.domain_clients[domain] = client
         return subdomain, prefix, client
 
@@ -84,3 +91,142 @@ class Client:
     def delete_cname_record(self, host):
         subdomain, prefix, client = self.select(host)
         return client.delete_cname_record(subdomain, prefix)
+
+    def _run_concurrently(self, func, hosts_args, max_workers):
+        """
+        run func(host, *args) for every host concurrently
+
+        Returns:
+            tuple: (list of hosts func succeeded for, dict of errors per host)
+        """
+        done, errors = [], {}
+        if not hosts_args:
+            return done, errors
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(hosts_args))) as executor:
+            futures = {host: executor.submit(func, host, *args) for host, args in hosts_args.items()}
+            for host, future in futures.items():
+                try:
+                    future.result()
+                    done.append(host)
+                except Exception as exc:
+                    errors[host] = exc
+        return done, errors
+
+    def zone_records(self, client):
+        """
+        listing of all records of a zone, fetched once and kept up to date by the batch operations of this client
+
+        Args:
+            client: provider client of the zone
+
+        Returns:
+            list of dict: records as returned by the provider
+        """
+        with self.lock:
+            if client not in self.zone_listings:
+                self.zone_listings[client] = client.list_records()
+            return self.zone_listings[client]
+
+    def _group_by_zone(self, hosts):
+        """
+        Returns:
+            tuple: (dict of provider client -> list of (host, subdomain, prefix), dict of errors per host)
+        """
+        zones, errors = {}, {}
+        for host in hosts:
+            try:
+                subdomain, prefix, client = self.select(host)
+            except Exception as exc:
+                errors[host] = exc
+                continue
+            zones.setdefault(client, []).append((host, subdomain, prefix))
+        return zones, errors
+
+    def _create_record(self, host, client, subdomain, prefix, points_to):
+        record_id = client.create_cname_record(subdomain, prefix, points_to)
+        record = {"id": record_id, "fqdn": client.get_fqdn(subdomain, prefix), "type": "CNAME", "answer": points_to}
+        with self.lock:
+            self.zone_listings[client].append(record)
+
+    def _delete_records(self, host, client, records):
+        for record in records:
+            client.delete_record(record["id"])
+            with self.lock:
+                self.zone_listings[client].remove(record)
+
+    def create_cname_records(self, records, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        create multiple cname records concurrently, if any of them fails, already created records are removed
+
+        records are grouped per zone, every zone is listed once to skip records which exist already
+
+        Args:
+            records (dict): host -> points_to
+            max_workers (int): maximum number of concurrent provider calls
+
+        Raises:
+            RecordsError: with the error of every failed host
+        """
+        zones, errors = self._group_by_zone(records)
+        tasks = {}
+        for client, hosts in zones.items():
+            try:
+                existing = {
+                    (record["fqdn"].lower(), record["answer"].rstrip(".").lower())
+                    for record in self.zone_records(client)
+                    if record.get("type", "").upper() == "CNAME"
+                }
+            except Exception as exc:
+                errors.update({host: exc for host, _, _ in hosts})
+                continue
+
+            for host, subdomain, prefix in hosts:
+                points_to = records[host]
+                if (client.get_fqdn(subdomain, prefix), points_to.rstrip(".").lower()) not in existing:
+                    tasks[host] = (client, subdomain, prefix, points_to)
+
+        created, create_errors = self._run_concurrently(self._create_record, tasks, max_workers)
+        errors.update(create_errors)
+        if errors:
+            # rollback
+            try:
+                self.delete_cname_records(created, max_workers)
+            except RecordsError as rollback_error:
+                for host, error in rollback_error.errors.items():
+                    errors[host] = f"rollback failed: {error}"
+            raise RecordsError(errors)
+
+    def delete_cname_records(self, hosts, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        delete cname records of multiple hosts concurrently
+
+        records are grouped per zone, every zone is listed once, hosts without records are skipped
+
+        Args:
+            hosts (list): hosts
+            max_workers (int): maximum number of concurrent provider calls
+
+        Raises:
+            RecordsError: with the error of every failed host
+        """
+        zones, errors = self._group_by_zone(hosts)
+        tasks = {}
+        for client, entries in zones.items():
+            try:
+                listing = self.zone_records(client)
+            except Exception as exc:
+                errors.update({host: exc for host, _, _ in entries})
+                continue
+
+            for host, subdomain, prefix in entries:
+                fqdn = client.get_fqdn(subdomain, prefix)
+                with self.lock:
+                    host_records = [record for record in listing if record["fqdn"].lower() == fqdn]
+                if host_records:
+                    tasks[host] = (client, host_records)
+
+        _, delete_errors = self._run_concurrently(self._delete_records, tasks, max_workers)
+        errors.update(delete_errors)
+        if errors:
+            raise RecordsError(errors)
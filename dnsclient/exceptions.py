@@ -8,3 +8,12 @@ class DomainConfigError(DnsConfigError):
 
 class PrefixIsNotAllowed(DomainConfigError):
     pass
+
+
+class RecordsError(Exception):
+    # errors of a batch record operation, per host
+    def __init__(self, errors, message=None):
+        if message is None:
+            message = ", ".join(f"{host}: {error}" for host, error in errors.items())
+        super().__init__(message)
+        self.errors = errors
@@ -1,3 +1,8 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import redis
 
 DEFAULT_REDIS_HOST = "localhost"
@@ -5,22 +10,158 @@ DEFAULT_REDIS_PORT = 6379
 DEFAULT_REDIS_PASSWORD = None
 DEFAULT_REDIS_DB = 0
 
+DEFAULT_FACTORY_SIZE = 32
+
 
 class Factory:
-    def __init__(self):
-        self.instances = {}
+    """
+    process-wide, thread-safe registry of instances created per arguments
+
+    at most `maxsize` instances are kept (least recently used ones are evicted), instances are
+    checked with `check()` when they are used after `health_interval` seconds and replaced if unhealthy.
+    instances taken with `use()` are closed only after the last user returned them
+    """
+
+    def __init__(self, maxsize=DEFAULT_FACTORY_SIZE, health_interval=None):
+        self.maxsize = maxsize
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        # args -> (instance, time of the last successful health check)
+        self.instances = OrderedDict()
+        # id(instance) -> number of users, evicted instances which are still in use
+        self.users = {}
+        self.retired = {}
+        self.created = 0
+        self.evicted = 0
+        self.unhealthy = 0
 
     def create(self, *args):
         raise NotImplementedError
 
-    def get(self, *args):
-        if args in self.instances:
-            return self.instances[args]
+    def check(self, instance):
+        """
+        health check, returns False if the instance should be replaced
+        """
+        return True
+
+    def close(self, instance):
+        """
+        release resources of an evicted instance
+        """
+
+    def _health_check_due(self, checked_at):
+        return self.health_interval is not None and time.monotonic() - checked_at >= self.health_interval
+
+    def _acquire(self, args):
+        # must be called with the lock held
+        entry = self.instances.get(args)
+        if entry:
+            self.instances.move_to_end(args)
+            self.users[id(entry[0])] = self.users.get(id(entry[0]), 0) + 1
+        return entry
+
+    def _release(self, instance):
+        with self.lock:
+            self.users[id(instance)] -= 1
+            if self.users[id(instance)]:
+                return
+            del self.users[id(instance)]
+            instance = self.retired.pop(id(instance), None)
+        if instance is not None:
+            self.close(instance)
+
+    def _retire(self, instance):
+        # must be called with the lock held, returns the instance if it can be closed right away
+        if id(instance) in self.users:
+            self.retired[id(instance)] = instance
+            return None
+        return instance
+
+    def _checkout(self, args):
+        with self.lock:
+            entry = self._acquire(args)
+
+        if entry and self._health_check_due(entry[1]):
+            try:
+                healthy = self.check(entry[0])
+            except Exception:
+                healthy = False
+            if healthy:
+                with self.lock:
+                    if self.instances.get(args) is entry:
+                        self.instances[args] = (entry[0], time.monotonic())
+            else:
+                with self.lock:
+                    self.unhealthy += 1
+                self.evict(*args)
+                self._release(entry[0])
+                entry = None
+
+        if entry:
+            return entry[0]
+
+        closable = []
+        with self.lock:
+            # another thread may have created it already
+            entry = self._acquire(args)
+            if entry is None:
+                self.instances[args] = (self.create(*args), time.monotonic())
+                self.created += 1
+                entry = self._acquire(args)
+                while len(self.instances) > self.maxsize:
+                    closable.append(self._retire(self.instances.popitem(last=False)[1][0]))
+                    self.evicted += 1
+        for instance in closable:
+            if instance is not None:
+                self.close(instance)
+        return entry[0]
 
-        instance = self.create(*args)
-        self.instances[args] = instance
+    def get(self, *args):
+        """
+        get the instance, it may be closed any time after eviction (see `use()`)
+        """
+        instance = self._checkout(args)
+        self._release(instance)
         return instance
 
+    @contextmanager
+    def use(self, *args):
+        """
+        get the instance, it's not closed before the block is left
+        """
+        instance = self._checkout(args)
+        try:
+            yield instance
+        finally:
+            self._release(instance)
+
+    def evict(self, *args):
+        with self.lock:
+            entry = self.instances.pop(args, None)
+            instance = None
+            if entry:
+                instance = self._retire(entry[0])
+                self.evicted += 1
+        if instance is not None:
+            self.close(instance)
+
+    def clear(self):
+        with self.lock:
+            instances = [self._retire(instance) for instance, _ in self.instances.values()]
+            self.instances.clear()
+        for instance in instances:
+            if instance is not None:
+                self.close(instance)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.instances),
+                "created": self.created,
+                "evicted": self.evicted,
+                "unhealthy": self.unhealthy,
+            }
+
 
 def get_redis_pool(options):
     host = options.get("host", DEFAULT_REDIS_HOST)
@@ -1,15 +1,90 @@
-from namecom import Name
+import requests
+from namecom import DNSMixin, DomainMixin
+from namecom.helpers import raise_for_exception, request_error_retry
+from requests.adapters import HTTPAdapter
 
 from .exceptions import DnsConfigError
 from .helpers import Factory
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+# seconds after which a cached name.com client is checked before it's used again
+HEALTH_CHECK_INTERVAL = 300
+# maximum page size of record listings
+LIST_PAGE_SIZE = 1000
+API_URL = "https://api.name.com/v4/"
+DEV_API_URL = "https://api.dev.name.com/v4/"
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    # the namecom package does not pass timeouts to requests
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class PooledName(DNSMixin, DomainMixin):
+    """
+    name.com api client with a pooled keep-alive session and request timeouts
+
+    the api methods come from the namecom package, requests are sent like `namecom.Name` does
+    """
+
+    def __init__(self, name, token, debug=False, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, api_url=None):
+        self.server = api_url or (DEV_API_URL if debug else API_URL)
+        self.client = requests.Session()
+        self.client.auth = (name, token)
+        adapter = TimeoutHTTPAdapter(timeout, pool_connections=1, pool_maxsize=pool_size)
+        self.client.mount("https://", adapter)
+        self.client.mount("http://", adapter)
+
+    @raise_for_exception
+    @request_error_retry()
+    def get(self, path, **kwargs):
+        return self.client.get(self.server + path, **kwargs)
+
+    @raise_for_exception
+    @request_error_retry()
+    def post(self, path, data):
+        return self.client.post(self.server + path, json=data)
+
+    @raise_for_exception
+    @request_error_retry()
+    def put(self, path, data):
+        return self.client.put(self.server + path, json=data)
+
+    @raise_for_exception
+    @request_error_retry()
+    def delete(self, path):
+        return self.client.delete(self.server + path)
+
+    def hello(self):
+        return self.get("hello")
+
+    def close(self):
+        self.client.close()
+
+
 class NameFactory(Factory):
     def create(self, *args):
-        return Name(*args)
+        return PooledName(*args)
+
+    def check(self, instance):
+        instance.hello()
+        return True
+
+    def close(self, instance):
+        instance.close()
 
 
 class NameComClient:
-    name_factory = NameFactory()
+    # shared by all instances (and threads) of this process
+    name_factory = NameFactory(health_interval=HEALTH_CHECK_INTERVAL)
 
     def __init__(self, domain, options):
         self.domain = domain.strip()
@@ -21,15 +96,48 @@ class NameComClient:
         self.username = options["username"]
         self.token = options["token"]
         self.debug = options.get("dev", False)
+        self.pool_size = int(options.get("pool_size", DEFAULT_POOL_SIZE))
+        self.timeout = float(options.get("timeout", DEFAULT_TIMEOUT))
+        # e.g. a local test server, default is the (dev) api of name.com
+        self.api_url = options.get("api_url")
+
+    def client(self):
+        # get it from the factory every time, unhealthy clients are replaced there.
+        # an evicted client is closed once the last thread using it is done
+        return self.name_factory.use(self.username, self.token, self.debug, self.pool_size, self.timeout, self.api_url)
+
+    def get_host(self, subdomain, prefix):
+        return ".".join(label for label in (subdomain, prefix) if label).lower()
 
-        self.client = self.name_factory.get(self.username, self.token, self.debug)
+    def get_fqdn(self, subdomain, prefix):
+        """
+        fully qualified name of a record as listed by the api (with a trailing dot)
+        """
+        return f"{self.get_host(subdomain, prefix)}.{self.domain}."
+
+    def list_records(self):
+        """
+        all records of the zone
+        """
+        records = []
+        page = 1
+        with self.client() as client:
+            while page:
+                data = client.list_records(self.domain, page=page, perPage=LIST_PAGE_SIZE)
+                records.extend(data.get("records", []))
+                page = data.get("nextPage")
+        return records
 
     def create_cname_record(self, subdomain, prefix, points_to):
-        host = f"{subdomain}.{prefix}".lower()
-        resp = self.client.create_record(self.domain, host, "cname", points_to)
+        with self.client() as client:
+            resp = client.create_record(self.domain, self.get_host(subdomain, prefix), "cname", points_to)
         return resp["id"]
 
+    def delete_record(self, record_id):
+        with self.client() as client:
+            client.delete_record(self.domain, record_id)
+
     def delete_cname_record(self, subdomain, prefix):
-        host = f"{subdomain}.{prefix}".lower()
-        for record in self.client.list_records_for_host(self.domain, host):
-            self.client.delete_record(record["fqdn"][:-1], record["id"])
+        with self.client() as client:
+            for record in client.list_records_for_host(self.domain, self.get_host(subdomain, prefix)):
+                self.delete_record(record["id"])
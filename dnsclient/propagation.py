@@ -0,0 +1,116 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dns.exception
+import dns.resolver
+
+from .resolver import get_resolver
+
+# timeout of a single query to an authoritative nameserver
+DEFAULT_QUERY_TIMEOUT = 3
+DEFAULT_PROPAGATION_TIMEOUT = 120
+DEFAULT_PROPAGATION_INTERVAL = 2
+MAX_WORKERS = 16
+
+
+class PropagationChecker:
+    """
+    check if cname records are visible on all authoritative nameservers of their zones
+    """
+
+    def __init__(self, query_timeout=DEFAULT_QUERY_TIMEOUT, logger=None, clock=time.monotonic, sleep=time.sleep):
+        self.query_timeout = query_timeout
+        self.logger = logger
+        self.clock = clock
+        self.sleep = sleep
+        # zone -> addresses of its authoritative nameservers
+        self.zone_nameservers = {}
+
+    def nameservers(self, zone):
+        """
+        get addresses of the authoritative nameservers of a zone
+
+        Returns:
+            list of str: addresses, empty if they cannot be resolved
+        """
+        if zone not in self.zone_nameservers:
+            resolver = get_resolver()
+            addresses = []
+            try:
+                for record in resolver.query(zone, "NS"):
+                    address, _ = resolver.address_get(str(record.target))
+                    if address:
+                        addresses.append(address)
+            except dns.exception.DNSException as exc:
+                if self.logger:
+                    self.logger.error(f"PropagationChecker: cannot get nameservers of {zone}: {exc}")
+            self.zone_nameservers[zone] = addresses
+        return self.zone_nameservers[zone]
+
+    def query(self, nameserver, host):
+        """
+        query a cname record directly at a nameserver (no caching)
+
+        Returns:
+            str: target without the trailing dot or None
+        """
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = [nameserver]
+        try:
+            answer = resolver.resolve(host, "CNAME", lifetime=self.query_timeout, search=False)
+        except dns.exception.DNSException:
+            return None
+        return str(answer[0].target).rstrip(".").lower()
+
+    def check(self, records):
+        """
+        query all authoritative nameservers for all records in parallel
+
+        Args:
+            records (dict): host -> (zone, expected target)
+
+        Returns:
+            set: hosts visible with the expected target on every nameserver of their zone
+        """
+        queries = {}
+        for host, (zone, _) in records.items():
+            for nameserver in self.nameservers(zone):
+                queries[(host, nameserver)] = None
+        if not queries:
+            return set()
+
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(queries))) as executor:
+            futures = {key: executor.submit(self.query, key[1], key[0]) for key in queries}
+            answers = {key: future.result() for key, future in futures.items()}
+
+        visible = set()
+        for host, (zone, target) in records.items():
+            nameservers = self.nameservers(zone)
+            if nameservers and all(answers[(host, ns)] == target.rstrip(".").lower() for ns in nameservers):
+                visible.add(host)
+        return visible
+
+    def wait(self, records, timeout=DEFAULT_PROPAGATION_TIMEOUT, interval=DEFAULT_PROPAGATION_INTERVAL):
+        """
+        wait until all records are visible or timeout is reached
+
+        Args:
+            records (dict): host -> (zone, expected target)
+            timeout (float): maximum time to wait in seconds
+            interval (float): delay between checks in seconds
+
+        Returns:
+            dict: host -> propagation delay in seconds or None if the record did not become visible
+        """
+        start = self.clock()
+        delays = {host: None for host in records}
+        # records of zones without known nameservers cannot be checked
+        pending = {host: record for host, record in records.items() if self.nameservers(record[0])}
+        while pending:
+            for host in self.check(pending):
+                delays[host] = self.clock() - start
+                del pending[host]
+            if not pending or self.clock() - start + interval > timeout:
+                break
+            self.sleep(interval)
+        return delays
@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+# challenge records change while clients retry, never cache them for long
+CHALLENGE_PREFIX = "_acme-challenge."
+DEFAULT_CHALLENGE_TTL = 5
+DEFAULT_NEGATIVE_TTL = 60
+DEFAULT_MAX_TTL = 3600
+DEFAULT_CACHE_SIZE = 10000
+
+# used to query A and AAAA records in parallel
+QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dns-query")
+
+
+def negative_ttl_get(error, default):
+    """negative caching ttl (RFC 2308: min of SOA ttl and SOA minimum), default without SOA"""
+    responses = []
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        try:
+            responses = list(error.responses().values())
+        except (AttributeError, KeyError):
+            pass
+    elif error.kwargs.get("response"):
+        responses = [error.kwargs["response"]]
+
+    for response in responses:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return default
+
+
+class CachingResolver:
+    """dns resolver with a positive/negative cache honoring record ttls"""
+
+    def __init__(
+        self,
+        nameservers=None,
+        timeout=None,
+        challenge_ttl=DEFAULT_CHALLENGE_TTL,
+        negative_ttl=DEFAULT_NEGATIVE_TTL,
+        max_ttl=DEFAULT_MAX_TTL,
+        maxsize=DEFAULT_CACHE_SIZE,
+    ):
+        if nameservers:
+            self.resolver = dns.resolver.Resolver(configure=False)
+            self.resolver.nameservers = list(nameservers)
+        else:
+            self.resolver = dns.resolver.Resolver()
+        self.timeout = timeout
+        self.challenge_ttl = challenge_ttl
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.maxsize = maxsize
+
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl_clamp(self, name, ttl):
+        if name.lower().startswith(CHALLENGE_PREFIX):
+            return min(ttl, self.challenge_ttl)
+        return min(ttl, self.max_ttl)
+
+    def _cache_get(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry:
+                del self.cache[key]
+            self.misses += 1
+            return None
+
+    def _cache_set(self, key, ttl, records, error):
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.cache[key] = (time.monotonic() + ttl, records, error)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def query(self, name, rdtype):
+        """answers and NXDOMAIN/NoAnswer responses are cached, other errors are not"""
+        key = (name.lower().rstrip("."), rdtype)
+        entry = self._cache_get(key)
+        if entry:
+            _, records, error = entry
+            if error:
+                # a fresh exception per caller, instances are not shared between threads
+                error_class, kwargs = error
+                raise error_class(**kwargs)
+            return records
+
+        try:
+            answer = self.resolver.resolve(name, rdtype, lifetime=self.timeout, search=False)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as error:
+            ttl = self._ttl_clamp(name, negative_ttl_get(error, self.negative_ttl))
+            self._cache_set(key, ttl, None, (type(error), dict(error.kwargs)))
+            raise
+
+        records = list(answer)
+        # expiration honors the smallest ttl of the whole (cname) chain
+        ttl = self._ttl_clamp(name, int(answer.expiration - time.time()))
+        self._cache_set(key, ttl, records, None)
+        return records
+
+    def address_get(self, host):
+        """(address or None, invalid), A and AAAA are queried in parallel and A is preferred"""
+        futures = [QUERY_EXECUTOR.submit(self._address_query, host, rrtype) for rrtype in ("A", "AAAA")]
+        result, invalid = None, False
+        for future in futures:
+            result, invalid = future.result()
+            if result is not None:
+                break
+        return result, invalid
+
+    def _address_query(self, host, rrtype):
+        try:
+            records = self.query(host, rrtype)
+            return str(records[0]), False
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return None, True
+        except Exception:
+            return None, False
+
+    def txt_get(self, name):
+        return self.query(name, "TXT")[-1].strings[0]
+
+    def cname_get(self, name):
+        return str(self.query(name, "CNAME")[0].target).rstrip(".")
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+# process-wide resolvers, one per nameserver list and timeout
+RESOLVERS = {}
+RESOLVERS_LOCK = threading.Lock()
+
+
+def get_resolver(nameservers=None, timeout=None):
+    key = (tuple(nameservers or ()), timeout)
+    with RESOLVERS_LOCK:
+        if key not in RESOLVERS:
+            RESOLVERS[key] = CachingResolver(nameservers, timeout)
+        return RESOLVERS[key]
+
+
+def get_resolver_stats():
+    with RESOLVERS_LOCK:
+        return {key: resolver.stats() for key, resolver in RESOLVERS.items()}
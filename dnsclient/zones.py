@@ -0,0 +1,111 @@
+import threading
+
+from .exceptions import DomainConfigError, PrefixIsNotAllowed
+
+# key of the value stored at a node (labels are always strings)
+VALUE = None
+
+
+class LabelTrie:
+    """
+    trie over reversed dns labels, e.g. `a.grid.tf` is stored as tf -> grid -> a
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, name, value):
+        """
+        add a name, an empty name matches everything
+        """
+        node = self.root
+        for label in reversed(name.split(".") if name else []):
+            node = node.setdefault(label, {})
+        node.setdefault(VALUE, value)
+
+    def longest_match(self, labels, max_depth=None):
+        """
+        find the longest stored name the given labels end with
+
+        Args:
+            labels (list of str): labels of the name (in normal order)
+            max_depth (int, optional): maximum number of labels to match
+
+        Returns:
+            tuple: (number of matched labels, value) or (0, None) if nothing matches
+        """
+        if max_depth is None:
+            max_depth = len(labels)
+
+        node = self.root
+        depth, value = 0, node.get(VALUE)
+        for position in range(1, max_depth + 1):
+            node = node.get(labels[-position])
+            if node is None:
+                break
+            if VALUE in node:
+                depth, value = position, node[VALUE]
+        return depth, value
+
+
+class DomainIndex:
+    """
+    lookup of the configured domain (zone) and allowed prefix of a host in O(labels)
+    """
+
+    def __init__(self, domains):
+        self.zones = LabelTrie()
+        for domain in domains:
+            prefixes = LabelTrie()
+            for prefix in domain.allowed_prefixes:
+                prefixes.insert(prefix, True)
+            self.zones.insert(domain.name, (domain, prefixes))
+
+    def lookup(self, host):
+        """
+        split host into subdomain and prefix under the most specific configured domain
+
+        Raises:
+            DomainConfigError: if no parent domain is configured
+            PrefixIsNotAllowed: if the prefix is not allowed for this domain
+
+        Returns:
+            tuple: (subdomain, prefix, Domain)
+        """
+        labels = host.lower().rstrip(".").split(".")
+        # at least one label must be left for the subdomain
+        depth, entry = self.zones.longest_match(labels, len(labels) - 1)
+        if entry is None:
+            raise DomainConfigError(f"main/parent domain of '{host}' is not configured")
+
+        domain, prefixes = entry
+        subdomain, prefix_labels = labels[0], labels[1 : len(labels) - depth]
+        prefix = ".".join(prefix_labels)
+        if prefixes.longest_match(prefix_labels)[1] is None:
+            raise PrefixIsNotAllowed(f"'{prefix}' prefix is not allowed in '{domain.name}' configuration")
+        return subdomain, prefix, domain
+
+
+# indexes per domain configuration, shared by all clients of this process
+DOMAIN_INDEXES = {}
+DOMAIN_INDEXES_LOCK = threading.Lock()
+MAX_DOMAIN_INDEXES = 16
+
+
+def get_domain_index(domains):
+    """
+    get a shared index of the domains, it's built once per configuration
+
+    Args:
+        domains (list of Domain): configured domains
+
+    Returns:
+        DomainIndex
+    """
+    key = tuple((domain.name, tuple(domain.allowed_prefixes), domain.preferred_client_type) for domain in domains)
+    with DOMAIN_INDEXES_LOCK:
+        if key not in DOMAIN_INDEXES:
+            if len(DOMAIN_INDEXES) >= MAX_DOMAIN_INDEXES:
+                DOMAIN_INDEXES.clear()
+            DOMAIN_INDEXES[key] = DomainIndex(domains)
+        return DOMAIN_INDEXES[key]
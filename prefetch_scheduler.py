@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+""" keep prefetched certificates of the domain sets in the [prefetch] section cached """
+# pylint: disable=C0413
+import os
+import signal
+import sys
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from acme.helper import load_config, logger_setup
+from zerossl_ca_handler import CAhandler, PrefetchScheduler, get_prefetch_config
+
+if __name__ == '__main__':
+
+    CONFIG = load_config()
+    DEBUG = CONFIG.getboolean('DEFAULT', 'debug', fallback=False)
+    LOGGER = logger_setup(DEBUG)
+
+    OPTIONS = get_prefetch_config(CONFIG)
+    if not OPTIONS['domain_sets']:
+        LOGGER.error('no domain sets configured in the [prefetch] section')
+        sys.exit(1)
+
+    SCHEDULER = PrefetchScheduler(lambda: CAhandler(DEBUG, LOGGER), logger=LOGGER, **OPTIONS)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_args: SCHEDULER.stopped.set())
+
+    LOGGER.info('prefetching certificates for {0} domain sets'.format(len(OPTIONS['domain_sets'])))
+    SCHEDULER.run_forever()
+    SCHEDULER.stop()
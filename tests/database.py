@@ -0,0 +1,74 @@
+""" test database and certificate fixtures shared by the database tests """
+import base64
+import logging
+from unittest import TestCase
+
+from django.db import connection
+from OpenSSL import crypto
+
+from acme import db_handler  # noqa: F401 (sets up django)
+from app.models import Account, Order, Status
+
+STATUS_LIST = ('invalid', 'pending', 'ready', 'processing', 'valid', 'expired', 'deactivated', 'revoked')
+
+
+def make_key():
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    return key
+
+
+def make_cert(key):
+    cert = crypto.X509()
+    cert.get_subject().CN = "example.com"
+    cert.set_issuer(cert.get_subject())
+    cert.set_serial_number(4711)
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(86400)
+    cert.set_pubkey(key)
+    cert.add_extensions([crypto.X509Extension(b"subjectAltName", False, b"DNS:example.com, DNS:www.example.com")])
+    cert.sign(key, "sha256")
+    return cert
+
+
+def make_cert_raw(key=None):
+    cert = make_cert(key or make_key())
+    return base64.b64encode(crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)).decode()
+
+
+def make_csr(key):
+    """ csr as sent in the finalize request (base64url encoded der) """
+    req = crypto.X509Req()
+    req.get_subject().CN = "example.com"
+    req.set_pubkey(key)
+    req.sign(key, "sha256")
+    return base64.urlsafe_b64encode(crypto.dump_certificate_request(crypto.FILETYPE_ASN1, req)).decode().rstrip("=")
+
+
+class DatabaseTestCase(TestCase):
+    """ runs against a freshly migrated test database """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.old_name = connection.creation.create_test_db(verbosity=0)
+        for pk, name in enumerate(STATUS_LIST, 1):
+            Status.objects.get_or_create(pk=pk, name=name)
+
+    @classmethod
+    def tearDownClass(cls):
+        connection.creation.destroy_test_db(cls.old_name, verbosity=0)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.logger = logging.getLogger("test")
+        self.account = Account.objects.create(name="account", jwk="{}", alg="RS256", contact="mailto:a@example.com")
+
+    def tearDown(self):
+        Account.objects.all().delete()
+
+    def create_orders(self, count, expires, status=2):
+        Order.objects.bulk_create(
+            Order(name=f"order{i}", account=self.account, identifiers="[]", expires=expires, status_id=status) for i in range(count)
+        )
+        return list(Order.objects.order_by("id"))
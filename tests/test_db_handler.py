@@ -0,0 +1,112 @@
+import importlib
+import re
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from acme.db_handler import DBstore
+from app.models import Account, Authorization, Certificate, Challenge, Housekeeping, Nonce
+from tests.database import DatabaseTestCase
+
+# reports read whole tables, the revocation check compares the full cert_raw
+FULL_SCANS = {
+    "accountlist_get": {"app_account"},
+    "certificatelist_get": {"app_certificate"},
+    "certificate_account_check": {"app_certificate"},
+}
+
+# (method, args, number of statements without transaction control)
+CASES = [
+    ("account_add", ({"name": "new", "jwk": '{"n": "new"}', "alg": "RS256", "contact": "c"},), 4),
+    ("account_add", ({"name": "dup", "jwk": '{"n": "1"}', "alg": "RS256", "contact": "c"},), 1),
+    ("account_lookup", ("jwk", '{"n": "1"}'), 1),
+    ("account_lookup", ("name", "account"), 1),
+    ("accountlist_get", (), 1),
+    ("authorization_lookup", ("name", "authz"), 1),
+    ("authorization_lookup", ("order__name", "order0"), 1),
+    ("authorizations_expired_search", ("expires", 500, ("id", "name", "status__name"), "<="), 1),
+    ("certificate_account_check", ("account", "raw"), 1),
+    ("certificate_lookup", ("name", "cert"), 1),
+    ("certificate_lookup", ("order__name", "order0"), 1),
+    ("certificatelist_get", (), 1),
+    ("certificates_processing_search", ("key_fingerprint", "fingerprint"), 1),
+    ("certificates_search", ("expire_uts", 500, ("id", "name"), "<="), 1),
+    ("certificates_search", ("issue_uts", 0, ("id", "name")), 1),
+    ("challenge_lookup", ("name", "challenge"), 1),
+    ("challenge_status_change", ("challenge", "pending", "processing"), 2),
+    ("challenges_search", ("authorization__name", "authz", ("name", "type", "status__name", "token")), 1),
+    ("challenges_search", ("token", "token", ("name", "type", "status__name", "token")), 1),
+    ("dbversion_get", (), 1),
+    ("jwk_hash_get", ("account",), 1),
+    ("jwk_load", ("account",), 1),
+    ("nonce_check", ("nonce",), 1),
+    ("nonce_consume", ("nonce",), 1),
+    ("order_lookup", ("name", "order0"), 1),
+    ("orders_invalid_search", ("expires", 500, ("id", "name", "status__name"), "<="), 1),
+]
+
+
+@skipUnless(connection.vendor == "sqlite", "query plans are checked on sqlite")
+class TestQueryPlans(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dbstore = DBstore(False, self.logger)
+        self.account.jwk_hash = self.dbstore._jwk_hash('{"n": "1"}')
+        self.account.jwk = '{"n": "1"}'
+        self.account.save()
+        order = self.create_orders(1, 100)[0]
+        authz = Authorization.objects.create(name="authz", order=order, type="dns", value="example.com", expires=100)
+        Challenge.objects.create(name="challenge", authorization=authz, type="http-01", token="token")
+        Certificate.objects.create(name="cert", order=order, cert_raw="raw", key_fingerprint="fingerprint", expire_uts=100)
+        Nonce.objects.create(nonce="nonce")
+        Housekeeping.objects.create(name="dbversion", value="1")
+
+    def tearDown(self):
+        Nonce.objects.all().delete()
+        Housekeeping.objects.all().delete()
+        super().tearDown()
+
+    def full_scans(self, sql):
+        """ tables sqlite reads without index """
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        # the status table has eight rows
+        return {match.group(1) for match in map(re.compile(r"^SCAN (?:TABLE )?(\w+)").match, plan) if match} - {"app_status"}
+
+    def test_queries(self):
+        for (method, args, count) in CASES:
+            with self.subTest(method=method, args=args):
+                with CaptureQueriesContext(connection) as queries:
+                    result = getattr(self.dbstore, method)(*args)
+                    if method.endswith("list_get"):
+                        # (field_list, iterator)
+                        list(result[1])
+                    elif hasattr(result, "iterator"):
+                        list(result)
+                statements = [query["sql"] for query in queries if not query["sql"].startswith(("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT"))]
+                self.assertEqual(len(statements), count, statements)
+                for sql in statements:
+                    if sql.startswith(("SELECT", "UPDATE", "DELETE")):
+                        self.assertEqual(self.full_scans(sql), FULL_SCANS.get(method, set()), sql)
+
+    def test_jwk_lookup_uses_hash(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.dbstore.account_lookup("jwk", '{"n": "1"}')["name"], "account")
+        self.assertIn("jwk_hash", queries[0]["sql"])
+        self.assertIsNone(self.dbstore.account_lookup("jwk", '{"n": "2"}'))
+
+    def test_jwk_hash_backfill(self):
+        migration = importlib.import_module("app.migrations.0004_indexes")
+        Account.objects.update(jwk_hash="")
+        self.assertIsNone(self.dbstore.account_lookup("jwk", '{"n": "1"}'))
+        Account.objects.bulk_create(Account(name=f"backfill{i}", jwk=f'{{"n": "b{i}"}}', alg="RS256", contact="c") for i in range(2))
+        # more accounts than fit in one batch
+        with patch.object(migration, "BATCH_SIZE", 2), self.assertLogs(migration.__name__, "INFO") as logs:
+            migration.jwk_hashes_backfill(apps, None)
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(self.dbstore.account_lookup("jwk", '{"n": "1"}')["name"], "account")
+        self.assertEqual(self.dbstore.account_lookup("jwk", '{"n": "b1"}')["name"], "backfill1")
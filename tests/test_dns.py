@@ -1,7 +1,16 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from os import environ
 from unittest import TestCase
+from unittest.mock import patch
+from urllib.parse import urlparse
 
-from dnsclient import Client, ClientType, Domain, DomainConfigError, PrefixIsNotAllowed
+from dnsclient import CLIENTS, PROVIDER_CLIENTS, Client, ClientType, Domain, DomainConfigError, PrefixIsNotAllowed
+from dnsclient.exceptions import RecordsError
+from dnsclient.helpers import Factory
 
 
 TEST_DOMAINS = [
@@ -51,3 +60,213 @@ class DNSClientMixin:
 class TestNameCom(DNSClientMixin, TestCase):
     def setUp(self):
         self.client = Client(ClientType.NAMECOM, domains=TEST_DOMAINS, options=TEST_OPTIONS_NAMECOM)
+
+
+class FakeNameComHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, method):
+        # /v4/domains/<domain>/records[/<id>]
+        path = urlparse(self.path).path.split("/")[3:]
+        self.server.calls.append((method, path[0]))
+        return path[0], path[2] if len(path) > 2 else None
+
+    def do_GET(self):
+        domain, _ = self.route("list")
+        records = [record for record in self.server.records.values() if record["domainName"] == domain]
+        self.reply(200, {"records": records})
+
+    def do_POST(self):
+        domain, _ = self.route("create")
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        fqdn = f"{data['host']}.{domain}."
+        if fqdn in self.server.failing:
+            return self.reply(500, {"message": "provider error"})
+        self.server.next_id += 1
+        record = {"id": self.server.next_id, "domainName": domain, "fqdn": fqdn, "type": data["type"].upper(), "answer": data["answer"]}
+        self.server.records[record["id"]] = record
+        self.reply(200, record)
+
+    def do_DELETE(self):
+        _, record_id = self.route("delete")
+        self.server.records.pop(int(record_id))
+        self.reply(200, {})
+
+    def log_message(self, *args):
+        pass
+
+
+class TestBatchRecords(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeNameComHandler)
+        self.server.records, self.server.calls, self.server.failing, self.server.next_id = {}, [], set(), 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        api_url = f"http://127.0.0.1:{self.server.server_address[1]}/v4/"
+        self.options = {"namecom": {"username": "user", "token": "token", "api_url": api_url}}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        PROVIDER_CLIENTS.clear()
+
+    def client(self):
+        return Client([ClientType.NAMECOM], TEST_DOMAINS, self.options)
+
+    def calls(self, method):
+        return sorted(domain for call, domain in self.server.calls if call == method)
+
+    def fqdns(self):
+        return sorted(record["fqdn"] for record in self.server.records.values())
+
+    def test_create_and_delete(self):
+        client = self.client()
+        records = {f"{subdomain}.test.grid.tf": "dom1.com" for subdomain in TEST_SUBDOMAINS}
+        records["a.test.3bot.tf"] = "dom2.com"
+        client.create_cname_records(records, max_workers=2)
+        self.assertEqual(self.fqdns(), sorted(f"{host}." for host in records))
+
+        client.delete_cname_records(list(records), max_workers=2)
+        self.assertEqual(self.server.records, {})
+        # one listing per zone for both operations
+        self.assertEqual(self.calls("list"), ["3bot.tf", "grid.tf"])
+        self.assertEqual(len(self.calls("create")), 4)
+        self.assertEqual(len(self.calls("delete")), 4)
+
+    def test_redundant_calls_are_skipped(self):
+        self.client().create_cname_records({"a.test.grid.tf": "dom1.com"})
+        self.server.calls.clear()
+
+        client = self.client()
+        # exists already
+        client.create_cname_records({"a.test.grid.tf": "dom1.com."})
+        self.assertEqual(self.calls("create"), [])
+        # no records
+        client.delete_cname_records(["a.test.grid.tf", "b.test.grid.tf"])
+        self.assertEqual(self.calls("delete"), ["grid.tf"])
+        self.assertEqual(self.calls("list"), ["grid.tf"])
+
+    def test_rollback_on_error(self):
+        self.server.failing.add("b.test.grid.tf.")
+        records = {f"{subdomain}.test.grid.tf": "dom1.com" for subdomain in TEST_SUBDOMAINS}
+        records["a.notconfigured.tf"] = "dom1.com"
+        with self.assertRaises(RecordsError) as ctx:
+            self.client().create_cname_records(records)
+
+        self.assertEqual(set(ctx.exception.errors), {"b.test.grid.tf", "a.notconfigured.tf"})
+        self.assertEqual(self.server.records, {})
+
+
+class CountingFactory(Factory):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.healthy = True
+        self.closed = []
+
+    def create(self, *args):
+        time.sleep(0.01)
+        return object()
+
+    def check(self, instance):
+        return self.healthy
+
+    def close(self, instance):
+        self.closed.append(instance)
+
+
+class TestFactory(TestCase):
+    def test_shared_between_threads(self):
+        factory = CountingFactory()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            instances = set(executor.map(lambda _: factory.get("user", "token"), range(32)))
+        self.assertEqual(len(instances), 1)
+        self.assertEqual(factory.stats()["created"], 1)
+
+    def test_bounded(self):
+        factory = CountingFactory(maxsize=2)
+        first = factory.get("a")
+        factory.get("b")
+        factory.get("a")
+        factory.get("c")
+        # "b" was least recently used
+        self.assertEqual(list(factory.instances), [("a",), ("c",)])
+        self.assertIs(factory.get("a"), first)
+        self.assertEqual(len(factory.closed), 1)
+
+    def test_unhealthy_instances_are_replaced(self):
+        factory = CountingFactory(health_interval=0)
+        first = factory.get("a")
+        self.assertIs(factory.get("a"), first)
+        factory.healthy = False
+        second = factory.get("a")
+        self.assertIsNot(second, first)
+        self.assertEqual(factory.closed, [first])
+        self.assertEqual(factory.stats()["unhealthy"], 1)
+
+    def test_evicted_instances_in_use_are_not_closed(self):
+        factory = CountingFactory(maxsize=1)
+        with factory.use("a") as first:
+            factory.get("b")
+            self.assertEqual(factory.closed, [])
+        self.assertEqual(factory.closed, [first])
+
+    def test_unhealthy_instances_in_use_are_not_closed(self):
+        factory = CountingFactory(health_interval=0)
+        with factory.use("a") as first:
+            factory.healthy = False
+            self.assertIsNot(factory.get("a"), first)
+            self.assertEqual(factory.closed, [])
+        self.assertEqual(factory.closed, [first])
+
+
+class FakeProvider:
+    def __init__(self, domain, options):
+        self.domain = domain
+        self.options = options
+
+
+class TestProviderRegistry(TestCase):
+    def tearDown(self):
+        PROVIDER_CLIENTS.clear()
+
+    def test_shared_between_clients(self):
+        options = {"namecom": {"username": "user", "token": "token"}}
+        with patch.dict(CLIENTS, {ClientType.NAMECOM: FakeProvider}):
+            _, _, first = Client([ClientType.NAMECOM], TEST_DOMAINS, options).select("a.test.grid.tf")
+            _, _, second = Client([ClientType.NAMECOM], TEST_DOMAINS, options).select("b.test.grid.tf")
+            _, _, other = Client([ClientType.NAMECOM], TEST_DOMAINS, options).select("a.test.3bot.tf")
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(first.options, options)
+
+
+class TestVerify(TestCase):
+    def setUp(self):
+        self.client = Client([ClientType.NAMECOM], TEST_DOMAINS + [Domain("sub.grid.tf", ["gw"])], {})
+
+    def test_not_configured(self):
+        for host in ("hello.test.mydom.tf", "grid.tf", "anothergrid.tf", "tf"):
+            with self.assertRaises(DomainConfigError):
+                self.client.verify(host)
+
+    def test_prefix(self):
+        with self.assertRaises(PrefixIsNotAllowed):
+            self.client.verify("a.grid.tf")
+        # prefixes match whole labels
+        with self.assertRaises(PrefixIsNotAllowed):
+            self.client.verify("a.xtest.grid.tf")
+
+        self.assertEqual(self.client.verify("a.test.grid.tf")[:2], ("a", "test"))
+        self.assertEqual(self.client.verify("A.b.Test.Devnet.grid.tf.")[:2], ("a", "b.test.devnet"))
+
+    def test_longest_match(self):
+        subdomain, prefix, domain = self.client.verify("a.gw.sub.grid.tf")
+        self.assertEqual((subdomain, prefix, domain.name), ("a", "gw", "sub.grid.tf"))
+        self.assertEqual(self.client.verify("a.test.3bot.tf")[2].name, "3bot.tf")
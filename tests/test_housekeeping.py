@@ -0,0 +1,188 @@
+import csv
+import importlib
+import json
+import os
+import tempfile
+import tracemalloc
+
+from django.apps import apps
+
+from acme.authorization import Authorization as AuthorizationHandler
+from acme.certificate import Certificate as CertificateHandler
+from acme.helper import cert_info_get
+from acme.housekeeping import Housekeeping
+from acme.order import Order as OrderHandler
+from app.models import Authorization, Certificate, Order
+from tests.database import DatabaseTestCase, make_cert_raw
+
+
+class TestBulkCleanup(DatabaseTestCase):
+    def test_certificate_cleanup(self):
+        order = self.create_orders(1, 0)[0]
+        Certificate.objects.bulk_create(
+            Certificate(name=f"cert{i}", order=order, cert="pem", cert_raw="raw", expire_uts=100 if i < 5 else 1000) for i in range(7)
+        )
+        with CertificateHandler(False, None, self.logger) as certificate:
+            with self.assertLogs("test", "INFO") as logs:
+                (_field_list, report_list) = certificate.cleanup(timestamp=500)
+        self.assertEqual(len(report_list), 5)
+        self.assertEqual(Certificate.objects.filter(cert__startswith="removed by").count(), 5)
+        self.assertEqual(Certificate.objects.filter(cert="pem").count(), 2)
+        self.assertIn("INFO:test:DBStore.certificates_update(): 5/5 rows processed", logs.output)
+
+        with CertificateHandler(False, None, self.logger) as certificate:
+            (_field_list, report_list) = certificate.cleanup(timestamp=500, purge=True)
+        self.assertEqual(len(report_list), 5)
+        self.assertEqual(Certificate.objects.count(), 2)
+
+    def test_chunks(self):
+        order = self.create_orders(1, 0)[0]
+        Certificate.objects.bulk_create(Certificate(name=f"cert{i}", order=order, expire_uts=100) for i in range(25))
+        with CertificateHandler(False, None, self.logger) as certificate:
+            with self.assertLogs("test", "INFO") as logs:
+                certificate.dbstore.certificates_update(list(Certificate.objects.values_list("id", flat=True)), {"cert": "x"}, chunk_size=10)
+        self.assertEqual(
+            [line.rsplit(": ", 1)[1] for line in logs.output],
+            ["10/25 rows processed", "20/25 rows processed", "25/25 rows processed"],
+        )
+        self.assertEqual(Certificate.objects.filter(cert="x").count(), 25)
+
+    def test_order_invalidate(self):
+        orders = self.create_orders(4, 100)
+        Order.objects.filter(id=orders[0].id).update(expires=1000)
+        Order.objects.filter(id=orders[1].id).update(status_id=1)
+        with OrderHandler(False, None, self.logger) as order:
+            (_field_list, order_list) = order.invalidate(timestamp=500)
+        self.assertEqual(sorted(entry["name"] for entry in order_list), ["order2", "order3"])
+        self.assertEqual(Order.objects.filter(status__name="invalid").count(), 3)
+
+    def test_authorization_invalidate(self):
+        order = self.create_orders(1, 0)[0]
+        Authorization.objects.bulk_create(
+            Authorization(name=f"authz{i}", order=order, type="dns", value="example.com", expires=expires)
+            for i, expires in enumerate((0, 100, 100, 1000))
+        )
+        with AuthorizationHandler(False, None, self.logger) as authorization:
+            (_field_list, authz_list) = authorization.invalidate(timestamp=500)
+        self.assertEqual(sorted(entry["name"] for entry in authz_list), ["authz1", "authz2"])
+        self.assertEqual(sorted(Authorization.objects.filter(status__name="expired").values_list("name", flat=True)), ["authz1", "authz2"])
+
+
+class TestReports(DatabaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cert_raw = make_cert_raw()
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_orders(1, 0)[0]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.report_name = os.path.join(self.tmpdir.name, "report")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def create_certs(self, count):
+        Certificate.objects.bulk_create(
+            Certificate(name=f"cert{i}", order=self.order, cert_raw=self.cert_raw, serial="4711", issue_uts=1000, expire_uts=2000)
+            for i in range(count)
+        )
+
+    def certreport(self, report_format):
+        with Housekeeping(False, self.logger) as housekeeping:
+            return housekeeping.certreport_dump(self.report_name, report_format)
+
+    def test_formats(self):
+        self.create_certs(3)
+        with Housekeeping(False, self.logger) as housekeeping:
+            cert_list = housekeeping.certreport_get()
+        self.assertEqual(len(cert_list), 3)
+        self.assertEqual(cert_list[0]["certificate.serial"], 4711)
+        self.assertEqual(cert_list[0]["certificate.issue_date"], "1970-01-01 00:16:40")
+
+        self.assertEqual(self.certreport("csv"), 3)
+        with open(self.report_name + ".csv", newline="") as file_:
+            rows = list(csv.reader(file_))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0][:3], ["certificate.id", "certificate.name", "certificate.serial"])
+        self.assertEqual(rows[0][7:12], ["certificate.issue_date", "certificate.expire_date", "certificate.issue_uts", "certificate.expire_uts", "order.id"])
+        self.assertEqual(rows[0][-4:], ["account.alg", "certificate.issuer", "certificate.san", "certificate.key_fingerprint"])
+        self.assertEqual(rows[1][1:3], ["cert0", "4711"])
+
+        self.assertEqual(self.certreport("ndjson"), 3)
+        with open(self.report_name + ".ndjson") as file_:
+            lines = file_.read().splitlines()
+        self.assertEqual([json.loads(line)["certificate.name"] for line in lines], ["cert0", "cert1", "cert2"])
+        self.assertEqual(json.loads(lines[0])["certificate.serial"], 4711)
+
+        self.assertEqual(self.certreport("json"), 3)
+        with open(self.report_name + ".json") as file_:
+            content = file_.read()
+        self.assertEqual(content, json.dumps(json.loads(content), ensure_ascii=False, indent=4))
+        self.assertEqual(len(json.loads(content)), 3)
+
+    def test_get_returns_list(self):
+        self.create_certs(2)
+        with Housekeeping(False, self.logger) as housekeeping:
+            cert_list = housekeeping.certreport_get(report_format="csv", report_name=self.report_name)
+        self.assertEqual([cert["certificate.name"] for cert in cert_list], ["cert0", "cert1"])
+        with open(self.report_name + ".csv", newline="") as file_:
+            self.assertEqual(len(list(csv.reader(file_))), 3)
+
+    def test_empty_report_is_not_dumped(self):
+        self.assertEqual(self.certreport("csv"), 0)
+        self.assertFalse(os.path.exists(self.report_name + ".csv"))
+
+    def test_memory_is_flat(self):
+        peaks = []
+        for count in (2000, 8000):
+            Certificate.objects.all().delete()
+            self.create_certs(count)
+            tracemalloc.start()
+            try:
+                self.assertEqual(self.certreport("csv"), count)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        self.assertLess(peaks[1], peaks[0] * 1.5, peaks)
+
+
+class TestCertificateInfo(DatabaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cert_raw = make_cert_raw()
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_orders(1, 0)[0]
+
+    def assert_info(self, cert):
+        self.assertEqual(cert.serial, "4711")
+        self.assertEqual(cert.san, "DNS:example.com, DNS:www.example.com")
+        self.assertEqual(cert.issuer, "CN=example.com")
+        self.assertEqual(len(cert.key_fingerprint), 64)
+        self.assertEqual(cert.expire_uts - cert.issue_uts, 86400)
+
+    def test_store_cert(self):
+        Certificate.objects.create(name="cert", order=self.order, csr="csr")
+        with CertificateHandler(False, None, self.logger) as certificate:
+            certificate._store_cert("cert", "pem", self.cert_raw)
+        self.assert_info(Certificate.objects.get(name="cert"))
+
+    def test_backfill(self):
+        migration = importlib.import_module("app.migrations.0002_certificate_info")
+        Certificate.objects.bulk_create(Certificate(name=f"cert{i}", order=self.order, cert_raw=self.cert_raw) for i in range(5))
+        Certificate.objects.create(name="broken", order=self.order, cert_raw="broken", issue_uts=1, expire_uts=2)
+        with self.assertLogs(migration.__name__, "ERROR"):
+            migration.certificates_backfill(apps, None)
+        for cert in Certificate.objects.exclude(name="broken"):
+            self.assert_info(cert)
+        broken = Certificate.objects.get(name="broken")
+        self.assertEqual((broken.serial, broken.issue_uts, broken.expire_uts), ("", 1, 2))
+
+    def test_backfill_matches_cert_info_get(self):
+        migration = importlib.import_module("app.migrations.0002_certificate_info")
+        self.assertEqual(migration.cert_info_parse(self.cert_raw), cert_info_get(self.logger, self.cert_raw))
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from urllib3.util import connection
+
+from acme.httpclient import ValidationHTTPClient
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = f"{self.headers['Host']}{self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestValidationHTTPClient(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.resolved = []
+        self.client = ValidationHTTPClient(self.resolve, timeout=5)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def resolve(self, host):
+        self.resolved.append(host)
+        if host.endswith(".validation.test"):
+            return "127.0.0.1"
+        return None
+
+    def test_get_resolves_with_own_resolver(self):
+        resp = self.client.get(f"http://a.validation.test:{self.port}/.well-known/acme-challenge/token")
+        self.assertEqual(resp.text, f"a.validation.test:{self.port}/.well-known/acme-challenge/token")
+        self.assertIn("a.validation.test", self.resolved)
+
+    def test_unresolvable_host(self):
+        with self.assertRaises(Exception):
+            self.client.get(f"http://unknown.example:{self.port}/")
+
+    def test_concurrent_requests(self):
+        create_connection = connection.create_connection
+
+        def fetch(i):
+            url = f"http://host{i % 8}.validation.test:{self.port}/token{i}"
+            return url, self.client.get(url).text
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(fetch, range(400)))
+
+        for url, text in results:
+            self.assertEqual(f"http://{text}", url)
+        # nothing got patched globally
+        self.assertIs(connection.create_connection, create_connection)
@@ -0,0 +1,129 @@
+import configparser
+import logging
+import time
+from unittest import TestCase
+
+from acme.nonce import NONCE_STORES, NonceHMACStore, NonceMemoryStore, nonce_store_get
+
+
+class TestNonceMemoryStore(TestCase):
+    def setUp(self):
+        self.store = NonceMemoryStore(lifetime=1)
+
+    def test_consume_once(self):
+        self.store.add("abc")
+        self.assertTrue(self.store.consume("abc"))
+        self.assertFalse(self.store.consume("abc"))
+
+    def test_consume_unknown(self):
+        self.assertFalse(self.store.consume("unknown"))
+
+    def test_expired_nonces_are_evicted(self):
+        self.store.lifetime = 0.05
+        self.store.add("abc")
+        time.sleep(0.1)
+        self.assertEqual(len(self.store), 0)
+        self.assertFalse(self.store.consume("abc"))
+
+    def test_maxsize(self):
+        store = NonceMemoryStore(lifetime=60, maxsize=3)
+        for nonce in ("a", "b", "c", "d"):
+            store.add(nonce)
+        self.assertEqual(len(store), 3)
+        self.assertFalse(store.consume("a"))
+        self.assertTrue(store.consume("d"))
+
+
+class TestNonceStoreGet(TestCase):
+    def setUp(self):
+        NONCE_STORES.clear()
+        self.logger = logging.getLogger("test")
+
+    def tearDown(self):
+        NONCE_STORES.clear()
+
+    def config(self, **options):
+        config_dic = configparser.ConfigParser()
+        config_dic["Nonce"] = dict(nonce_backend="memory", **options)
+        return config_dic
+
+    def test_store_is_shared(self):
+        store = nonce_store_get(False, self.logger, self.config())
+        self.assertIs(nonce_store_get(False, self.logger, self.config()), store)
+
+    def test_reloaded_settings(self):
+        store = nonce_store_get(False, self.logger, self.config(nonce_lifetime="60"))
+        reloaded = nonce_store_get(False, self.logger, self.config(nonce_lifetime="120", nonce_memory_maxsize="10"))
+        self.assertIsNot(reloaded, store)
+        self.assertEqual((reloaded.lifetime, reloaded.maxsize), (120, 10))
+
+
+class FakeRedis:
+    def __init__(self):
+        self.keys = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = (value, ex)
+        return True
+
+
+class SharedHMACStore(NonceHMACStore):
+    def __init__(self, fake_redis):
+        super().__init__(b"secret", lifetime=60, pool=object())
+        self.fake_redis = fake_redis
+
+    @property
+    def redis(self):
+        return self.fake_redis
+
+
+class TestNonceHMACStore(TestCase):
+    def setUp(self):
+        self.store = NonceHMACStore(b"secret", lifetime=60)
+
+    def test_consume_once(self):
+        nonce = self.store.generate()
+        self.assertTrue(self.store.consume(nonce))
+        self.assertFalse(self.store.consume(nonce))
+
+    def test_shared_secret(self):
+        nonce = self.store.generate()
+        self.assertTrue(NonceHMACStore(b"secret").consume(nonce))
+        self.assertFalse(NonceHMACStore(b"other").consume(nonce))
+
+    def test_tampered_nonce(self):
+        nonce = self.store.generate()
+        tampered = ("A" if nonce[0] != "A" else "B") + nonce[1:]
+        self.assertFalse(self.store.consume(tampered))
+        self.assertFalse(self.store.consume("not-a-nonce"))
+
+    def test_consumed_once_across_workers(self):
+        fake_redis = FakeRedis()
+        workers = [SharedHMACStore(fake_redis), SharedHMACStore(fake_redis)]
+        nonce = workers[0].generate()
+        self.assertTrue(workers[0].consume(nonce))
+        self.assertFalse(workers[1].consume(nonce))
+        (_, ex) = fake_redis.keys["acme:nonce:consumed:" + nonce]
+        self.assertTrue(0 < ex <= 61)
+
+    def test_single_worker_warning(self):
+        config_dic = configparser.ConfigParser()
+        config_dic["Nonce"] = {"nonce_backend": "stateless", "nonce_secret": "secret"}
+        with self.assertLogs("test", "WARNING") as logs:
+            store = nonce_store_get(False, logging.getLogger("test"), config_dic)
+        NONCE_STORES.clear()
+        self.assertIsNone(store.pool)
+        self.assertIn("single worker", logs.output[0])
+
+        config_dic["redis"] = {"host": "localhost"}
+        store = nonce_store_get(False, logging.getLogger("test"), config_dic)
+        NONCE_STORES.clear()
+        self.assertIsNone(store.consumed)
+        self.assertIsNotNone(store.pool)
+
+    def test_expired_nonce(self):
+        nonce = self.store.generate()
+        self.store.lifetime = -2
+        self.assertFalse(self.store.consume(nonce))
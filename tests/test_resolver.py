@@ -0,0 +1,106 @@
+import time
+from unittest import TestCase
+
+import dns.resolver
+
+from dnsclient.propagation import PropagationChecker
+from dnsclient.resolver import CachingResolver
+
+
+class FakeAnswer(list):
+    def __init__(self, records, ttl):
+        super().__init__(records)
+        self.expiration = time.time() + ttl
+
+
+class FakeResolver:
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    def resolve(self, name, rdtype, **kwargs):
+        self.queries.append((name, rdtype))
+        answer = self.answers.get((name, rdtype))
+        if answer is None:
+            raise dns.resolver.NXDOMAIN()
+        return answer
+
+
+class TestCachingResolver(TestCase):
+    def setUp(self):
+        self.resolver = CachingResolver(["127.0.0.1"], negative_ttl=60)
+        self.fake = FakeResolver(
+            {
+                ("a.grid.tf", "A"): FakeAnswer(["1.2.3.4"], 300),
+                ("a.grid.tf", "AAAA"): FakeAnswer(["::1"], 300),
+                ("_acme-challenge.a.grid.tf", "TXT"): FakeAnswer(["token"], 300),
+            }
+        )
+        self.resolver.resolver = self.fake
+
+    def test_positive_cache(self):
+        self.assertEqual(self.resolver.query("a.grid.tf", "A"), ["1.2.3.4"])
+        self.assertEqual(self.resolver.query("A.grid.tf.", "A"), ["1.2.3.4"])
+        self.assertEqual(len(self.fake.queries), 1)
+        self.assertEqual(self.resolver.stats()["hit_ratio"], 0.5)
+
+    def test_negative_cache(self):
+        errors = []
+        for _ in range(2):
+            with self.assertRaises(dns.resolver.NXDOMAIN) as context:
+                self.resolver.query("missing.grid.tf", "A")
+            errors.append(context.exception)
+        self.assertEqual(len(self.fake.queries), 1)
+        self.assertIsNot(errors[0], errors[1])
+
+    def test_challenge_ttl_clamped(self):
+        self.resolver.challenge_ttl = 0
+        self.resolver.query("_acme-challenge.a.grid.tf", "TXT")
+        self.resolver.query("_acme-challenge.a.grid.tf", "TXT")
+        self.assertEqual(len(self.fake.queries), 2)
+
+    def test_address_prefers_ipv4(self):
+        self.assertEqual(self.resolver.address_get("a.grid.tf"), ("1.2.3.4", False))
+        self.assertEqual(self.resolver.address_get("missing.grid.tf"), (None, True))
+
+
+class FakePropagationChecker(PropagationChecker):
+    def __init__(self, visible_after):
+        # (host, nameserver) -> time the record becomes visible
+        self.visible_after = visible_after
+        self.now = 0.0
+        self.queries = 0
+        super().__init__(clock=lambda: self.now, sleep=self.advance)
+        self.zone_nameservers = {"grid.tf": ["ns1", "ns2"]}
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def query(self, nameserver, host):
+        self.queries += 1
+        if self.now >= self.visible_after.get((host, nameserver), float("inf")):
+            return "target.zerossl.com"
+        return None
+
+
+class TestPropagation(TestCase):
+    def test_delay_per_host(self):
+        checker = FakePropagationChecker(
+            {("a.grid.tf", "ns1"): 0, ("a.grid.tf", "ns2"): 4, ("b.grid.tf", "ns1"): 2, ("b.grid.tf", "ns2"): 2}
+        )
+        records = {host: ("grid.tf", "Target.zerossl.com.") for host in ("a.grid.tf", "b.grid.tf")}
+        self.assertEqual(checker.wait(records, timeout=60, interval=2), {"a.grid.tf": 4, "b.grid.tf": 2})
+        # visible records are not queried again
+        self.assertEqual(checker.queries, 4 + 4 + 2)
+
+    def test_timeout(self):
+        checker = FakePropagationChecker({("a.grid.tf", "ns1"): 0})
+        delays = checker.wait({"a.grid.tf": ("grid.tf", "target.zerossl.com")}, timeout=10, interval=2)
+        self.assertEqual(delays, {"a.grid.tf": None})
+        self.assertLessEqual(checker.now, 10)
+
+    def test_unknown_nameservers(self):
+        checker = FakePropagationChecker({})
+        checker.zone_nameservers["3bot.tf"] = []
+        self.assertEqual(checker.wait({"a.3bot.tf": ("3bot.tf", "target.zerossl.com")}), {"a.3bot.tf": None})
+        self.assertEqual(checker.now, 0)
@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+import requests
+
+from zerossl_ca_handler import Retry, RetryError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+
+class TestRetry(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def retry(self, **kwargs):
+        kwargs.setdefault("jitter", 0)
+        return Retry(sleep=self.clock.sleep, clock=self.clock.clock, **kwargs)
+
+    def test_exponential_backoff(self):
+        results = iter([False, False, False, True])
+        retry = self.retry(initial_delay=1, factor=2, max_delay=3)
+        self.assertTrue(retry.run(lambda: next(results), done=bool))
+        self.assertEqual(self.clock.sleeps, [1, 2, 3])
+        self.assertEqual(len(retry.attempts), 4)
+
+    def test_deadline(self):
+        retry = self.retry(initial_delay=1, factor=2, timeout=5)
+        with self.assertRaises(TimeoutError):
+            retry.run(lambda: False, done=bool)
+        self.assertLess(sum(self.clock.sleeps), 5)
+
+    def test_max_attempts(self):
+        retry = self.retry(max_attempts=3)
+        with self.assertRaises(RetryError) as ctx:
+            retry.run(lambda: {"success": False}, done=lambda result: result["success"])
+        self.assertEqual(ctx.exception.last_result, {"success": False})
+        self.assertEqual(len(ctx.exception.attempts), 3)
+
+    def test_retry_after(self):
+        errors = [http_error(429, {"Retry-After": "7"})]
+
+        def func():
+            if errors:
+                raise errors.pop()
+            return True
+
+        retry = self.retry(initial_delay=1, timeout=30)
+        self.assertTrue(retry.run(func))
+        self.assertEqual(self.clock.sleeps, [7.0])
+
+    def test_permanent_error(self):
+        def func():
+            raise http_error(401)
+
+        with self.assertRaises(requests.HTTPError):
+            self.retry().run(func)
+        self.assertEqual(self.clock.sleeps, [])
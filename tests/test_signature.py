@@ -0,0 +1,69 @@
+import json
+from unittest import TestCase
+
+from jwcrypto import jwk
+
+from acme.db_handler import DBstore
+from acme.signature import JWK_CACHE, JWKCache, Signature
+from tests.database import DatabaseTestCase
+
+
+class TestJWKCache(TestCase):
+    def setUp(self):
+        self.cache = JWKCache(maxsize=2)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("acct1", "h1"))
+        self.cache.set("acct1", "h1", "key1")
+        self.assertEqual(self.cache.get("acct1", "h1"), "key1")
+        self.assertEqual(self.cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_lru_eviction(self):
+        self.cache.set("acct1", "h1", "key1")
+        self.cache.set("acct2", "h2", "key2")
+        self.cache.get("acct1", "h1")
+        self.cache.set("acct3", "h3", "key3")
+        self.assertIsNone(self.cache.get("acct2", "h2"))
+        self.assertEqual(self.cache.get("acct1", "h1"), "key1")
+
+    def test_invalidate(self):
+        self.cache.set("acct1", "h1", "key1")
+        self.cache.invalidate("acct1")
+        self.assertIsNone(self.cache.get("acct1", "h1"))
+
+    def test_expired(self):
+        self.cache.ttl = -1
+        self.cache.set("acct1", "h1", "key1")
+        self.assertIsNone(self.cache.get("acct1", "h1"))
+
+    def test_changed_key(self):
+        self.cache.set("acct1", "h1", "key1")
+        self.assertIsNone(self.cache.get("acct1", "h2"))
+        self.cache.set("acct1", "h2", "key2")
+        self.assertEqual(self.cache.stats()["size"], 1)
+
+
+class TestSignatureKeyCache(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        JWK_CACHE.clear()
+        self.dbstore = DBstore(False, self.logger)
+        self.dbstore.account_update({"name": "account", "jwk": self.new_jwk(), "alg": "ES256"})
+
+    def new_jwk(self):
+        return json.dumps(jwk.JWK.generate(kty="EC", crv="P-256").export_public(as_dict=True))
+
+    def test_key_changed_by_other_worker(self):
+        signature = Signature(False, None, self.logger)
+        key = signature._jwkey_get("account")
+        self.assertIs(signature._jwkey_get("account"), key)
+        # another worker rolls the key over, this process never sees the invalidation
+        new_jwk = self.new_jwk()
+        self.dbstore.account_update({"name": "account", "jwk": new_jwk})
+        self.assertEqual(signature._jwkey_get("account").export_public(as_dict=True)["x"], json.loads(new_jwk)["x"])
+
+    def test_account_deleted_by_other_worker(self):
+        signature = Signature(False, None, self.logger)
+        self.assertTrue(signature._jwkey_get("account"))
+        self.dbstore.account_delete("account")
+        self.assertIsNone(signature._jwkey_get("account"))
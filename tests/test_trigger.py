@@ -0,0 +1,47 @@
+import importlib
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from OpenSSL import crypto
+
+from acme.certificate import Certificate as CertificateHandler
+from acme.trigger import Trigger
+from app.models import Certificate
+from tests.database import DatabaseTestCase, make_cert, make_csr, make_key
+
+
+class TestCertnameLookup(DatabaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = make_key()
+        cls.cert_pem = crypto.dump_certificate(crypto.FILETYPE_PEM, make_cert(cls.key)).decode()
+
+    def setUp(self):
+        super().setUp()
+        (self.processing, self.valid) = self.create_orders(2, 0, status=4)
+        self.valid.status_id = 5
+        self.valid.save()
+        self.trigger = Trigger(False, None, self.logger)
+
+    def store_csr(self, order, key):
+        with CertificateHandler(False, None, self.logger) as certificate:
+            return certificate.store_csr(order.name, make_csr(key))
+
+    def test_lookup(self):
+        name = self.store_csr(self.processing, self.key)
+        self.store_csr(self.processing, make_key())
+        self.store_csr(self.valid, self.key)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.trigger._certname_lookup(self.cert_pem)
+        self.assertEqual(result, [{"cert_name": name, "order_name": "order0"}])
+        self.assertEqual(len(queries), 1)
+
+    def test_backfill(self):
+        migration = importlib.import_module("app.migrations.0003_certificate_csr_fingerprint")
+        name = self.store_csr(self.processing, self.key)
+        Certificate.objects.update(key_fingerprint="")
+        self.assertEqual(self.trigger._certname_lookup(self.cert_pem), [])
+        migration.fingerprints_backfill(apps, None)
+        self.assertEqual(self.trigger._certname_lookup(self.cert_pem), [{"cert_name": name, "order_name": "order0"}])
@@ -0,0 +1,116 @@
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from acme.challenge import Challenge as ChallengeHandler
+from acme.validation import ValidationPool
+from app.models import Authorization, Challenge
+from tests.database import DatabaseTestCase
+
+
+class TestValidationPool(TestCase):
+    def setUp(self):
+        self.pool = ValidationPool(workers=1, queue_size=2)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    def test_runs_job(self):
+        done = threading.Event()
+        self.assertTrue(self.pool.submit("chall1", done.set))
+        self.assertTrue(done.wait(5))
+        self.pool.shutdown()
+        self.assertEqual(self.pool.stats()["completed"], 1)
+
+    def test_duplicate_and_full_queue(self):
+        self.assertTrue(self.pool.submit("chall1", self.release.wait))
+        self.assertTrue(self.pool.submit("chall1", self.release.wait))
+        self.assertTrue(self.pool.submit("chall2", self.release.wait))
+        self.assertFalse(self.pool.submit("chall3", self.release.wait))
+        self.assertEqual(self.pool.stats()["rejected"], 1)
+
+    def test_failed_job(self):
+        def fail():
+            raise ValueError("boom")
+
+        self.pool.submit("chall1", fail)
+        self.pool.shutdown()
+        self.assertEqual(self.pool.stats()["failed"], 1)
+
+
+class TestChallengeValidation(DatabaseTestCase):
+    """ Challenge.parse() and Challenge.challengeset_get() with background validation """
+
+    def setUp(self):
+        super().setUp()
+        order = self.create_orders(1, expires=0)[0]
+        authz = Authorization.objects.create(name="authz1", order=order, type="dns", value="example.com", status_id=2)
+        for name, chall_type in (("chall1", "http-01"), ("chall2", "dns-01")):
+            Challenge.objects.create(name=name, authorization=authz, type=chall_type, token="token", status_id=2)
+        self.release = threading.Event()
+        self.results = {}
+        self.pool = ValidationPool(workers=1, queue_size=2)
+        patcher = patch("acme.challenge.validation_pool_get", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.challenge = ChallengeHandler(False, "http://srv", self.logger)
+        self.challenge.validation_workers = 1
+        self.challenge._validate = self.validate
+        self.challenge.message.check = lambda content: (200, None, None, {"url": f"http://srv/acme/chall/{content}"}, {}, "account")
+        self.challenge.message.prepare_response = lambda response_dic, status_dic: response_dic
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+        super().tearDown()
+
+    def validate(self, challenge_name, _payload):
+        """ stubbed validation: blocks until released, then applies the configured result """
+        self.release.wait(5)
+        if self.results.get(challenge_name):
+            self.challenge._update({"name": challenge_name, "status": "valid"})
+            return True
+        return False
+
+    def status(self, name):
+        return Challenge.objects.get(name=name).status.name
+
+    def test_parse_valid(self):
+        self.results["chall1"] = True
+        self.assertEqual(self.challenge.parse("chall1")["data"]["status"], "processing")
+        self.release.set()
+        self.pool.shutdown()
+        self.assertEqual(self.status("chall1"), "valid")
+
+    def test_parse_inconclusive(self):
+        self.challenge.parse("chall1")
+        self.assertEqual(self.status("chall1"), "processing")
+        self.release.set()
+        self.pool.shutdown()
+        self.assertEqual(self.status("chall1"), "pending")
+
+    def test_challengeset_get_stays_pending(self):
+        self.results.update(chall1=True, chall2=True)
+        self.challenge.challengeset_get("authz1", "pending", "token", None)
+        self.assertEqual((self.status("chall1"), self.status("chall2")), ("pending", "pending"))
+        self.release.set()
+        self.pool.shutdown()
+        self.assertEqual((self.status("chall1"), self.status("chall2")), ("valid", "valid"))
+
+    def test_queue_full_validates_inline(self):
+        self.pool.pending.update(("other1", "other2"))
+        self.results["chall1"] = True
+        self.release.set()
+        self.assertEqual(self.challenge.parse("chall1")["data"]["status"], "valid")
+        self.assertEqual(self.pool.stats()["rejected"], 1)
+
+    def test_finished_job_keeps_status(self):
+        # the job already stored its result but still holds the key
+        self.pool.pending.add("chall1")
+        self.challenge._update({"name": "chall1", "status": "valid"})
+        self.challenge._validate_async("chall1", {})
+        self.assertEqual(self.status("chall1"), "valid")
+        Challenge.objects.filter(name="chall1").update(status_id=2)
+        self.assertEqual(self.challenge.parse("chall1")["data"]["status"], "pending")
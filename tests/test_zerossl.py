@@ -0,0 +1,472 @@
+import base64
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from unittest.mock import patch
+
+import requests
+from OpenSSL import crypto
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from acme.helper import cert_pem2der
+from dnsclient import Domain
+from dnsclient.helpers import get_redis_pool
+from zerossl_ca_handler import (
+    CAhandler,
+    ConnectionStats,
+    LockLostError,
+    PrefetchingCache,
+    PrefetchScheduler,
+    SingleFlight,
+    TimedHTTPAdapter,
+    ZeroSSL,
+    canonical_domains,
+    domains_key,
+)
+
+VALIDATIONS = {"a.grid.tf": {"cname_validation_p1": "_hash.a.grid.tf", "cname_validation_p2": "hash.zerossl.com"}}
+
+
+class FakeCertificates:
+    def __init__(self, status, age=0, verified=True):
+        self.status = status
+        self.created = datetime.datetime.utcnow() - datetime.timedelta(seconds=age)
+        self.verified = verified
+        self.verifications = 0
+
+    def get(self, cert_id):
+        if isinstance(self.status, Exception):
+            raise self.status
+        return {
+            "id": cert_id,
+            "status": self.status,
+            "created": self.created.strftime("%Y-%m-%d %H:%M:%S"),
+            "validation": {"other_methods": VALIDATIONS},
+        }
+
+    def verify(self, cert_id, challenge_type):
+        self.verifications += 1
+        if self.verified:
+            return {"id": cert_id, "status": "pending_validation"}
+        return {"success": False, "error": {"type": "domain_control_validation_failed"}}
+
+
+class FakeZeroSSL:
+    def __init__(self, status, **kwargs):
+        self.certificate = FakeCertificates(status, **kwargs)
+
+
+class FakeDNS:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_cname_records(self, hosts, max_workers):
+        self.deleted.extend(hosts)
+
+    def verify(self, host):
+        return "_hash", "", Domain("a.grid.tf", [])
+
+
+class FakeChecker:
+    visible = set()
+
+    def __init__(self, logger=None):
+        pass
+
+    def nameservers(self, zone):
+        return ["ns1"]
+
+    def check(self, records):
+        return self.visible & set(records)
+
+
+class TestPoll(TestCase):
+    def handler(self, status, **kwargs):
+        handler = CAhandler.__new__(CAhandler)
+        handler.logger = logging.getLogger("test")
+        handler.zerossl = FakeZeroSSL(status, **kwargs)
+        handler.dns = FakeDNS()
+        handler.dns_concurrency = 5
+        handler.propagation_timeout = 120
+        handler.verification_timeout = 120
+        handler.download = lambda cert_id: ("bundle", "raw")
+        return handler
+
+    def test_issued(self):
+        handler = self.handler("issued")
+        self.assertEqual(handler.poll("name", "id1", "csr"), (None, "bundle", "raw", "id1", False))
+        self.assertEqual(handler.dns.deleted, ["_hash.a.grid.tf"])
+
+    def test_pending(self):
+        handler = self.handler("pending_validation")
+        error, bundle, _, poll_identifier, rejected = handler.poll("name", "id1", "csr")
+        self.assertIn("not issued yet", error)
+        self.assertIsNone(bundle)
+        self.assertEqual(poll_identifier, "id1")
+        self.assertFalse(rejected)
+        self.assertEqual(handler.dns.deleted, [])
+
+    def test_cancelled(self):
+        handler = self.handler("cancelled")
+        error, bundle, _, _, rejected = handler.poll("name", "id1", "csr")
+        self.assertIsNotNone(error)
+        self.assertIsNone(bundle)
+        self.assertTrue(rejected)
+        self.assertEqual(handler.dns.deleted, ["_hash.a.grid.tf"])
+
+    def test_draft_waits_for_propagation(self):
+        handler = self.handler("draft")
+        with patch("zerossl_ca_handler.PropagationChecker", FakeChecker):
+            error, _, _, _, rejected = handler.poll("name", "id1", "csr")
+            self.assertIn("not propagated yet: _hash.a.grid.tf", error)
+            self.assertEqual(handler.zerossl.certificate.verifications, 0)
+
+            with patch.object(FakeChecker, "visible", {"_hash.a.grid.tf"}):
+                error, _, _, _, rejected = handler.poll("name", "id1", "csr")
+        self.assertIn("verification submitted", error)
+        self.assertFalse(rejected)
+        self.assertEqual(handler.zerossl.certificate.verifications, 1)
+
+    def test_draft_after_propagation_timeout(self):
+        handler = self.handler("draft", age=150)
+        with patch("zerossl_ca_handler.PropagationChecker", FakeChecker):
+            error, _, _, _, rejected = handler.poll("name", "id1", "csr")
+        self.assertIn("verification submitted", error)
+        self.assertFalse(rejected)
+
+    def test_draft_verification_failed(self):
+        handler = self.handler("draft", age=150, verified=False)
+        error, _, _, _, rejected = handler.poll("name", "id1", "csr")
+        self.assertIn("not verified yet", error)
+        self.assertFalse(rejected)
+
+        handler = self.handler("draft", age=300, verified=False)
+        error, _, _, _, rejected = handler.poll("name", "id1", "csr")
+        self.assertIn("could not verify", error)
+        self.assertTrue(rejected)
+        self.assertEqual(handler.dns.deleted, ["_hash.a.grid.tf"])
+
+    def test_request_error(self):
+        handler = self.handler(requests.ConnectionError("down"))
+        error, bundle, _, poll_identifier, rejected = handler.poll("name", "id1", "csr")
+        self.assertIn("down", error)
+        self.assertEqual(poll_identifier, "id1")
+        self.assertFalse(rejected)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        body = json.dumps({"id": self.path.split("/")[-1].split("?")[0], "status": "issued"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSession(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.connections = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def session(self):
+        session = requests.Session()
+        session.connection_stats = ConnectionStats()
+        session.mount("http://", TimedHTTPAdapter(session.connection_stats, pool_connections=1, pool_maxsize=2))
+        return session
+
+    def test_keep_alive(self):
+        zerossl = ZeroSSL("key", session=self.session(), base_url=self.base_url)
+        for cert_id in range(10):
+            self.assertEqual(zerossl.certificate.get(str(cert_id))["id"], str(cert_id))
+
+        # all calls share a single connection
+        self.assertEqual(self.server.connections, 1)
+        stats = zerossl.stats()
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["requests"], 10)
+
+    def test_shared_between_clients(self):
+        session = self.session()
+        for cert_id in range(3):
+            ZeroSSL("key", session=session, base_url=self.base_url).certificate.get(str(cert_id))
+        self.assertEqual(self.server.connections, 1)
+
+
+class FakeCache:
+    def __init__(self, available):
+        self.pools = available
+
+    def available(self, domains, min_ttl=0):
+        return self.pools.get(domains, 0)
+
+
+class FakePrefetchHandler:
+    def __init__(self, cache, calls, release):
+        self.cache = cache
+        self.calls = calls
+        self.release = release
+
+    def prefetch(self, domains, csr, key=None):
+        self.calls.append(domains)
+        self.release.wait(5)
+
+
+class TestPrefetchScheduler(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.cache = FakeCache({("a.test.grid.tf",): 2, ("b.test.grid.tf",): 1})
+
+    def scheduler(self, domain_sets, **kwargs):
+        handler = FakePrefetchHandler(self.cache, self.calls, self.release)
+        return PrefetchScheduler(lambda: handler, domain_sets, key_size=1024, logger=logging.getLogger("test"), **kwargs)
+
+    def test_refill_pools(self):
+        scheduler = self.scheduler([["a.test.grid.tf"], ["B.test.grid.tf"], ["c.test.grid.tf"]], pool_size=2)
+        self.assertEqual(scheduler.run_once(), 3)
+        # refills in flight are not queued twice
+        self.assertEqual(scheduler.run_once(), 0)
+        self.release.set()
+        scheduler.stop()
+        self.assertEqual(sorted(self.calls), [("b.test.grid.tf",), ("c.test.grid.tf",), ("c.test.grid.tf",)])
+        self.assertEqual(scheduler.stats()["refills"], 3)
+
+    def test_max_concurrent(self):
+        scheduler = self.scheduler([[f"{i}.test.grid.tf"] for i in range(4)], max_concurrent=1)
+        self.assertEqual(scheduler.run_once(), 4)
+        time.sleep(0.2)
+        self.assertEqual(len(self.calls), 1)
+        self.release.set()
+        scheduler.stop()
+        self.assertEqual(len(self.calls), 4)
+
+
+def make_cert(name, key_size=1024):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, key_size)
+    cert = crypto.X509()
+    cert.get_subject().CN = name
+    cert.set_issuer(cert.get_subject())
+    cert.set_serial_number(random.getrandbits(64))
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(3600)
+    cert.set_pubkey(key)
+    cert.sign(key, "sha256")
+    return crypto.dump_certificate(crypto.FILETYPE_PEM, cert).decode(), crypto.dump_privatekey(crypto.FILETYPE_PEM, key).decode()
+
+
+class TestDomainsKey(TestCase):
+    def test_canonical(self):
+        self.assertEqual(canonical_domains(["B.grid.tf.", "a.grid.tf", "b.grid.tf"]), ("a.grid.tf", "b.grid.tf"))
+        self.assertEqual(canonical_domains(["*.A.grid.tf"]), ("*.a.grid.tf",))
+        self.assertEqual(canonical_domains(["bücher.grid.tf"]), ("xn--bcher-kva.grid.tf",))
+
+    def test_key(self):
+        self.assertEqual(domains_key(["a.grid.tf", "Bücher.grid.tf"]), domains_key(["xn--bcher-kva.grid.tf", "A.grid.tf"]))
+        self.assertNotEqual(domains_key(["a.grid.tf"]), domains_key(["b.grid.tf"]))
+        self.assertEqual(len(domains_key(["a.grid.tf"])), 22)
+
+
+class TestPrefetchingCache(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.chain = "\n".join([make_cert("ca")[0]] * 2)
+        cls.certs = []
+        for i in range(5):
+            cert_pem, key = make_cert(f"{i}.test.grid.tf")
+            cls.certs.append(("\n".join([cert_pem, cls.chain]), base64.b64encode(cert_pem2der(cert_pem)).decode(), key))
+
+    def setUp(self):
+        self.cache = PrefetchingCache({})
+        self.cache.PREFIX = f"test:{uuid.uuid4().hex}:"
+        try:
+            self.cache.redis.ping()
+        except RedisConnectionError:
+            self.skipTest("redis is not available")
+
+    def tearDown(self):
+        keys = self.cache.redis.keys(self.cache.PREFIX + "*")
+        if keys:
+            self.cache.redis.delete(*keys)
+
+    def test_concurrent_claims(self):
+        domains = ("a.test.grid.tf",)
+        for bundle, raw, key in self.certs:
+            self.cache.add(domains, bundle, raw, key)
+        self.assertEqual(self.cache.available(domains), 5)
+        # the chain is stored once
+        self.assertEqual(len(self.cache.redis.keys(self.cache.PREFIX + "chain:*")), 1)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            claimed = list(executor.map(lambda _: self.cache.claim(["A.test.grid.tf"]), range(10)))
+
+        # every certificate is handed out exactly once
+        claimed = sorted((entry["bundle"], entry["raw"], entry["key"]) for entry in claimed if entry)
+        self.assertEqual(claimed, sorted(self.certs))
+        self.assertEqual(self.cache.available(domains), 0)
+        self.assertEqual(self.cache.stats(), {"hit": 5, "miss": 5, "stale": 0, "refill": 5})
+
+    def test_expired_entries_are_skipped(self):
+        domains = ("a.test.grid.tf",)
+        bundle, raw, _ = self.certs[0]
+        self.cache.redis.rpush(self.cache.key(domains), b"1:expired")
+        self.cache.add(domains, bundle, raw)
+        self.assertEqual(self.cache.available(domains), 1)
+        self.assertEqual(self.cache.claim(domains), {"bundle": bundle, "raw": raw})
+
+    def test_missing_chain_is_stale(self):
+        domains = ("a.test.grid.tf",)
+        bundle, raw, _ = self.certs[0]
+        self.cache.add(domains, bundle, raw)
+        self.cache.redis.delete(*self.cache.redis.keys(self.cache.PREFIX + "chain:*"))
+        with self.assertLogs(self.cache.logger, "WARNING"):
+            self.assertIsNone(self.cache.claim(domains))
+        self.assertEqual(self.cache.stats(), {"hit": 0, "miss": 0, "stale": 1, "refill": 1})
+
+    def test_add_prunes_and_caps(self):
+        domains = ("a.test.grid.tf",)
+        self.cache.max_entries = 3
+        self.cache.redis.rpush(self.cache.key(domains), b"1:expired", b"2:expired")
+        for bundle, raw, key in self.certs:
+            self.cache.add(domains, bundle, raw, key)
+        entries = self.cache.redis.lrange(self.cache.key(domains), 0, -1)
+        self.assertEqual(len(entries), 3)
+        self.assertFalse(any(entry.endswith(b"expired") for entry in entries))
+        # the newest certificates are kept
+        self.assertEqual([self.cache.claim(domains)["raw"] for _ in range(3)], [raw for _, raw, _ in self.certs[2:]])
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight(get_redis_pool({}), lock_ttl=5, interval=0.01)
+        self.single_flight.PREFIX = f"test:{uuid.uuid4().hex}:"
+        try:
+            self.single_flight.redis.ping()
+        except RedisConnectionError:
+            self.skipTest("redis is not available")
+
+    def tearDown(self):
+        keys = self.single_flight.redis.keys(self.single_flight.PREFIX + "*")
+        if keys:
+            self.single_flight.redis.delete(*keys)
+
+    def test_followers_get_leader_result(self):
+        calls = []
+
+        def issue(lease):
+            calls.append(lease.token)
+            time.sleep(0.2)
+            return [None, None, None, "cert-id"]
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: self.single_flight.run(["a.test.grid.tf"], issue), range(5)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [[None, None, None, "cert-id"]] * 5)
+
+    def test_results_are_shared_per_key(self):
+        calls = []
+
+        def issue(lease):
+            calls.append(lease.token)
+            result = len(calls)
+            time.sleep(0.2)
+            return result
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(lambda i: self.single_flight.run(["a.test.grid.tf"], issue, f"key{i % 2}"), range(4))
+            )
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sorted(set(results)), [1, 2])
+
+    def test_leader_finishes_while_follower_checks(self):
+        redis = self.single_flight.redis
+        lock_key, _ = self.single_flight.keys(domains_key(["a.test.grid.tf"]))
+        result_key = self.single_flight.result_key(domains_key(["a.test.grid.tf"]), "1")
+        redis.set(lock_key, "1", px=5000)
+        calls = []
+
+        def pttl(key):
+            # the leader publishes its result and releases the lock right after the lock was checked
+            redis.delete(lock_key)
+            redis.set(result_key, json.dumps("leader"))
+            return 100
+
+        with patch.object(type(redis), "pttl", side_effect=pttl):
+            self.assertEqual(self.single_flight.run(["a.test.grid.tf"], lambda lease: calls.append(1)), "leader")
+        self.assertEqual(calls, [])
+
+    def test_follower_takes_over_failed_leader(self):
+        started = threading.Event()
+
+        def failing(lease):
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError("zerossl error")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(self.single_flight.run, ["a.test.grid.tf"], failing)
+            started.wait()
+            follower = executor.submit(self.single_flight.run, ["a.test.grid.tf"], lambda lease: "follower")
+            with self.assertRaises(RuntimeError):
+                leader.result()
+            self.assertEqual(follower.result(), "follower")
+
+    def test_followers_ignore_previous_flight(self):
+        error = ["zerossl error", None, None, None]
+        self.assertEqual(self.single_flight.run(["a.test.grid.tf"], lambda lease: error), error)
+        started = threading.Event()
+
+        def issue(lease):
+            started.set()
+            time.sleep(0.2)
+            return [None, None, None, "cert-id"]
+
+        # the error of the first flight is still stored (result_ttl) while the second flight runs
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(self.single_flight.run, ["a.test.grid.tf"], issue)
+            started.wait()
+            follower = executor.submit(self.single_flight.run, ["a.test.grid.tf"], lambda lease: "follower")
+            self.assertEqual(leader.result(), [None, None, None, "cert-id"])
+            self.assertEqual(follower.result(), [None, None, None, "cert-id"])
+
+    def test_fencing(self):
+        tokens = []
+
+        def expired(lease):
+            tokens.append(lease.token)
+            # another leader took over after the lock expired
+            lock_key = self.single_flight.keys(lease.key)[0]
+            self.single_flight.redis.set(lock_key, int(lease.token) + 1)
+            with self.assertRaises(LockLostError):
+                lease.extend()
+            return "stale"
+
+        self.assertEqual(self.single_flight.run(["a.test.grid.tf"], expired), "stale")
+        # the stale result is not shared
+        self.assertIsNone(self.single_flight.redis.get(self.single_flight.result_key(domains_key(["a.test.grid.tf"]), tokens[0])))
@@ -6,27 +6,44 @@ for now, it supports validation via CNAME records registered via configured dns
 
 import json
 import base64
+import datetime
+import hashlib
+import logging
 import uuid
 import re
+import random
 import requests
+import struct
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from enum import Enum
 from OpenSSL import crypto
+from redis.exceptions import RedisError
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.poolmanager import PoolManager
 from cryptography.x509 import load_pem_x509_certificate
 
 from acme.helper import (
+    convert_asn1_to_pem,
     convert_byte_to_string,
     convert_string_to_byte,
     csr_cn_get,
+    csr_fingerprint_get,
     csr_san_get,
     load_config,
 )
+from csr import make_csr, make_key
 from dnsclient import Client, ClientType, Domain
-from dnsclient.exceptions import DnsConfigError
+from dnsclient.exceptions import DnsConfigError, RecordsError
 from dnsclient.helpers import get_redis_connection, get_redis_pool
+from dnsclient.propagation import DEFAULT_PROPAGATION_INTERVAL, DEFAULT_PROPAGATION_TIMEOUT, PropagationChecker
 
 PREFETCHED_CERTS = {}
+DEFAULT_VERIFICATION_TIMEOUT = 120
 
 
 class ChallengeType(Enum):
@@ -98,21 +115,146 @@ class ZeroSSLError(Exception):
         self.code = code
 
 
+class ConnectionStats:
+    """
+    connection and request timings of a pooled session
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.connect_time = 0.0
+        self.requests = 0
+        self.request_time = 0.0
+
+    def connected(self, duration):
+        with self.lock:
+            self.connections += 1
+            self.connect_time += duration
+
+    def requested(self, duration):
+        with self.lock:
+            self.requests += 1
+            self.request_time += duration
+
+    def stats(self):
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "connect_avg": self.connect_time / self.connections if self.connections else 0.0,
+                "request_avg": self.request_time / self.requests if self.requests else 0.0,
+            }
+
+
+class TimedConnectionMixin:
+    """
+    record the time needed to establish a connection (tcp and tls handshake)
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.connection_stats = kwargs.pop("connection_stats")
+        super().__init__(*args, **kwargs)
+
+    def connect(self):
+        start = time.monotonic()
+        super().connect()
+        self.connection_stats.connected(time.monotonic() - start)
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedPoolManager(PoolManager):
+    def __init__(self, connection_stats, *args, **kwargs):
+        self.connection_stats = connection_stats
+        super().__init__(*args, **kwargs)
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        if scheme == "https":
+            pool.ConnectionCls = TimedHTTPSConnection
+        else:
+            pool.ConnectionCls = TimedHTTPConnection
+        pool.conn_kw = dict(pool.conn_kw, connection_stats=self.connection_stats)
+        return pool
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def __init__(self, connection_stats, **kwargs):
+        # must be set before HTTPAdapter.__init__() creates the pool manager
+        self.connection_stats = connection_stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=DEFAULT_POOLBLOCK, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = TimedPoolManager(
+            self.connection_stats, num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs
+        )
+
+
+DEFAULT_POOL_SIZE = 10
+# (connect, read) timeouts of zerossl api calls in seconds
+DEFAULT_TIMEOUT = (10, 30)
+
+# process-wide keep-alive sessions, one per pool size
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    get a shared session keeping connections to the zerossl api alive
+
+    Args:
+        pool_size (int): maximum number of connections kept per host
+
+    Returns:
+        requests.Session: session, timings are available as `connection_stats`
+    """
+    with SESSIONS_LOCK:
+        if pool_size not in SESSIONS:
+            session = requests.Session()
+            session.connection_stats = ConnectionStats()
+            # retries are handled by Retry
+            adapter = TimedHTTPAdapter(session.connection_stats, pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            SESSIONS[pool_size] = session
+        return SESSIONS[pool_size]
+
+
 class ZeroSSL:
     BASE_URL = "https://api.zerossl.com"
 
-    def __init__(self, access_key):
+    def __init__(self, access_key, session=None, timeout=DEFAULT_TIMEOUT, base_url=None):
         self.access_key = access_key
+        self.session = session or get_session()
+        self.timeout = timeout
+        if base_url:
+            self.BASE_URL = base_url.rstrip("/")
         self.certificate = Certificate(self)
 
     def request(self, url, method, data=None, json=None):
-        resp = requests.request(
-            url=url,
-            method=method,
-            params={"access_key": self.access_key},
-            data=data,
-            json=json,
-        )
+        start = time.monotonic()
+        try:
+            resp = self.session.request(
+                url=url,
+                method=method,
+                params={"access_key": self.access_key},
+                data=data,
+                json=json,
+                timeout=self.timeout,
+            )
+        finally:
+            self.session.connection_stats.requested(time.monotonic() - start)
 
         # FIXME: zerossl rest api return 200 too with an error object
         # need to handle this and raise ZeroSSLError in such case
@@ -125,11 +267,156 @@ class ZeroSSL:
     def post(self, url, data):
         return self.request(url, method="post", data=data)
 
+    def stats(self):
+        return self.session.connection_stats.stats()
+
 
 class ConfigError(Exception):
     pass
 
 
+class RetryError(RuntimeError):
+    def __init__(self, message, attempts, last_result=None):
+        super().__init__(message)
+
+        self.attempts = attempts
+        self.last_result = last_result
+
+
+# zerossl api responses worth retrying
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def get_retry_after(error):
+    """
+    get delay requested by the server via Retry-After header
+
+    Args:
+        error (Exception): error raised by the request
+
+    Returns:
+        float: delay in seconds or None
+    """
+    response = getattr(error, "response", None)
+    if response is None or "Retry-After" not in response.headers:
+        return None
+
+    value = response.headers["Retry-After"]
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """
+    check if a request error is transient (connection issues, rate limiting, server errors)
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class Retry:
+    """
+    retry/poll an operation with exponential backoff, jitter, Retry-After handling and an overall deadline
+
+    every attempt is recorded in `attempts` (number, start offset, duration, delay before next attempt, error)
+    """
+
+    def __init__(
+        self,
+        initial_delay=1.0,
+        max_delay=15.0,
+        factor=2.0,
+        jitter=0.1,
+        timeout=180,
+        max_attempts=None,
+        logger=None,
+        sleep=time.sleep,
+        clock=time.monotonic,
+    ):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.logger = logger
+        self.sleep = sleep
+        self.clock = clock
+        self.attempts = []
+
+    def run(self, func, done=lambda result: True, name="operation"):
+        """
+        call func until done(result) is true
+
+        Args:
+            func (callable): operation
+            done (callable): gets the result and returns True if no further attempt is needed
+            name (str): name of the operation for logs and errors
+
+        Raises:
+            TimeoutError: if the deadline is reached
+            RetryError: if max_attempts is reached
+            Exception: errors of func which are not transient
+
+        Returns:
+            result of func
+        """
+        self.attempts = []
+        start = self.clock()
+        deadline = start + self.timeout
+        delay = self.initial_delay
+        result = None
+
+        while True:
+            attempt_start = self.clock()
+            attempt = {"number": len(self.attempts) + 1, "start": attempt_start - start, "error": None, "delay": 0}
+            self.attempts.append(attempt)
+            error = None
+            try:
+                result = func()
+            except requests.RequestException as exc:
+                if not is_retryable(exc):
+                    attempt["duration"] = self.clock() - attempt_start
+                    raise
+                error = exc
+                attempt["error"] = str(exc)
+            attempt["duration"] = self.clock() - attempt_start
+
+            if error is None and done(result):
+                self._log(name, "done")
+                return result
+
+            if self.max_attempts and attempt["number"] >= self.max_attempts:
+                self._log(name, "gave up")
+                raise RetryError(f"{name} failed after {attempt['number']} attempts", self.attempts, result)
+
+            wait = get_retry_after(error)
+            if wait is None:
+                wait = delay * (1 + random.uniform(-self.jitter, self.jitter))
+                delay = min(delay * self.factor, self.max_delay)
+
+            remaining = deadline - self.clock()
+            if remaining <= 0 or wait >= remaining:
+                self._log(name, "timed out")
+                raise TimeoutError(f"timeout ({self.timeout}s) while waiting for {name}")
+
+            attempt["delay"] = wait
+            self.sleep(wait)
+
+    def _log(self, name, outcome):
+        if self.logger:
+            timings = ", ".join(f"#{a['number']}: {a['duration']:.2f}s+{a['delay']:.2f}s" for a in self.attempts)
+            self.logger.debug(f"{name} {outcome} after {len(self.attempts)} attempts ({timings})")
+
+
 def get_domain_config(config):
     """
     get domains from config
@@ -172,32 +459,511 @@ def get_dns_options(config):
     return options
 
 
-# for later
+def get_prefetch_config(config):
+    """
+    get prefetch scheduler options from the [prefetch] section
+
+    domain sets are given one per line (comma separated) in `domain_sets` and/or in the file at `domains_file`
+
+    Args:
+        config (ConfigParser): config parser
+
+    Returns:
+        dict: keyword arguments of PrefetchScheduler
+    """
+    if "prefetch" not in config:
+        return {"domain_sets": []}
+
+    section = config["prefetch"]
+    lines = section.get("domain_sets", fallback="").splitlines()
+    domains_file = section.get("domains_file")
+    if domains_file:
+        with open(domains_file) as f:
+            lines.extend(f.read().splitlines())
+
+    domain_sets = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            domain_sets.append([domain.strip() for domain in line.split(",") if domain.strip()])
+
+    return {
+        "domain_sets": domain_sets,
+        "refill_before": section.getint("refill_before", fallback=DEFAULT_REFILL_BEFORE),
+        "interval": section.getint("interval", fallback=DEFAULT_PREFETCH_INTERVAL),
+        "max_concurrent": section.getint("max_concurrent", fallback=DEFAULT_MAX_CONCURRENT_ISSUANCES),
+        "pool_size": section.getint("pool_size", fallback=1),
+    }
+
+
+def canonical_domains(domains):
+    """
+    normalize a domain set: lowercase, without trailing dots, IDNA (punycode) encoded, sorted and unique
+
+    Args:
+        domains (iterable of str): domain names, wildcards (e.g. `*.a.grid.tf`) are kept as they are
+
+    Returns:
+        tuple of str
+    """
+    names = set()
+    for domain in domains:
+        labels = domain.strip().rstrip(".").lower().split(".")
+        names.add(".".join(label if label.isascii() else label.encode("idna").decode() for label in labels))
+    return tuple(sorted(names))
+
+
+def domains_key(domains):
+    """
+    compact, fixed size key of a domain set (case-variant and unicode/punycode names give the same key)
+    """
+    digest = hashlib.blake2b(",".join(canonical_domains(domains)).encode(), digest_size=16).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+# pop prefetched entries until a non-expired one is found, every entry is handed out once
+CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+while true do
+    local value = redis.call('LPOP', KEYS[1])
+    if not value then
+        return nil
+    end
+    local expires = tonumber(string.match(value, '^(%d+):'))
+    if expires and expires > now then
+        return value
+    end
+end
+"""
+
+# drop expired entries from the head of the list, append the new one and cap the list length
+ADD_SCRIPT = """
+local now = tonumber(ARGV[1])
+while true do
+    local value = redis.call('LINDEX', KEYS[1], 0)
+    if not value then
+        break
+    end
+    local expires = tonumber(string.match(value, '^(%d+):'))
+    if expires and expires > now then
+        break
+    end
+    redis.call('LPOP', KEYS[1])
+end
+redis.call('RPUSH', KEYS[1], ARGV[2])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[3]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return redis.call('LLEN', KEYS[1])
+"""
+
+END_CERTIFICATE = "-----END CERTIFICATE-----"
+CHAIN_ID_SIZE = 16
+DEFAULT_POOL_MAX_ENTRIES = 100
+
+
 class PrefetchingCache:
-    def __init__(self, options):
+    """
+    pool of prefetched certificates per domain set
+
+    every domain set is a redis list of `<expiration timestamp>:<chain id><der length><der cert>[<der key>]`
+    entries (oldest first). the ca chain of the bundle is stored once under its id and shared by all entries.
+    entries are claimed atomically so each certificate is used only once. all entries get the same lifetime,
+    so the list is ordered by expiration and expired entries are dropped from its head when a new one is added
+    """
+
+    PREFIX = "acme:prefetch:"
+
+    def __init__(self, options, max_entries=DEFAULT_POOL_MAX_ENTRIES, logger=None):
         self.pool = get_redis_pool(options)
         self.expiration = 10 * 60 * 60
+        self.max_entries = max_entries
+        self.logger = logger or logging.getLogger(__name__)
+        self.add_script = None
+        self.claim_script = None
 
     @property
     def redis(self):
         return get_redis_connection(self.pool)
 
-    def set(self, domains, bundle, raw):
-        key = str(domains)
-        value = json.dumps(
-            {
-                "bundle": bundle,
-                "raw": raw,
-            }
-        )
-        self.redis.set(key, value, ex=self.expiration)
-
-    def get(self, domains):
-        key = str(domains)
-        value = self.redis.get(key)
+    @property
+    def stats_key(self):
+        return self.PREFIX + "stats"
+
+    def key(self, domains):
+        return self.PREFIX + domains_key(domains)
+
+    def chain_key(self, chain_id):
+        return self.PREFIX.encode() + b"chain:" + chain_id
+
+    def encode(self, bundle, raw, key=None):
+        """
+        split a certificate into the compact entry and the shared chain
+
+        Returns:
+            tuple: (entry without expiration, chain id, chain)
+        """
+        # the bundle is the certificate followed by the ca chain
+        chain = bundle.partition(END_CERTIFICATE)[2].encode()
+        chain_id = hashlib.blake2b(chain, digest_size=CHAIN_ID_SIZE).digest()
+        cert_der = base64.b64decode(raw)
+        entry = chain_id + struct.pack(">H", len(cert_der)) + cert_der
+        if key:
+            entry += crypto.dump_privatekey(crypto.FILETYPE_ASN1, crypto.load_privatekey(crypto.FILETYPE_PEM, key))
+        return entry, chain_id, chain
+
+    def decode(self, entry, chain):
+        """
+        build certificate data from an entry and its chain
+        """
+        chain_id, entry = entry[:CHAIN_ID_SIZE], entry[CHAIN_ID_SIZE:]
+        (size,) = struct.unpack(">H", entry[:2])
+        cert_der, key_der = entry[2 : 2 + size], entry[2 + size :]
+        cert_pem = convert_byte_to_string(convert_asn1_to_pem(cert_der))
+        value = {
+            "bundle": cert_pem.partition(END_CERTIFICATE)[0] + END_CERTIFICATE + convert_byte_to_string(chain),
+            "raw": convert_byte_to_string(base64.b64encode(cert_der)),
+        }
+        if key_der:
+            private_key = crypto.load_privatekey(crypto.FILETYPE_ASN1, key_der)
+            value["key"] = convert_byte_to_string(crypto.dump_privatekey(crypto.FILETYPE_PEM, private_key))
+        return value
+
+    def add(self, domains, bundle, raw, key=None):
+        """
+        add a certificate to the pool, `key` is the private key if it was generated by the server
+        """
+        entry, chain_id, chain = self.encode(bundle, raw, key)
+        now = int(time.time())
+        if self.add_script is None:
+            self.add_script = self.redis.register_script(ADD_SCRIPT)
+        with self.redis.pipeline() as pipe:
+            pipe.set(self.chain_key(chain_id), chain, ex=self.expiration)
+            # the list lives as long as its latest entry, the oldest ones are dropped beyond max_entries
+            self.add_script(
+                keys=[self.key(domains)],
+                args=[now, f"{now + self.expiration}:".encode() + entry, self.max_entries, self.expiration],
+                client=pipe,
+            )
+            pipe.hincrby(self.stats_key, "refill", 1)
+            pipe.execute()
+
+    def claim(self, domains):
+        """
+        take a certificate out of the pool
+
+        Returns:
+            dict: certificate data or None if the pool is empty
+        """
+        if self.claim_script is None:
+            self.claim_script = self.redis.register_script(CLAIM_SCRIPT)
+        value = self.claim_script(keys=[self.key(domains)], args=[int(time.time())])
         if not value:
-            raise ValueError(f"invalid or expired key for '{key}'")
-        return json.loads(value)
+            self.redis.hincrby(self.stats_key, "miss", 1)
+            return None
+
+        entry = value.split(b":", 1)[1]
+        chain = self.redis.get(self.chain_key(entry[:CHAIN_ID_SIZE]))
+        if chain is None:
+            # the certificate cannot be served without its chain, the caller enrolls a new one
+            self.logger.warning(f"PrefetchingCache.claim(): chain of a prefetched certificate for {sorted(domains)} is missing")
+            self.redis.hincrby(self.stats_key, "stale", 1)
+            return None
+
+        self.redis.hincrby(self.stats_key, "hit", 1)
+        return self.decode(entry, chain)
+
+    def available(self, domains, min_ttl=0):
+        """
+        number of pooled certificates valid for at least `min_ttl` seconds
+        """
+        threshold = time.time() + min_ttl
+        entries = self.redis.lrange(self.key(domains), 0, -1)
+        return sum(1 for entry in entries if int(entry.split(b":", 1)[0]) > threshold)
+
+    def stats(self):
+        """
+        hit, miss, stale (claimed without chain) and refill counters (shared by all processes)
+        """
+        counters = {"hit": 0, "miss": 0, "stale": 0, "refill": 0}
+        for name, value in self.redis.hgetall(self.stats_key).items():
+            counters[convert_byte_to_string(name)] = int(value)
+        return counters
+
+
+# delete the lock and publish the result of this token if the lock is still held with it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    if ARGV[2] ~= '' then
+        redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+    end
+    return 1
+end
+return 0
+"""
+
+# extend the lock if it is still held with this token
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+DEFAULT_LOCK_TTL = 300
+DEFAULT_RESULT_TTL = 60
+
+
+class LockLostError(RuntimeError):
+    pass
+
+
+class Lease:
+    """
+    lock held by the leader of a single-flight, `token` is its fencing token
+    """
+
+    def __init__(self, single_flight, key, token):
+        self.single_flight = single_flight
+        self.key = key
+        self.token = token
+
+    def extend(self):
+        """
+        extend the lock before doing further side effects
+
+        Raises:
+            LockLostError: if the lock expired and may be held by another leader (with a newer token)
+        """
+        if not self.single_flight.extend(self.key, self.token):
+            raise LockLostError(f"enrollment lock (fencing token {self.token}) is lost")
+
+
+class SingleFlight:
+    """
+    run an operation once per domain set across processes and nodes
+
+    the first caller acquires a redis lock and runs the operation, concurrent callers wait for its result.
+    every lock acquisition gets a new fencing token, a leader whose lock expired cannot publish its result.
+    results are stored per token, followers only accept the result of the leader they waited for
+    """
+
+    PREFIX = "acme:enroll:"
+
+    def __init__(self, pool, lock_ttl=DEFAULT_LOCK_TTL, result_ttl=DEFAULT_RESULT_TTL, interval=0.5, logger=None):
+        self.pool = pool
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.release_script = None
+        self.extend_script = None
+
+    @property
+    def redis(self):
+        return get_redis_connection(self.pool)
+
+    def keys(self, key):
+        prefix = self.PREFIX + key
+        return prefix + ":lock", prefix + ":fence"
+
+    def result_key(self, key, token):
+        return f"{self.PREFIX}{key}:result:{token}"
+
+    def extend(self, key, token):
+        if self.extend_script is None:
+            self.extend_script = self.redis.register_script(EXTEND_SCRIPT)
+        lock_key, _ = self.keys(key)
+        return bool(self.extend_script(keys=[lock_key], args=[token, self.lock_ttl * 1000]))
+
+    def release(self, key, token, result=""):
+        if self.release_script is None:
+            self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+        lock_key, _ = self.keys(key)
+        try:
+            return bool(self.release_script(keys=[lock_key, self.result_key(key, token)], args=[token, result, self.result_ttl * 1000]))
+        except RedisError as exc:
+            # the lock expires, followers take over
+            self.logger.error(f"SingleFlight: cannot release lock of {key}: {exc}")
+            return False
+
+    def run(self, domains, func, fingerprint=""):
+        """
+        run func(lease) as leader or wait for the result of the current leader
+
+        Args:
+            domains (iterable of str): domain set
+            func (callable): operation, gets the Lease and returns a json serializable result
+            fingerprint (str): public key fingerprint of the csr, results are only shared for the same key
+
+        Raises:
+            TimeoutError: if the lock of the leader does not expire
+            RedisError: if the lock cannot be acquired (func was not called)
+
+        Returns:
+            result of func
+        """
+        key = domains_key(domains)
+        if fingerprint:
+            key = f"{key}:{fingerprint}"
+        lock_key, fence_key = self.keys(key)
+        # for locks without expiration, otherwise followers wait until the (extended) lock expires
+        deadline = time.monotonic() + self.lock_ttl
+
+        while True:
+            token = str(self.redis.incr(fence_key))
+            if self.redis.set(lock_key, token, nx=True, px=self.lock_ttl * 1000):
+                lease = Lease(self, key, token)
+                try:
+                    result = func(lease)
+                except BaseException:
+                    self.release(key, token)
+                    raise
+                if not self.release(key, token, json.dumps(result)):
+                    self.logger.warning(f"SingleFlight: lock of {key} was lost, result is not shared")
+                return result
+
+            # wait for the leader. the lock is checked before the result: the leader publishes its
+            # result and releases the lock in one step, so a released lock is followed by its result
+            leader = None
+            while True:
+                current = self.redis.get(lock_key)
+                if current is not None:
+                    # first check or another leader took over the expired lock
+                    leader = convert_byte_to_string(current)
+                value = self.redis.get(self.result_key(key, leader)) if leader else None
+                if value is not None:
+                    self.logger.debug(f"SingleFlight: got result of {key} from leader {leader}")
+                    return json.loads(value)
+                if current is None:
+                    # leader failed without a result, try to become leader
+                    break
+                remaining = self.redis.pttl(lock_key)
+                if remaining > 0:
+                    deadline = max(deadline, time.monotonic() + remaining / 1000)
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"timeout while waiting for enrollment of {sorted(domains)}")
+                time.sleep(self.interval)
+
+
+DEFAULT_REFILL_BEFORE = 60 * 60
+DEFAULT_PREFETCH_INTERVAL = 60
+DEFAULT_MAX_CONCURRENT_ISSUANCES = 2
+KEY_SIZE = 2048
+
+
+class PrefetchScheduler:
+    """
+    keep `pool_size` prefetched certificates cached for every expected domain set
+
+    pools are refilled when certificates are claimed or expire within `refill_before` seconds,
+    at most `max_concurrent` certificates are issued at the same time
+    """
+
+    def __init__(
+        self,
+        handler_factory,
+        domain_sets,
+        refill_before=DEFAULT_REFILL_BEFORE,
+        interval=DEFAULT_PREFETCH_INTERVAL,
+        max_concurrent=DEFAULT_MAX_CONCURRENT_ISSUANCES,
+        pool_size=1,
+        key_size=KEY_SIZE,
+        logger=None,
+    ):
+        self.handler_factory = handler_factory
+        self.domain_sets = [canonical_domains(domains) for domains in domain_sets]
+        self.refill_before = refill_before
+        self.interval = interval
+        self.pool_size = pool_size
+        self.key_size = key_size
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        # number of refills in progress per domain set
+        self.in_flight = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        self.refills = 0
+        self.failures = 0
+
+    def run_once(self):
+        """
+        check all domain sets and queue refills of missing or expiring entries
+
+        Returns:
+            int: number of queued refills
+        """
+        handler = self.handler_factory()
+        queued = 0
+        for domains in self.domain_sets:
+            try:
+                available = handler.cache.available(domains, self.refill_before)
+            except Exception as exc:
+                self.logger.error(f"PrefetchScheduler: cannot check cache of {domains}: {exc}")
+                continue
+
+            with self.lock:
+                missing = self.pool_size - available - self.in_flight.get(domains, 0)
+                if missing <= 0:
+                    continue
+                self.in_flight[domains] = self.in_flight.get(domains, 0) + missing
+
+            for _ in range(missing):
+                self.executor.submit(self._refill, domains)
+            queued += missing
+        return queued
+
+    def _refill(self, domains):
+        start = time.monotonic()
+        try:
+            key = make_key(self.key_size)
+            csr = make_csr(key, domains)
+            self.handler_factory().prefetch(domains, base64.b64encode(csr), key=key.decode())
+        except Exception as exc:
+            with self.lock:
+                self.failures += 1
+            self.logger.error(f"PrefetchScheduler: refill of {domains} failed: {exc}")
+        else:
+            with self.lock:
+                self.refills += 1
+            self.logger.info(f"PrefetchScheduler: refilled {domains} in {time.monotonic() - start:.1f}s")
+        finally:
+            with self.lock:
+                self.in_flight[domains] -= 1
+                if not self.in_flight[domains]:
+                    del self.in_flight[domains]
+
+    def run_forever(self):
+        while not self.stopped.is_set():
+            try:
+                self.run_once()
+            except Exception as exc:
+                self.logger.error(f"PrefetchScheduler: {exc}")
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        """
+        run the scheduler in a background thread
+        """
+        self.thread = threading.Thread(target=self.run_forever, name="prefetch-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "domain_sets": len(self.domain_sets),
+                "in_flight": sum(self.in_flight.values()),
+                "refills": self.refills,
+                "failures": self.failures,
+            }
 
 
 class CAhandler(object):
@@ -212,17 +978,37 @@ class CAhandler(object):
         handler_config = config["CAhandler"]
         self.certificate_validity_days = handler_config.get("cert_validity_days")
         self.access_key = handler_config.get("access_key")
+        # maximum number of concurrent dns provider calls per enrollment
+        self.dns_concurrency = handler_config.getint("dns_concurrency", fallback=5)
+        # wait for validation records on the authoritative nameservers before verification (0 disables)
+        self.propagation_timeout = handler_config.getint("propagation_timeout", fallback=DEFAULT_PROPAGATION_TIMEOUT)
+        self.propagation_interval = handler_config.getint(
+            "propagation_interval", fallback=DEFAULT_PROPAGATION_INTERVAL
+        )
+        # reject a certificate that cannot be verified this many seconds after propagation_timeout
+        self.verification_timeout = handler_config.getint(
+            "verification_timeout", fallback=DEFAULT_VERIFICATION_TIMEOUT
+        )
+        # keep-alive connections to the zerossl api, shared by all requests of this process
+        api_timeout = (
+            handler_config.getfloat("api_connect_timeout", fallback=DEFAULT_TIMEOUT[0]),
+            handler_config.getfloat("api_timeout", fallback=DEFAULT_TIMEOUT[1]),
+        )
+        api_session = get_session(handler_config.getint("api_pool_size", fallback=DEFAULT_POOL_SIZE))
 
         self.domains = get_domain_config(config)
         self.dns_options = get_dns_options(config)
-        self.zerossl = ZeroSSL(self.access_key)
+        self.zerossl = ZeroSSL(self.access_key, api_session, api_timeout)
 
         try:
             redis_config = config["redis"]
         except KeyError:
             redis_config = {}
 
-        self.cache = PrefetchingCache(redis_config)
+        self.cache = PrefetchingCache(redis_config, logger=self.logger)
+        # deduplicate concurrent enrollments of the same domain set (0 disables)
+        lock_ttl = handler_config.getint("enrollment_lock_ttl", fallback=DEFAULT_LOCK_TTL)
+        self.single_flight = SingleFlight(self.cache.pool, lock_ttl, logger=self.logger) if lock_ttl else None
 
         client_types = []
         if ClientType.NAMECOM.value in self.dns_options:
@@ -251,159 +1037,306 @@ class CAhandler(object):
 
         return list(names)
 
-    def try_verify_domain(self, cert_id, trials=6):
-        details = {}
+    def try_verify_domain(self, cert_id, trials=6, timeout=DEFAULT_VERIFICATION_TIMEOUT):
+        retry = Retry(initial_delay=2, max_delay=15, timeout=timeout, max_attempts=trials, logger=self.logger)
+        try:
+            # a result without "success" is the cert object (as json)
+            return retry.run(
+                lambda: self.zerossl.certificate.verify(cert_id, ChallengeType.DNS.value),
+                done=lambda result: result.get("success") is not False,
+                name=f"verification of {cert_id}",
+            )
+        except RetryError as exc:
+            # success is set to False, use error details
+            result = exc.last_result or {}
+            raise RuntimeError(str(result.get("details", result.get("error"))))
+
+    def validation_records(self, all_validations):
+        """
+        validation cname records of all domains
+
+        Returns:
+            dict: host -> cname target
+        """
+        return {
+            validations["cname_validation_p1"]: validations["cname_validation_p2"]
+            for validations in all_validations.values()
+        }
+
+    def zone_records(self, records):
+        return {host: (self.dns.verify(host)[2].name, target) for host, target in records.items()}
+
+    def certificate_age(self, cert_data):
+        """
+        seconds since the certificate was created at zerossl, None if unknown
+        """
+        try:
+            created = datetime.datetime.strptime(cert_data["created"], "%Y-%m-%d %H:%M:%S")
+        except (KeyError, TypeError, ValueError):
+            return None
+        return (datetime.datetime.utcnow() - created).total_seconds()
+
+    def validate(self, cert_id, cert_data):
+        """
+        submit the verification of a draft certificate once its validation records are visible
+
+        does a single propagation check and a single verification request, `poll` calls it again until
+        the verification is submitted. records are not waited for after `propagation_timeout` and the
+        certificate is rejected if it cannot be verified within `verification_timeout` after that
+
+        Returns:
+            tuple: (error, rejected)
+        """
+        all_validations = cert_data.get("validation", {}).get("other_methods", {})
+        age = self.certificate_age(cert_data)
+        if self.propagation_timeout and age is not None and age < self.propagation_timeout:
+            checker = PropagationChecker(logger=self.logger)
+            zone_records = self.zone_records(self.validation_records(all_validations))
+            visible = checker.check(zone_records)
+            # records of zones without known nameservers cannot be checked
+            pending = sorted(
+                host for host, (zone, _) in zone_records.items() if host not in visible and checker.nameservers(zone)
+            )
+            if pending:
+                return f"validation records of certificate {cert_id} are not propagated yet: {', '.join(pending)}", False
+            self.logger.info(f"CAhandler: validation records of {cert_id} propagated after {age:.0f}s")
 
-        while trials:
+        try:
             result = self.zerossl.certificate.verify(cert_id, ChallengeType.DNS.value)
-            if "success" in result:
-                success = result["success"]
-                if not success:
-                    # success is set to False, set error details value
-                    if "details" in result:
-                        details = result["details"]
-                    else:
-                        details = result["error"]
-
-                    trials -= 1
+        except requests.RequestException as exc:
+            return f"error while verifying certificate {cert_id}: {exc}", False
+
+        if result.get("success") is False:
+            details = result.get("details", result.get("error"))
+            if age is not None and age > self.propagation_timeout + self.verification_timeout:
+                self.delete_validation_records(all_validations)
+                return f"could not verify the challenge for one of the domains: {details}", True
+            return f"certificate {cert_id} is not verified yet: {details}", False
+
+        return f"certificate {cert_id} is not issued yet (verification submitted)", False
+
+    def wait_for_propagation(self, records):
+        """
+        wait until the validation records are visible on the authoritative nameservers
+
+        verification is started anyway after `propagation_timeout`, zerossl may still see them
+
+        Args:
+            records (dict): host -> cname target
+        """
+        checker = PropagationChecker(logger=self.logger)
+        delays = checker.wait(self.zone_records(records), self.propagation_timeout, self.propagation_interval)
+        for host, delay in delays.items():
+            if delay is None:
+                self.logger.warning(f"CAhandler: {host} not propagated after {self.propagation_timeout}s")
             else:
-                # return result, the cert object (as json)
-                return result
-
-        raise RuntimeError(str(details))
+                self.logger.info(f"CAhandler: {host} propagated after {delay:.1f}s")
+        return delays
+
+    def poll_until_issued(self, cert_id, timeout=180, delay=1, max_delay=10):
+        retry = Retry(initial_delay=delay, max_delay=max_delay, factor=1.5, timeout=timeout, logger=self.logger)
+        return retry.run(
+            lambda: self.zerossl.certificate.get(cert_id),
+            done=lambda cert_data: CertificateStatus(cert_data["status"])
+            in [CertificateStatus.issued, CertificateStatus.expiring_soon],
+            name=f"certificate {cert_id} to be issued",
+        )
 
-    def poll_until_issued(self, cert_id, timeout=180, delay=0.2):
-        time_start = time.time()
+    def delete_validation_records(self, all_validations):
+        """
+        remove validation cname records of all domains
 
-        while time.time() - time_start < timeout:
-            cert_data = self.zerossl.certificate.get(cert_id)
-            status = CertificateStatus(cert_data["status"])
-            if status in [CertificateStatus.issued, CertificateStatus.expiring_soon]:
-                return cert_data
-            time.sleep(delay)
+        Args:
+            all_validations (dict): validation data per domain as returned by zerossl
 
-        raise TimeoutError(f"timeout ({timeout}s) while waiting for certificate to be issued")
+        Returns:
+            str: error message or None
+        """
+        hosts = [validations["cname_validation_p1"] for validations in all_validations.values()]
+        try:
+            self.dns.delete_cname_records(hosts, self.dns_concurrency)
+        except RecordsError as exc:
+            self.logger.error(f"CAhandler.delete_validation_records() failed: {exc}")
+            return f"error while dns records cleanup: {exc}"
 
     def get_prefetched(self, domains):
-        domains = tuple(sorted(domains))
         try:
-            return self.cache.get(domains)
-        except ValueError:
-            pass
-
-    def enroll(self, csr):
-        """enroll certificate"""
-        self.logger.debug("CAhandler.enroll()")
-
-        error = None
-        cert_bundle = None
-        cert_raw = None
-
+            return self.cache.claim(domains)
+        except RedisError as exc:
+            # enroll without the cache
+            self.logger.error(f"CAhandler.get_prefetched() failed: {exc}")
+
+    def download(self, cert_id):
+        """
+        download an issued certificate
+
+        Returns:
+            tuple: (cert_bundle, cert_raw)
+        """
+        result = self.zerossl.certificate.download_inline(cert_id)
+        # in PEM format
+        cert_bundle = result["ca_bundle.crt"]
+        cert_pem = result["certificate.crt"]
+        # tbh, don't know why to repeat, but chaining only cert_pem + bundle didn't work
+        # with certbot as a client, it fails with:
+        # "failed to parse fullchain into cert and chain: less than 2 certificates in chain"
+        cert_bundle = "\n".join([cert_pem, cert_bundle, cert_bundle])
+        # cert as OpenSSL.crypto.X509
+        cert = crypto.X509.from_cryptography(load_pem_x509_certificate(convert_string_to_byte(cert_pem)))
+        # convert to raw cert as needed by caller
+        cert_raw = convert_byte_to_string(base64.b64encode(crypto.dump_certificate(crypto.FILETYPE_ASN1, cert)))
+        return cert_bundle, cert_raw
+
+    def submit(self, csr, use_prefetched=True, single_flight=True):
+        """
+        create the certificate and register dns records
+
+        the verification is submitted and validation records are kept until the certificate is issued (see `poll`)
+
+        Args:
+            csr (str): base64 encoded csr
+            use_prefetched (bool): return a prefetched certificate if available
+            single_flight (bool): share the result with concurrent enrollments of the same domain set
+
+        Returns:
+            tuple: (error, cert_bundle, cert_raw, cert_id), cert bundle/raw are only set for prefetched certificates
+        """
         # get domains from csr and verify they're configured and we can create dns records for them
         domains = self.get_domain_names(csr)
         for domain in domains:
             try:
                 self.dns.verify(domain)
             except DnsConfigError as config_error:
-                return (
-                    f"configuration error: {config_error}",
-                    cert_bundle,
-                    cert_raw,
-                    None,
-                )
+                return f"configuration error: {config_error}", None, None, None
 
-        prefetched = self.get_prefetched(domains)
+        prefetched = self.get_prefetched(domains) if use_prefetched else None
         if prefetched:
-            bundle, raw = prefetched["bundle"], prefetched["raw"]
-            return error, bundle, raw, None
+            return None, prefetched["bundle"], prefetched["raw"], None
+
+        if single_flight and self.single_flight:
+            try:
+                # a shared result is only usable by requests for the same key
+                fingerprint = csr_fingerprint_get(self.logger, csr)
+                return tuple(
+                    self.single_flight.run(domains, lambda lease: self.issue(domains, csr, lease), fingerprint)
+                )
+            except TimeoutError as exc:
+                return str(exc), None, None, None
+            except RedisError as exc:
+                # enroll without deduplication
+                self.logger.error(f"CAhandler.submit() cannot acquire enrollment lock: {exc}")
+
+        return self.issue(domains, csr)
+
+    def issue(self, domains, csr, lease=None):
+        """
+        create the certificate and register dns records
+
+        Args:
+            domains (list): domains of the csr
+            csr (str): base64 encoded csr
+            lease (Lease, optional): enrollment lock, checked before dns records are changed
+
+        Returns:
+            tuple: (error, None, None, cert_id)
+        """
+        error = None
 
         # create certificate (csr must be 2048-bit encrypted)
         try:
             cert_data = self.zerossl.certificate.create(domains, csr, self.certificate_validity_days)
         except requests.HTTPError as http_error:
-            error = f"error while creating certificate {http_error}"
+            return f"error while creating certificate {http_error}", None, None, None
 
-        if not error:
-            if cert_data.get("success") is False:
-                error = cert_data["error"]
+        if cert_data.get("success") is False:
+            return cert_data["error"], None, None, None
 
         # now we have certificate id and dns challenge data
-        if not error:
-            cert_id = cert_data["id"]
-            # TODO: more status logic need to be handled, e.g. renewal?
-            status = CertificateStatus(cert_data["status"])
-            if status in [CertificateStatus.draft, CertificateStatus.expired]:
-                # try to validate
-                all_validations = cert_data["validation"]["other_methods"]
-                for domain, validations in all_validations.items():
-                    # put dns records
-                    try:
-                        host, points_to = (
-                            validations["cname_validation_p1"],
-                            validations["cname_validation_p2"],
-                        )
-                        self.dns.create_cname_record(host, points_to)
-                    except Exception as exc:
-                        error = f"error while registering dns records '{host} -> {points_to}' for {domain}: {exc}"
-
-                if not error:
-                    # try verify the challenge
-                    try:
-                        self.try_verify_domain(cert_id)
-                    except Exception as exc:
-                        error = f"could not verify the challenge for one of the domains: {exc}"
-
-            if not error:
-                # now poll on the certificated until status change
-                try:
-                    self.poll_until_issued(cert_id)
-                except TimeoutError as timeout_error:
-                    error = timeout_error
-                finally:
-                    # cleanup cname records if ok
-                    for domain, validations in all_validations.items():
-                        try:
-                            self.dns.delete_cname_record(validations["cname_validation_p1"])
-                        except Exception as exc:
-                            error = f"error while dns records cleanup for {domain}: {exc}"
-
-                if not error:
-                    # download the cert and return it as following
-                    result = self.zerossl.certificate.download_inline(cert_id)
-                    # in PEM format
-                    cert_bundle = result["ca_bundle.crt"]
-                    cert_pem = result["certificate.crt"]
-                    # tbh, don't know why to repeat, but chaining only cert_pem + bundle didn't work
-                    # with certbot as a client, it fails with:
-                    # "failed to parse fullchain into cert and chain: less than 2 certificates in chain"
-                    cert_bundle = "\n".join([cert_pem, cert_bundle, cert_bundle])
-                    # cert as OpenSSL.crypto.X509
-                    cert = crypto.X509.from_cryptography(load_pem_x509_certificate(convert_string_to_byte(cert_pem)))
-                    # convert to raw cert as needed by caller
-                    cert_raw = convert_byte_to_string(
-                        base64.b64encode(crypto.dump_certificate(crypto.FILETYPE_ASN1, cert))
-                    )
-
-        return (error, cert_bundle, cert_raw, None)
-
-    def prefetch(self, domains, csr):
-        error, bundle, raw, _ = self.enroll(csr)
+        cert_id = cert_data["id"]
+        # TODO: more status logic need to be handled, e.g. renewal?
+        status = CertificateStatus(cert_data["status"])
+        if status in [CertificateStatus.draft, CertificateStatus.expired]:
+            # try to validate
+            # put dns records (all or none of them)
+            records = self.validation_records(cert_data["validation"]["other_methods"])
+            try:
+                if lease:
+                    lease.extend()
+                self.dns.create_cname_records(records, self.dns_concurrency)
+            except (LockLostError, RecordsError) as exc:
+                return f"error while registering dns records: {exc}", None, None, None
+
+        # propagation and verification are done by `poll` (or `prefetch`), not within the acme request
+        return None, None, None, cert_id
+
+    def enroll(self, csr):
+        """enroll certificate, returns the zerossl certificate id as poll identifier once verification is submitted"""
+        self.logger.debug("CAhandler.enroll()")
+
+        error, cert_bundle, cert_raw, poll_identifier = self.submit(csr)
+
+        self.logger.debug(f"CAhandler.enroll() zerossl api: {self.zerossl.stats()}")
+        self.logger.debug(f"CAhandler.enroll() ended with: {error}, poll identifier: {poll_identifier}")
+        return (error, cert_bundle, cert_raw, poll_identifier)
+
+    def prefetch(self, domains, csr, key=None):
+        error, bundle, raw, cert_id = self.submit(csr, use_prefetched=False, single_flight=False)
+        if error is None and cert_id:
+            # prefetching runs outside of acme requests, wait for propagation, verification and the certificate
+            all_validations = {}
+            try:
+                all_validations = self.zerossl.certificate.get(cert_id)["validation"]["other_methods"]
+                if self.propagation_timeout:
+                    self.wait_for_propagation(self.validation_records(all_validations))
+                self.try_verify_domain(cert_id)
+                self.poll_until_issued(cert_id)
+                bundle, raw = self.download(cert_id)
+            except (TimeoutError, RuntimeError, requests.RequestException, KeyError) as exc:
+                error = f"error while waiting for certificate {cert_id}: {exc}"
+            self.delete_validation_records(all_validations)
+
         if error is None:
-            domains = tuple(sorted(domains))
-            self.cache.set(domains, bundle, raw)
+            self.cache.add(domains, bundle, raw, key)
             return bundle, raw
         raise RuntimeError(error)
 
     def poll(self, _cert_name, poll_identifier, _csr):
         """poll status of pending CSR and download certificates"""
-        self.logger.debug("CAhandler.poll()")
+        self.logger.debug(f"CAhandler.poll({poll_identifier})")
 
-        error = "Method not implemented."
+        error = None
         cert_bundle = None
         cert_raw = None
         rejected = False
 
-        self.logger.debug("CAhandler.poll() ended")
+        try:
+            cert_data = self.zerossl.certificate.get(poll_identifier)
+            status = CertificateStatus(cert_data["status"])
+        except (requests.RequestException, KeyError, ValueError) as exc:
+            # transient or unexpected, keep polling
+            cert_data = None
+            error = f"error while getting certificate status: {exc}"
+
+        if cert_data:
+            all_validations = cert_data.get("validation", {}).get("other_methods", {})
+            if status in [CertificateStatus.issued, CertificateStatus.expiring_soon]:
+                try:
+                    cert_bundle, cert_raw = self.download(poll_identifier)
+                except requests.RequestException as exc:
+                    error = f"error while downloading certificate: {exc}"
+                else:
+                    # the certificate is issued, a failed cleanup is not an enrollment error
+                    self.delete_validation_records(all_validations)
+            elif status in [CertificateStatus.cancelled, CertificateStatus.expired]:
+                error = f"certificate {poll_identifier} has been {status.value}"
+                rejected = True
+                self.delete_validation_records(all_validations)
+            elif status == CertificateStatus.draft:
+                error, rejected = self.validate(poll_identifier, cert_data)
+            else:
+                error = f"certificate {poll_identifier} is not issued yet (status: {status.value})"
+
+        self.logger.debug(f"CAhandler.poll() ended with: {error}")
         return (error, cert_bundle, cert_raw, poll_identifier, rejected)
 
     def revoke(self, cert, rev_reason="unspecified", rev_date=None):